@@ -1,31 +1,112 @@
 """
 This module handles Deep AI API management.
 """
+import asyncio
 import os
+import time
 from io import BytesIO
+from typing import Awaitable, Callable, Optional, TypeVar, Union
 
 import httpx
 from PIL import Image
 
+from api.http_client import HttpClient
+from api.resilience import CircuitBreaker, LatencyTracker, backoff_delay, hedged
 from common.common import BaseClass
 from common.exceptions import DeepAIAPIError
 
+T = TypeVar('T')
+
 
 class DeepAIAPI(BaseClass):
-    """This class handles all requests to the Deep AI API"""
+    """
+    This class handles all requests to the Deep AI API
+
+    DEEPAI_GRID_SIZE environment variable sets the grid of candidate images generated by one call
+    of generate_images (e.g. 2 means 2x2 grid, 4 candidates)
+
+    Calls are made resilient according to the environment variables:
+    - DEEPAI_GENERATE_TIMEOUT and DEEPAI_DOWNLOAD_TIMEOUT: seconds each phase of the call may take
+    - DEEPAI_MAX_ATTEMPTS and DEEPAI_RETRY_BASE_DELAY: attempts of each phase and base of their
+      jittered exponential backoff, only failures after which repeating the request is safe are
+      retried
+    - DEEPAI_HEDGING: 'true' to send the second generate request if the first one is slower than p95
+    - DEEPAI_BREAKER_FAILURES and DEEPAI_BREAKER_RESET_SECONDS: consecutive failed calls after which
+      calls fail fast and for how long
+    """
     # Deep AI API configuration
     DEEP_AI_URL = "https://api.deepai.org/api/text2img" # Deep AI API
     DEEP_AI_API_TIMEOUT = 60.0 # Timeout setting for Deep AI API
+    DEFAULT_GRID_SIZE = 1
+    IMAGE_SIZE = 512  # Side of generated image and of every candidate cropped from the grid
+    DEFAULT_DOWNLOAD_TIMEOUT = 15.0
+    DEFAULT_MAX_ATTEMPTS = 3
+    DEFAULT_RETRY_BASE_DELAY = 0.5
+    MAXIMUM_RETRY_DELAY = 8.0
+    DEFAULT_BREAKER_FAILURES = 5
+    DEFAULT_BREAKER_RESET_SECONDS = 30.0
+    HEDGING_PERCENTILE = 95
+    # number of successful generate requests needed to estimate the percentile
+    HEDGING_MINIMUM_SAMPLES = 20
+    LATENCY_HISTORY_SIZE = 200
+    # responses after which the request surely wasn't served, so it's repeated without paying twice
+    RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
 
-    def __init__(self):
+    def __init__(self, http_client: HttpClient):
+        super().__init__()
         self.api_key = os.environ['DEEPAI_API_TOKEN']
+        self.http_client = http_client
+        self.grid_size = int(os.environ.get('DEEPAI_GRID_SIZE', self.DEFAULT_GRID_SIZE))
+        self.generate_timeout = float(
+            os.environ.get('DEEPAI_GENERATE_TIMEOUT', self.DEEP_AI_API_TIMEOUT)
+        )
+        self.download_timeout = float(
+            os.environ.get('DEEPAI_DOWNLOAD_TIMEOUT', self.DEFAULT_DOWNLOAD_TIMEOUT)
+        )
+        self.max_attempts = int(os.environ.get('DEEPAI_MAX_ATTEMPTS', self.DEFAULT_MAX_ATTEMPTS))
+        self.retry_base_delay = float(
+            os.environ.get('DEEPAI_RETRY_BASE_DELAY', self.DEFAULT_RETRY_BASE_DELAY)
+        )
+        self.hedging = os.environ.get('DEEPAI_HEDGING', 'false').lower() == 'true'
+        self.circuit_breaker = CircuitBreaker(
+            "Deep AI API",
+            int(os.environ.get('DEEPAI_BREAKER_FAILURES', self.DEFAULT_BREAKER_FAILURES)),
+            float(
+                os.environ.get('DEEPAI_BREAKER_RESET_SECONDS', self.DEFAULT_BREAKER_RESET_SECONDS)
+            )
+        )
+        # latencies of successful generate requests, the hedging delay is derived from them
+        self.generate_latencies = LatencyTracker(
+            self.LATENCY_HISTORY_SIZE, self.HEDGING_MINIMUM_SAMPLES
+        )
+        # number of retried requests and of hedged requests sent
+        self.retries = 0
+        self.hedged_requests = 0
+
+    def stats(self) -> dict[str, Union[int, str]]:
+        """Returns numbers of retried and hedged requests and the state of the circuit breaker"""
+        return {
+            "retries": self.retries,
+            "hedged requests": self.hedged_requests,
+            "circuit breaker": self.circuit_breaker.state,
+        }
 
     async def generate_image(self, prompt: str) -> Image:
         """Generates an image from english prompt using Google translate API
-        
+
         Throws AssertionError if the request doesn't comply with API restrictions
         Throws DeepAIAPIError if there were problems during Deep AI API execution
         """
+        return (await self.generate_images(prompt, 1))[0]
+
+    async def generate_images(self, prompt: str, grid_size: int = None) -> list[Image.Image]:
+        """Generates grid of candidate images from english prompt in one call, returns them row by
+        row
+
+        Throws AssertionError if the request doesn't comply with API restrictions
+        Throws DeepAIAPIError if there were problems during Deep AI API execution
+        """
+        grid_size = grid_size or self.grid_size
 
         # all charaters in the prompt should be ascii characters
         assert (
@@ -37,71 +118,150 @@ class DeepAIAPI(BaseClass):
         # pylint: disable=fixme
         # TODO: add pricing statistics every 500 calls per month for $5
 
-        # Try invoking Deep AI API
-        try:
-            response = await self.__invoke_generate_image_api(prompt)
-            response.raise_for_status()
-        # Handle exceptions
-        except httpx.TimeoutException as e:
-            raise DeepAIAPIError(
-                "Timeout occurred while invoking Deep AI API", "generate-timeout", str(e)) from e
-        except httpx.NetworkError as e:
-            raise DeepAIAPIError(
-                "Failed to establish connection with Deep AI API", "generate-network", str(e)
-            ) from e
-        except Exception as e:
+        if not self.circuit_breaker.allow():
             raise DeepAIAPIError(
-                "Unexpected error occurred while invoking Deep AI API", "generate-other", str(e)
-            ) from e
+                "Deep AI API is failing, the call was not made", "circuit-open",
+                f"{self.circuit_breaker.failures} consecutive failures"
+            )
+        try:
+            # Invoke Deep AI API and fetch the link to the generated image
+            image_url = await self.__with_retries(
+                "generate", lambda: self.__generate_hedged(prompt, grid_size)
+            )
+            # Download the generated image
+            image_content = await self.__with_retries(
+                "download", lambda: self.__download(image_url)
+            )
+        except DeepAIAPIError:
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
 
-        # Fetch the link to the generated image
-        image_url = response.json()['output_url']
+        # Convert donwloaded image to bytes
+        image = Image.open(BytesIO(image_content))
+        if grid_size == 1:
+            return [image]
 
-        # Try downloading the generated image
-        try:
-            image = await self.__invoke_download_image_api(image_url)
-            image.raise_for_status()
-        # Handle exceptions
-        except httpx.TimeoutException as e:
-            raise DeepAIAPIError(
+        # candidates are tiled into one image of the grid, each is scaled back to the sticker size
+        width = image.width // grid_size
+        height = image.height // grid_size
+        return [
+            image.crop(
+                (column * width, row * height, (column + 1) * width, (row + 1) * height)
+            ).resize((self.IMAGE_SIZE, self.IMAGE_SIZE), Image.Resampling.LANCZOS)
+            for row in range(grid_size)
+            for column in range(grid_size)
+        ]
+
+    async def __with_retries(self, phase: str, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Invokes the call of the phase ('generate' or 'download'), retrying failures that are safe
+        to retry
+        """
+        attempt = 1
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.__is_retryable(phase, e):
+                    raise self.__to_api_error(phase, e) from e
+                delay = backoff_delay(attempt, self.retry_base_delay, self.MAXIMUM_RETRY_DELAY)
+                self.logger.warning(
+                    "Deep AI API %s attempt %d failed, retrying in %.1f s: %r",
+                    phase, attempt, delay, e
+                )
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def __is_retryable(self, phase: str, e: Exception) -> bool:
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code in self.RETRYABLE_STATUS_CODES
+        # the request never reached the server
+        if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        # downloading is idempotent, while generation that timed out could still be charged for
+        return phase == "download" and isinstance(e, (httpx.TimeoutException, httpx.NetworkError))
+
+    def __to_api_error(self, phase: str, e: Exception) -> DeepAIAPIError:
+        if phase == "generate":
+            if isinstance(e, httpx.TimeoutException):
+                return DeepAIAPIError(
+                    "Timeout occurred while invoking Deep AI API", "generate-timeout", str(e)
+                )
+            if isinstance(e, httpx.NetworkError):
+                return DeepAIAPIError(
+                    "Failed to establish connection with Deep AI API", "generate-network", str(e)
+                )
+            return DeepAIAPIError(
+                "Unexpected error occurred while invoking Deep AI API", "generate-other", str(e)
+            )
+        if isinstance(e, httpx.TimeoutException):
+            return DeepAIAPIError(
                 "Timeout occurred while fetching generated image from Deep AI API",
                 "download-timeout",
                 str(e)
-            ) from e
-        except httpx.NetworkError as e:
-            raise DeepAIAPIError(
+            )
+        if isinstance(e, httpx.NetworkError):
+            return DeepAIAPIError(
                 "Failed to establish connection with Deep AI API while fetching generated image",
                 "download-network",
                 str(e)
-            ) from e
-        except Exception as e:
-            raise DeepAIAPIError(
-                "Unexpected error occurred while invoking Deep AI API while fetching generated image",
-                "download-other",
-                str(e)
-            ) from e
+            )
+        return DeepAIAPIError(
+            "Unexpected error occurred while invoking Deep AI API while fetching generated image",
+            "download-other",
+            str(e)
+        )
 
-        # Convert donwloaded image to bytes
-        image = Image.open(BytesIO(image.content))
-        return image
+    async def __generate_hedged(self, prompt: str, grid_size: int) -> str:
+        """Requests generation, requesting it once more if the first request is slower than usual"""
+        if not self.hedging:
+            return await self.__generate(prompt, grid_size)
+
+        requests = 0
+        async def generate() -> str:
+            nonlocal requests
+            requests += 1
+            if requests > 1:
+                self.hedged_requests += 1
+                self.logger.info("Deep AI API generate request is slow, sending a hedged one")
+            return await self.__generate(prompt, grid_size)
+        return await hedged(generate, self.__hedging_delay())
 
-    async def __invoke_generate_image_api(self, prompt: str) -> httpx.Response:
+    def __hedging_delay(self) -> Optional[float]:
+        return self.generate_latencies.percentile(self.HEDGING_PERCENTILE)
+
+    async def __generate(self, prompt: str, grid_size: int) -> str:
+        """Requests generation, returns the link to the generated image"""
+        start = time.monotonic()
+        response = await self.__invoke_generate_image_api(prompt, grid_size)
+        response.raise_for_status()
+        image_url = response.json()['output_url']
+        self.generate_latencies.add(time.monotonic() - start)
+        return image_url
+
+    async def __download(self, image_url: str) -> bytes:
+        """Downloads the generated image"""
+        response = await self.__invoke_download_image_api(image_url)
+        response.raise_for_status()
+        return response.content
+
+    async def __invoke_generate_image_api(self, prompt: str, grid_size: int) -> httpx.Response:
         """Wraper around Deep AI API"""
-        async with httpx.AsyncClient() as client:
-            return await client.post(
-                self.DEEP_AI_URL,
-                data = {
-                    'text': prompt,
-                    'image_generator_version': 'hd',
-                    'width': '512',
-                    'height': '512',
-                    'grid_size': '1', 
-                },
-                headers={'api-key': self.api_key},
-                timeout=60.0
-            )
+        return await self.http_client.post(
+            self.DEEP_AI_URL,
+            data = {
+                'text': prompt,
+                'image_generator_version': 'hd',
+                'width': str(self.IMAGE_SIZE),
+                'height': str(self.IMAGE_SIZE),
+                'grid_size': str(grid_size),
+            },
+            headers={'api-key': self.api_key},
+            timeout=self.generate_timeout
+        )
 
     async def __invoke_download_image_api(self, image_url: str) -> httpx.Response:
         """Wrapper around call to fetch image from url"""
-        async with httpx.AsyncClient() as client:
-            return await client.get(image_url)
+        return await self.http_client.get(image_url, timeout=self.download_timeout)
@@ -0,0 +1,120 @@
+"""
+This module handles HTTP connections shared by all external APIs
+"""
+import os
+from collections import defaultdict
+from typing import Any
+
+import httpx
+
+from common.common import BaseClass
+
+
+class HttpClient(BaseClass):
+    """
+    Class that keeps one long-lived connection pool per host, so requests to the same API reuse
+    kept-alive connections instead of paying for TCP and TLS handshakes every time.
+
+    Pools are configured by the environment variables:
+    - HTTP_MAX_CONNECTIONS_PER_HOST: maximum number of open connections to one host
+    - HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST: maximum number of idle connections kept to one host
+    - HTTP_KEEPALIVE_EXPIRY: seconds an idle connection is kept alive
+    - HTTP_CONNECT_TIMEOUT and HTTP_POOL_TIMEOUT: seconds to establish connection or to wait for
+      a free one
+    - HTTP2: 'true' to negotiate HTTP/2 where supported (requires `h2` package)
+    """
+    DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS_PER_HOST = 5
+    DEFAULT_KEEPALIVE_EXPIRY = 60.0
+    DEFAULT_CONNECT_TIMEOUT = 5.0
+    DEFAULT_POOL_TIMEOUT = 10.0
+    DEFAULT_TIMEOUT = 30.0  # Timeout of reading and writing, unless specified for the request
+
+    def __init__(self):
+        super().__init__()
+        self.limits = httpx.Limits(
+            max_connections=int(os.environ.get(
+                'HTTP_MAX_CONNECTIONS_PER_HOST', self.DEFAULT_MAX_CONNECTIONS_PER_HOST
+            )),
+            max_keepalive_connections=int(os.environ.get(
+                'HTTP_MAX_KEEPALIVE_CONNECTIONS_PER_HOST',
+                self.DEFAULT_MAX_KEEPALIVE_CONNECTIONS_PER_HOST
+            )),
+            keepalive_expiry=float(
+                os.environ.get('HTTP_KEEPALIVE_EXPIRY', self.DEFAULT_KEEPALIVE_EXPIRY)
+            )
+        )
+        self.connect_timeout = float(
+            os.environ.get('HTTP_CONNECT_TIMEOUT', self.DEFAULT_CONNECT_TIMEOUT)
+        )
+        self.pool_timeout = float(os.environ.get('HTTP_POOL_TIMEOUT', self.DEFAULT_POOL_TIMEOUT))
+        self.http2 = os.environ.get('HTTP2', 'false').lower() == 'true'
+        if self.http2:
+            try:
+                # pylint: disable=import-outside-toplevel,unused-import
+                import h2  # noqa: F401
+            except ImportError:
+                self.logger.warning(
+                    "HTTP/2 was requested, but `h2` package is not installed, using HTTP/1.1"
+                )
+                self.http2 = False
+
+        # clients by host, each one has its own connection pool
+        self.__clients: dict[str, httpx.AsyncClient] = {}
+        # number of requests and of newly established connections by host
+        self.__requests = defaultdict(int)
+        self.__connections = defaultdict(int)
+
+    async def request(
+        self, method: str, url: str, timeout: float = None, **kwargs: Any
+    ) -> httpx.Response:
+        """Sends request with a pooled connection to the host of the url"""
+        host = httpx.URL(url).host
+        client = self.__clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits, http2=self.http2)
+            self.__clients[host] = client
+
+        async def trace(event_name: str, _: dict) -> None:
+            # only fired when there is no idle connection to reuse
+            if event_name == "connection.connect_tcp.complete":
+                self.__connections[host] += 1
+
+        self.__requests[host] += 1
+        return await client.request(
+            method,
+            url,
+            timeout=httpx.Timeout(
+                timeout or self.DEFAULT_TIMEOUT,
+                connect=self.connect_timeout,
+                pool=self.pool_timeout
+            ),
+            extensions={"trace": trace},
+            **kwargs
+        )
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends GET request with a pooled connection"""
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends POST request with a pooled connection"""
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Returns number of requests, established connections and reused connections by host"""
+        return {
+            host: {
+                "requests": requests,
+                "connections": self.__connections[host],
+                "reused": requests - self.__connections[host],
+            }
+            for (host, requests) in self.__requests.items()
+        }
+
+    async def close(self) -> None:
+        """Closes all pooled connections"""
+        self.logger.info("Closing HTTP connections, connection reuse: %s", self.stats())
+        for client in self.__clients.values():
+            await client.aclose()
+        self.__clients.clear()
@@ -0,0 +1,125 @@
+"""
+This module handles resilience of calls to external APIs: retries, hedged requests and circuit
+breaking
+"""
+import asyncio
+from collections import deque
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from common.common import BaseClass
+
+T = TypeVar('T')
+
+
+def backoff_delay(attempt: int, base_delay: float, maximum_delay: float) -> float:
+    """Returns jittered exponential delay before the retry following the attempt (from 1)"""
+    # full jitter, so retries of concurrent callers don't arrive at the same time
+    return random.uniform(0, min(maximum_delay, base_delay * 2 ** (attempt - 1)))
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: Optional[float]) -> T:
+    """
+    Invokes the call and, if it hasn't finished within delay seconds, invokes it once again.
+    Returns the result of the first successful one and cancels the other. Without delay, no hedging
+    is done
+    """
+    tasks = {asyncio.ensure_future(call())}
+    try:
+        if delay is not None:
+            (done, _) = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tasks.add(asyncio.ensure_future(call()))
+        error = None
+        while tasks:
+            (done, tasks) = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class LatencyTracker:
+    """Keeps latest latencies of successful calls to estimate their percentiles"""
+    def __init__(self, history_size: int, minimum_samples: int):
+        self.minimum_samples = minimum_samples
+        self.__latencies = deque(maxlen=history_size)
+
+    def add(self, latency: float) -> None:
+        """Adds latency of a successful call in seconds"""
+        self.__latencies.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Returns the percentile of latest latencies, None if there are not enough of them yet"""
+        if len(self.__latencies) < self.minimum_samples:
+            return None
+        latencies = sorted(self.__latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+
+class CircuitBreaker(BaseClass):
+    """
+    Fails calls fast while the API is down.
+
+    After failure_threshold consecutive failures the circuit opens and calls are not allowed for
+    reset_timeout seconds. Then the circuit is half-open: one trial call is allowed (another one
+    only if it didn't complete within reset_timeout), its success closes the circuit and its failure
+    opens it again
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        super().__init__()
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0  # Number of consecutive failures
+        self.__opened_at: Optional[float] = None
+        self.__trial_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        """Returns 'closed', 'open' or 'half-open'"""
+        if self.__opened_at is None:
+            return "closed"
+        if time.monotonic() - self.__opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """Returns True if the call is allowed, every allowed call must be followed by record_*"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open":
+            now = time.monotonic()
+            trial_expired = (
+                self.__trial_started_at is None
+                or now - self.__trial_started_at >= self.reset_timeout
+            )
+            if trial_expired:
+                self.__trial_started_at = now
+                return True
+        return False
+
+    def record_success(self) -> None:
+        """Records successful call, closing the circuit"""
+        if self.__opened_at is not None:
+            self.logger.info("Circuit of %s is closed again", self.name)
+        self.failures = 0
+        self.__opened_at = None
+        self.__trial_started_at = None
+
+    def record_failure(self) -> None:
+        """Records failed call, opening the circuit once there are too many of them"""
+        self.failures += 1
+        self.__trial_started_at = None
+        if self.__opened_at is not None or self.failures >= self.failure_threshold:
+            self.__opened_at = time.monotonic()
+            self.logger.warning(
+                "Circuit of %s is open after %d consecutive failures, failing fast for %.0f s",
+                self.name, self.failures, self.reset_timeout
+            )
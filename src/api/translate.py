@@ -1,22 +1,72 @@
 """
 This module handles Google Translate API management.
 """
+import asyncio
+from collections import Counter
 import re
 import os
+import time
+from typing import Optional
+
 import httpx
 
+from api.http_client import HttpClient
+from common.cache import LRUCache
 from common.common import BaseClass
 from common.exceptions import GoogleAPIError
+from storage.postgres import PostgresDatabase
+
+
+def normalize_text(text: str) -> str:
+    """Returns text in the form used as a key of translation cache"""
+    return ' '.join(text.lower().split())
 
 
 class GoogleTranslateAPI(BaseClass):
-    """This class handles all requests to the Google Translate API"""
+    """
+    This class handles all requests to the Google Translate API
+
+    Texts translated concurrently are collected during a short window
+    (GOOGLE_TRANSLATE_BATCH_WINDOW_MS environment variable, 0 disables batching) and sent in one
+    request of up to 128 strings
+
+    Translations reused from memory are counted in the database in batches of HITS_FLUSH_SIZE hits
+    (or older than HITS_FLUSH_INTERVAL_SECONDS)
+    """
     GOOGLE_TRANSLATE_URL = "https://translation.googleapis.com/language/translate/v2"
     GOOGLE_TRANSLATE_API_MAXIMUM_STRINGS = 128
     GOOGLE_TRANSLATE_API_TIMEOUT = 60.0
+    TRANSLATION_CACHE_SIZE = 4096  # Number of translations kept in memory
+    DEFAULT_BATCH_WINDOW_MS = 5
+    HITS_FLUSH_SIZE = 100
+    HITS_FLUSH_INTERVAL_SECONDS = 60.0
 
-    def __init__(self):
+    def __init__(self, http_client: HttpClient, database: PostgresDatabase = None):
+        super().__init__()
         self.api_key = os.environ['GOOGLE_TRANSLATE_API']
+        self.http_client = http_client
+        # translations are also persisted in the database (if set), so they survive restarts
+        self.database = database
+        # translations and detected languages by normalized text
+        self.__translations = LRUCache(self.TRANSLATION_CACHE_SIZE)
+        # hits of translations reused from memory not yet counted in the database by normalized text
+        self.__hits = Counter()
+        self.__hits_flushed_at = time.monotonic()
+        # characters that were not sent to Google Translate thanks to the cache (the pricing metric)
+        self.characters_saved = 0
+        self.characters_translated = 0
+
+        self.batch_window = float(
+            os.environ.get('GOOGLE_TRANSLATE_BATCH_WINDOW_MS', self.DEFAULT_BATCH_WINDOW_MS)
+        ) / 1000
+        # texts waiting to be sent with their original form and the future of their translation
+        # by normalized text
+        self.__batch: dict[str, tuple[str, asyncio.Future]] = {}
+        self.__batch_timer: Optional[asyncio.TimerHandle] = None
+        self.__batch_tasks: set[asyncio.Task] = set()
+        # number of requests sent to Google Translate and of texts translated by them
+        self.requests = 0
+        self.texts_translated = 0
 
     async def translate(self, text_to_translate: str) -> str:
         """Translates original achievement text to english using Google translate API.
@@ -34,46 +84,155 @@ class GoogleTranslateAPI(BaseClass):
             f"{self.GOOGLE_TRANSLATE_API_MAXIMUM_STRINGS}"
         )
 
-        # pylint: disable=fixme
-        # TODO: add number of characters `len(achievement_message)` to pricing statistics
-        # (free up to 500.000 per month, from 500.000 20$ every 1 mil characters)
+        # Google charges by characters (free up to 500.000 per month, from 500.000 20$ every
+        # 1 mil characters) so the same texts are translated only once
+        normalized_text = normalize_text(text_to_translate)
+        cached_translation = await self.__get_cached_translation(normalized_text)
+        if cached_translation is not None:
+            self.characters_saved += len(text_to_translate)
+            self.logger.info(
+                "Translation was found in cache, %d characters saved in total (%d translated)",
+                self.characters_saved,
+                self.characters_translated
+            )
+            return cached_translation
 
+        pending_translation = self.__batch.get(normalized_text)
+        if pending_translation is not None:
+            # the same text is already waiting to be sent
+            self.characters_saved += len(text_to_translate)
+            translation = pending_translation[1]
+        else:
+            self.characters_translated += len(text_to_translate)
+            translation = asyncio.get_running_loop().create_future()
+            self.__batch[normalized_text] = (text_to_translate, translation)
+            batch_is_full = len(self.__batch) >= self.GOOGLE_TRANSLATE_API_MAXIMUM_STRINGS
+            if batch_is_full or self.batch_window <= 0:
+                self.__send_batch()
+            elif self.__batch_timer is None:
+                self.__batch_timer = asyncio.get_running_loop().call_later(
+                    self.batch_window, self.__send_batch
+                )
+        # translation is shared by all callers, so it's not cancelled together with one of them
+        return await asyncio.shield(translation)
+
+    def __send_batch(self) -> None:
+        if self.__batch_timer is not None:
+            self.__batch_timer.cancel()
+            self.__batch_timer = None
+        (batch, self.__batch) = (self.__batch, {})
+        task = asyncio.get_running_loop().create_task(self.__translate_batch(batch))
+        self.__batch_tasks.add(task)
+        task.add_done_callback(self.__batch_tasks.discard)
+
+    async def __translate_batch(self, batch: dict[str, tuple[str, asyncio.Future]]) -> None:
+        """Translates texts in one request and resolves futures of their translations"""
+        self.requests += 1
+        self.texts_translated += len(batch)
         # Try invoking Google Translate API
         try:
-            response = await self.__invoke_translate_api(text_to_translate)
+            response = await self.__invoke_translate_api([text for (text, _) in batch.values()])
             response.raise_for_status()
+            translations_array = response.json()['data']['translations']
         # Handle exceptions
-        except httpx.TimeoutException as e:
-            raise GoogleAPIError(
+        except Exception as e:
+            error = self.__to_api_error(e)
+            for (_, translation) in batch.values():
+                translation.set_exception(error)
+            return
+
+        if len(batch) > 1:
+            self.logger.info("Translated %d texts in one request", len(batch))
+
+        # every text fails or succeeds on its own, translations are in the order of texts
+        saved_translations = []
+        for (index, (normalized_text, (_, translation))) in enumerate(batch.items()):
+            try:
+                translation_text = translations_array[index]['translatedText']
+            except (IndexError, KeyError, TypeError) as e:
+                translation.set_exception(GoogleAPIError(
+                    "Google Translate API didn't return translation of the text", "other", str(e)
+                ))
+                continue
+            # remove all non alphabetical symbols
+            translation_text = re.sub(r'[^\w\s]', '', translation_text)
+            detected_language = translations_array[index].get('detectedSourceLanguage')
+            self.__translations.put(normalized_text, translation_text)
+            saved_translations.append((normalized_text, translation_text, detected_language))
+            translation.set_result(translation_text)
+
+        if self.database and saved_translations:
+            try:
+                await asyncio.to_thread(self.database.save_translations, saved_translations)
+            except Exception as e:
+                self.logger.error("Failed to save translations: %s", e)
+
+    def __to_api_error(self, e: Exception) -> GoogleAPIError:
+        if isinstance(e, httpx.TimeoutException):
+            return GoogleAPIError(
                 "Timeout occurred while invoking Google Translate API", "timeout", str(e)
-            ) from e
-        except httpx.NetworkError as e:
-            raise GoogleAPIError(
+            )
+        if isinstance(e, httpx.NetworkError):
+            return GoogleAPIError(
                 "Failed to establish connection with Google Translate API", "network", str(e)
-            ) from e
-        except Exception as e:
-            raise GoogleAPIError(
-                "Unexpected error occurred while invoking Google Translate API", "other", str(e)
-            ) from e
-        # pylint: disable=fixme
-        # TODO: Add detected language `response['data']['translations']['detectedSourceLanguage']` to usage statistics
-        translations_array = response.json()['data']['translations']
+            )
+        return GoogleAPIError(
+            "Unexpected error occurred while invoking Google Translate API", "other", str(e)
+        )
 
-        assert len(translations_array) != 0, "Unable"
+    async def __get_cached_translation(self, normalized_text: str) -> Optional[str]:
+        translation = self.__translations.get(normalized_text)
+        if not self.database:
+            return translation
+        if translation is not None:
+            # the database counts its own hits, the ones from memory are counted here
+            self.__hits[normalized_text] += 1
+            self.__flush_hits_if_needed()
+            return translation
 
-        translation = translations_array[0]['translatedText']
-        translation = re.sub(r'[^\w\s]', '', translation) # remove all non alphabetical symbols
+        saved_translation = await asyncio.to_thread(self.database.get_translation, normalized_text)
+        if saved_translation:
+            (translation, _) = saved_translation
+            self.__translations.put(normalized_text, translation)
         return translation
 
-    async def __invoke_translate_api(self, text_to_translate: str) -> httpx.Response:
+    async def flush_hits(self) -> None:
+        """Saves hits of translations reused from memory not counted in the database yet"""
+        if self.__batch_tasks:
+            await asyncio.gather(*self.__batch_tasks, return_exceptions=True)
+        if not self.database or not self.__hits:
+            return
+        (hits, self.__hits) = (self.__hits, Counter())
+        self.__hits_flushed_at = time.monotonic()
+        await self.__save_hits(hits)
+
+    def __flush_hits_if_needed(self) -> None:
+        """Saves hits of translations reused from memory once there are enough or they are old"""
+        hits_are_old = (
+            time.monotonic() - self.__hits_flushed_at >= self.HITS_FLUSH_INTERVAL_SECONDS
+        )
+        if self.__hits.total() < self.HITS_FLUSH_SIZE and not hits_are_old:
+            return
+        (hits, self.__hits) = (self.__hits, Counter())
+        self.__hits_flushed_at = time.monotonic()
+        task = asyncio.get_running_loop().create_task(self.__save_hits(hits))
+        self.__batch_tasks.add(task)
+        task.add_done_callback(self.__batch_tasks.discard)
+
+    async def __save_hits(self, hits: Counter) -> None:
+        try:
+            await asyncio.to_thread(self.database.add_translation_hits, dict(hits))
+        except Exception as e:
+            self.logger.error("Failed to save hits of %d translations: %s", len(hits), e)
+
+    async def __invoke_translate_api(self, texts_to_translate: list[str]) -> httpx.Response:
         """Wraper around Google Translate API"""
-        async with httpx.AsyncClient() as client:
-            return await client.post(
-                    self.GOOGLE_TRANSLATE_URL,
-                    data = {
-                        'q': text_to_translate,
-                        'target': 'en',
-                        'key': self.api_key
-                    },
-                    timeout=self.GOOGLE_TRANSLATE_API_TIMEOUT
-                )
+        return await self.http_client.post(
+                self.GOOGLE_TRANSLATE_URL,
+                data = {
+                    'q': texts_to_translate,
+                    'target': 'en',
+                    'key': self.api_key
+                },
+                timeout=self.GOOGLE_TRANSLATE_API_TIMEOUT
+            )
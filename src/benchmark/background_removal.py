@@ -0,0 +1,154 @@
+"""
+Benchmark of background removal models on a local corpus of generated images
+
+Every model is measured in a fresh process, so the reported peak RSS is not affected by the
+models measured before it. Run from the src directory:
+
+    python -m benchmark.background_removal --corpus <directory with generated images>
+
+To include the int8-quantized export of u2net, pass a path where it should be written to
+(requires `onnx` package), or --custom-model with a path to a previously exported one:
+
+    python -m benchmark.background_removal --corpus <directory> --quantize /tmp/u2net_int8.onnx
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import multiprocessing
+import os
+import resource
+import time
+
+from PIL import Image
+from rembg import remove
+from rembg.sessions.u2net import U2netSession
+
+from sticker.util import (
+    REMBG_MODELS, is_image_suitable_for_achievement, new_background_removal_session
+)
+
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "webp")
+
+
+def peak_rss_mb() -> float:
+    """Returns peak resident set size of the current process in megabytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Returns nearest-rank percentile of the values"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def benchmark_model(
+    model_name: str,
+    model_path: str,
+    image_paths: list[str],
+    intra_op_threads: int,
+    inter_op_threads: int
+) -> dict:
+    """Measures one model, supposed to be run in a separate process"""
+    images = []
+    for image_path in image_paths:
+        image = Image.open(image_path)
+        image.load()
+        images.append(image)
+    baseline_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    session = new_background_removal_session(
+        model_name, intra_op_threads, inter_op_threads, model_path
+    )
+    load_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    suitable_images = 0
+    for image in images:
+        start = time.perf_counter()
+        image_without_bg = remove(image, session=session)
+        latencies.append((time.perf_counter() - start) * 1000)
+        suitable_images += is_image_suitable_for_achievement(image_without_bg)
+
+    return {
+        "model": model_name if not model_path else f"{model_name} ({os.path.basename(model_path)})",
+        "load_ms": load_ms,
+        "model_rss_mb": peak_rss_mb() - baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "pass_rate": suitable_images / len(images),
+    }
+
+
+def quantize_u2net(output_path: str) -> str:
+    """Exports int8-quantized version of u2net model to the output path"""
+    # pylint: disable=import-outside-toplevel
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(U2netSession.download_models(), output_path, weight_type=QuantType.QUInt8)
+    return output_path
+
+
+def main() -> None:
+    """Benchmarks requested models and prints the results as a table"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--corpus", required=True, help="directory with generated images")
+    parser.add_argument(
+        "--models",
+        nargs="*",
+        default=[model for model in REMBG_MODELS if model != "u2net_custom"],
+        help="models to benchmark"
+    )
+    parser.add_argument(
+        "--quantize", help="path to export int8-quantized u2net to and benchmark it"
+    )
+    parser.add_argument("--custom-model", help="path to u2net compatible ONNX model to benchmark")
+    parser.add_argument("--intra-op-threads", type=int, default=2)
+    parser.add_argument("--inter-op-threads", type=int, default=1)
+    args = parser.parse_args()
+
+    image_paths = sorted(
+        path for extension in IMAGE_EXTENSIONS
+        for path in glob.glob(os.path.join(args.corpus, f"*.{extension}"))
+    )
+    if not image_paths:
+        parser.error(f"No images were found in '{args.corpus}'")
+
+    variants = [(model, None) for model in args.models]
+    if args.quantize:
+        variants.append(("u2net_custom", quantize_u2net(args.quantize)))
+    if args.custom_model:
+        variants.append(("u2net_custom", args.custom_model))
+
+    results = []
+    mp_context = multiprocessing.get_context('spawn')
+    for (model_name, model_path) in variants:
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+            results.append(executor.submit(
+                benchmark_model,
+                model_name,
+                model_path,
+                image_paths,
+                args.intra_op_threads,
+                args.inter_op_threads
+            ).result())
+
+    print(f"{len(image_paths)} images from '{args.corpus}'")
+    print(
+        f"{'model':<32}{'load ms':>10}{'model RSS MB':>14}{'peak RSS MB':>13}"
+        f"{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'pass rate':>11}"
+    )
+    for result in results:
+        print(
+            f"{result['model']:<32}{result['load_ms']:>10.0f}{result['model_rss_mb']:>14.0f}"
+            f"{result['peak_rss_mb']:>13.0f}{result['mean_ms']:>10.0f}{result['p50_ms']:>10.0f}"
+            f"{result['p95_ms']:>10.0f}{result['pass_rate']:>11.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Golden comparison of the alpha-mask cluster labeling against the original depth-first search
+
+Golden masks (shapes the labeling could get wrong: rings, combs, spirals, diagonal neighbours,
+noise next to a large cluster) and seeded random masks are labeled by both implementations.
+Sorted cluster sizes and decisions of is_image_suitable_for_achievement (with and without the
+fast path) have to match the reference exactly. Block-aligned random masks make the fast path
+decide on the downsampled mask instead of falling back. Run from the src directory:
+
+    python -m benchmark.cluster_labeling [--random-masks 200] [--seed 0]
+"""
+import argparse
+import sys
+import time
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from sticker.util import (
+    FAST_PATH_MASK_SIZE,
+    cluster_sizes,
+    decide_on_downsampled_mask,
+    is_image_suitable_for_achievement
+)
+
+
+def reference_cluster_sizes(mask: np.ndarray) -> List[int]:
+    """The original implementation, walking every 4-connected cluster with a DFS"""
+    mask = mask.copy()
+
+    def dfs(x: int, y: int) -> int:
+        stack: List[Tuple[int, int]] = [(x, y)]
+        cluster_size: int = 0
+        while stack:
+            cx, cy = stack.pop()
+            if cx < 0 or cy < 0 or cx >= mask.shape[0] or cy >= mask.shape[1] or not mask[cx, cy]:
+                continue
+            mask[cx, cy] = 0
+            cluster_size += 1
+            stack.extend([(cx + dx, cy + dy) for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]])
+        return cluster_size
+
+    sizes: List[int] = []
+    for i in range(mask.shape[0]):
+        for j in range(mask.shape[1]):
+            if mask[i, j]:
+                sizes.append(dfs(i, j))
+    return sizes
+
+
+def reference_is_image_suitable_for_achievement(image: Image.Image) -> bool:
+    """The original decision over the clusters found by the DFS"""
+    image_array: np.ndarray = np.array(image)
+
+    if image_array.shape[2] == 4:
+        alpha_channel: np.ndarray = image_array[:, :, 3]
+    else:
+        return False
+
+    sizes = reference_cluster_sizes(alpha_channel > 0)
+    if len(sizes) == 0:
+        return False
+    if len(sizes) == 1:
+        return True
+
+    sizes.sort(reverse=True)
+
+    if sizes[1] * 100 / sizes[0] > 5:
+        return False
+
+    return True
+
+
+def disk(size: int, center: tuple[float, float], radius: float) -> np.ndarray:
+    """Returns mask of the disk"""
+    y, x = np.mgrid[0:size, 0:size]
+    return (x - center[0]) ** 2 + (y - center[1]) ** 2 <= radius ** 2
+
+
+def spiral(size: int) -> np.ndarray:
+    """Returns mask of a square spiral, one cluster that keeps merging runs of different rows"""
+    mask = np.zeros((size, size), dtype=bool)
+    (top, left, bottom, right) = (0, 0, size - 1, size - 1)
+    while top <= bottom and left <= right:
+        mask[top, left:right + 1] = True
+        mask[top:bottom + 1, right] = True
+        mask[bottom, left:right + 1] = True
+        mask[top + 2:bottom + 1, left] = True
+        (top, left, bottom, right) = (top + 2, left + 2, bottom - 2, right - 2)
+        if top <= bottom:
+            mask[top - 1, left] = True
+    return mask
+
+
+def golden_masks() -> dict[str, np.ndarray]:
+    """Returns fixed masks with known tricky shapes by name"""
+    masks = {}
+    masks["empty"] = np.zeros((64, 64), dtype=bool)
+    masks["full"] = np.ones((64, 64), dtype=bool)
+    masks["single pixel"] = np.zeros((64, 64), dtype=bool)
+    masks["single pixel"][31, 17] = True
+    masks["corner pixels"] = np.zeros((64, 64), dtype=bool)
+    masks["corner pixels"][[0, 0, 63, 63], [0, 63, 0, 63]] = True
+    masks["checkerboard"] = (np.indices((32, 32)).sum(axis=0) % 2).astype(bool)
+    masks["diagonal"] = np.eye(64, dtype=bool)
+    masks["thick diagonal"] = np.eye(64, dtype=bool) | np.eye(64, k=1, dtype=bool)
+    masks["ring"] = disk(96, (48, 48), 40) & ~disk(96, (48, 48), 30)
+    masks["ring with dot"] = masks["ring"] | disk(96, (48, 48), 3)
+    masks["u shape"] = np.zeros((64, 64), dtype=bool)
+    masks["u shape"][8:56, 8:16] = masks["u shape"][8:56, 48:56] = True
+    masks["u shape"][48:56, 8:56] = True
+    masks["comb"] = np.zeros((64, 64), dtype=bool)
+    masks["comb"][0:60:2, :] = True
+    masks["comb"][:, 0] = True
+    masks["open comb"] = np.zeros((64, 64), dtype=bool)
+    masks["open comb"][0:60:2, :] = True
+    masks["spiral"] = spiral(97)
+    masks["blob and noise"] = disk(128, (64, 64), 40)
+    masks["blob and noise"][[2, 5, 120], [3, 125, 7]] = True
+    # 5% of the largest cluster exactly (kept) and just above it (rejected)
+    masks["second cluster at 5%"] = np.zeros((40, 80), dtype=bool)
+    masks["second cluster at 5%"][0:20, 0:40] = True
+    masks["second cluster at 5%"][30:34, 50:60] = True
+    masks["second cluster above 5%"] = masks["second cluster at 5%"].copy()
+    masks["second cluster above 5%"][34, 50] = True
+    masks["two equal blobs"] = disk(128, (32, 64), 24) | disk(128, (96, 64), 24)
+    masks["touching blobs"] = disk(128, (40, 64), 24) | disk(128, (88, 64), 24)
+    masks["sticker sized disk"] = disk(512, (256, 256), 220)
+    masks["sticker sized blob and noise"] = disk(512, (256, 256), 220)
+    masks["sticker sized blob and noise"][::97, ::89] = True
+    masks["block aligned blocks"] = np.kron(
+        disk(FAST_PATH_MASK_SIZE, (40, 40), 20) | disk(FAST_PATH_MASK_SIZE, (90, 90), 12),
+        np.ones((4, 4), dtype=bool)
+    )
+    return masks
+
+
+def random_masks(count: int, seed: int) -> dict[str, np.ndarray]:
+    """Returns seeded random masks of various sizes, densities and smoothness by name"""
+    rng = np.random.default_rng(seed)
+    masks = {}
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            # salt and pepper noise around the percolation threshold
+            size = int(rng.integers(8, 96))
+            mask = rng.random((size, int(rng.integers(8, 96)))) < rng.uniform(0.3, 0.7)
+        elif kind == 1:
+            # union of random disks, a few large clusters with noise
+            size = int(rng.integers(32, 160))
+            mask = np.zeros((size, size), dtype=bool)
+            for _ in range(int(rng.integers(1, 6))):
+                mask |= disk(size, rng.uniform(0, size, 2), rng.uniform(1, size / 3))
+        elif kind == 2:
+            # low resolution noise upscaled to the fast path grid, so the fast path decides
+            scale = int(rng.choice([1, 2, 4]))
+            blocks = rng.random((FAST_PATH_MASK_SIZE, FAST_PATH_MASK_SIZE)) < rng.uniform(0.2, 0.8)
+            mask = np.kron(blocks, np.ones((scale, scale), dtype=bool))
+        else:
+            # block aligned disks with pixel noise, so the fast path has to fall back
+            blocks = np.zeros((FAST_PATH_MASK_SIZE, FAST_PATH_MASK_SIZE), dtype=bool)
+            for _ in range(int(rng.integers(1, 4))):
+                blocks |= disk(
+                    FAST_PATH_MASK_SIZE,
+                    rng.uniform(0, FAST_PATH_MASK_SIZE, 2),
+                    rng.uniform(4, 40)
+                )
+            mask = np.kron(blocks, np.ones((2, 2), dtype=bool))
+            mask ^= rng.random(mask.shape) < 0.001
+        masks[f"random {index}"] = mask
+    return masks
+
+
+def to_image(mask: np.ndarray) -> Image.Image:
+    """Returns RGBA image whose alpha channel is positive exactly on the mask"""
+    alpha = np.where(mask, np.arange(mask.size).reshape(mask.shape) % 255 + 1, 0).astype(np.uint8)
+    pixels = np.dstack((np.full(mask.shape + (3,), 128, dtype=np.uint8), alpha))
+    return Image.fromarray(pixels, "RGBA")
+
+
+def compare(name: str, mask: np.ndarray) -> tuple[list[str], bool, float, float]:
+    """
+    Compares both implementations on the mask, returns mismatches, the expected decision and
+    durations of both implementations
+    """
+    image = to_image(mask)
+    mismatches = []
+
+    start = time.perf_counter()
+    expected_sizes = sorted(reference_cluster_sizes(mask))
+    expected = reference_is_image_suitable_for_achievement(image)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual_sizes = sorted(int(size) for size in cluster_sizes(mask))
+    actual = is_image_suitable_for_achievement(image)
+    labeling_seconds = time.perf_counter() - start
+    actual_fast_path = is_image_suitable_for_achievement(image, fast_path=True)
+
+    if actual_sizes != expected_sizes:
+        mismatches.append(
+            f"{name}: {len(actual_sizes)} clusters instead of {len(expected_sizes)} "
+            f"(largest {actual_sizes[-3:]} instead of {expected_sizes[-3:]})"
+        )
+    if actual != expected:
+        mismatches.append(f"{name}: decision {actual} instead of {expected}")
+    if actual_fast_path != expected:
+        mismatches.append(f"{name}: fast path decision {actual_fast_path} instead of {expected}")
+    return mismatches, expected, reference_seconds, labeling_seconds
+
+
+def main() -> None:
+    """Compares both implementations on golden and random masks and prints the mismatches"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--random-masks", type=int, default=200, help="number of random masks")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random masks")
+    args = parser.parse_args()
+
+    mismatches = []
+    for (group, masks) in (
+        ("golden", golden_masks()),
+        ("random", random_masks(args.random_masks, args.seed)),
+    ):
+        reference_seconds = 0.0
+        labeling_seconds = 0.0
+        suitable = 0
+        decided_by_fast_path = 0
+        for (name, mask) in masks.items():
+            (
+                mask_mismatches,
+                expected,
+                mask_reference_seconds,
+                mask_labeling_seconds
+            ) = compare(name, mask)
+            mismatches.extend(mask_mismatches)
+            suitable += expected
+            decided_by_fast_path += decide_on_downsampled_mask(mask) is not None
+            reference_seconds += mask_reference_seconds
+            labeling_seconds += mask_labeling_seconds
+        print(
+            f"{group:7} {len(masks):4} masks ({suitable} suitable, "
+            f"{decided_by_fast_path} decided by fast path), "
+            f"dfs {reference_seconds * 1000:8.1f} ms, "
+            f"run labeling {labeling_seconds * 1000:7.1f} ms"
+        )
+
+    for mismatch in mismatches:
+        print(f"MISMATCH {mismatch}")
+    print(f"{len(mismatches)} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark of gradient sticker rendering: the original per-pixel loop against the vectorized one
+
+Both versions render the same color pairs, outputs are checked to be pixel-identical and
+the speedup is required to be at least 50x. Run from the src directory:
+
+    python -m benchmark.gradient
+"""
+import math
+import sys
+import time
+
+from PIL import Image, ImageChops
+
+from sticker.artist import StickerArtist
+
+COLOR_PAIRS = (
+    (StickerArtist.INNER_GROUP_STICKER_COLOR, StickerArtist.OUTER_GROUP_STICKER_COLOR),
+    ((60, 115, 170), (255, 255, 255)),
+    ((0, 0, 0), (255, 255, 255)),
+    ((255, 0, 0), (0, 0, 255)),
+    ((170, 60, 60), (60, 170, 115)),
+)
+MINIMUM_SPEEDUP = 50
+
+
+def render_gradient_with_loop(inner_color, outer_color) -> Image.Image:
+    """The original implementation, placing every pixel with putpixel"""
+    width = StickerArtist.WIDTH
+    height = StickerArtist.HEIGHT
+    image = Image.new("RGBA", (width, height), StickerArtist.BACKGROUND_COLOR)
+
+    for y in range(height):
+        for x in range(width):
+            # Find the distance to the center
+            distance_to_center = math.sqrt((x - width / 2) ** 2 + (y - height / 2) ** 2)
+
+            # Make it on a scale from 0 to 1
+            distance_to_center = float(distance_to_center) / (math.sqrt(2) * width / 2)
+
+            # Calculate r, g, and b values
+            r = outer_color[0] * distance_to_center + inner_color[0] * (1 - distance_to_center)
+            g = outer_color[1] * distance_to_center + inner_color[1] * (1 - distance_to_center)
+            b = outer_color[2] * distance_to_center + inner_color[2] * (1 - distance_to_center)
+
+            # Place the pixel
+            x_to_center = x - width / 2
+            y_to_center = y - height / 2
+            squares_sum = x_to_center * x_to_center + y_to_center * y_to_center
+            if squares_sum <= width * width / 4:
+                image.putpixel((x, y), (int(r), int(g), int(b)))
+
+    return image
+
+
+def main() -> None:
+    """Renders all color pairs with both implementations, prints timings and checks outputs"""
+    artist = StickerArtist(None, None)
+    # pylint: disable=protected-access
+    render_gradient_vectorized = artist._StickerArtist__generate_sticker_of_gradient
+
+    loop_seconds = 0.0
+    vectorized_seconds = 0.0
+    identical = True
+    for (inner_color, outer_color) in COLOR_PAIRS:
+        start = time.perf_counter()
+        expected = render_gradient_with_loop(inner_color, outer_color)
+        loop_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = render_gradient_vectorized(inner_color, outer_color)
+        vectorized_seconds += time.perf_counter() - start
+
+        pair_identical = ImageChops.difference(expected, actual).getbbox() is None
+        identical = identical and pair_identical
+        print(
+            f"{str(inner_color):16} -> {str(outer_color):16} "
+            f"{'identical' if pair_identical else 'DIFFERENT'}"
+        )
+
+    speedup = loop_seconds / vectorized_seconds
+    print(f"loop:       {loop_seconds / len(COLOR_PAIRS) * 1000:8.1f} ms per sticker")
+    print(f"vectorized: {vectorized_seconds / len(COLOR_PAIRS) * 1000:8.1f} ms per sticker")
+    print(f"speedup:    {speedup:8.1f}x (required {MINIMUM_SPEEDUP}x)")
+    if not identical or speedup < MINIMUM_SPEEDUP:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
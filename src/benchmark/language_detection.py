@@ -0,0 +1,84 @@
+"""
+Accuracy and latency check of the local language detection, which decides whether an achievement
+text is sent to Google Translate
+
+Key phrases from resources/key.txt (labeled by their script) and sample achievement texts are
+classified. Texts detected as English are not translated, so a non-English text detected as English
+is the costly mistake (an untranslated prompt goes to DeepAI), while an English text left undetected
+only costs a translation. The check fails if any mistake of the first kind is made. Run from the src
+directory:
+
+    python -m benchmark.language_detection
+"""
+import re
+import sys
+import time
+
+from message.filter import LanguageFilter
+from message.language import detect_language
+
+ACHIEVEMENTS = (
+    ("en", "fixing the coffee machine"),
+    ("en", "Best joke of the week"),
+    ("en", "being the first one in the office today"),
+    ("en", "finally deploying on friday without breaking anything"),
+    ("en", "the longest voice message ever"),
+    ("en", "cooking dinner for everyone"),
+    ("en", "winning the chess tournament"),
+    ("en", "never missing a single standup"),
+    ("ru", "самый пунктуальный участник чата"),
+    ("ru", "починку кофемашины"),
+    ("ru", "лучшую шутку недели"),
+    ("ru", "победу в турнире по шахматам"),
+    ("ru", "deploy в пятницу"),
+    ("es", "la mejor broma de la semana"),
+    ("es", "arreglar la máquina de café"),
+    ("es", "ganar el torneo de ajedrez"),
+    ("es", "por cocinar la cena para todos"),
+    ("es", "nunca llegar tarde a las reuniones"),
+)
+REPEATS = 1000
+
+
+def load_key_phrases() -> list[tuple[str, str]]:
+    """Returns key phrases labeled by their language"""
+    with open(LanguageFilter.KEY_PHRASES_FILE_PATH, 'r', encoding='utf-8') as file:
+        phrases = [line.strip() for line in file if line.strip()]
+    return [("ru" if re.search('[а-яА-ЯёЁ]', phrase) else "en", phrase) for phrase in phrases]
+
+
+def main() -> None:
+    """Classifies labeled texts, prints accuracy and latency of the detection"""
+    texts = load_key_phrases() + list(ACHIEVEMENTS)
+
+    correct = 0
+    english_detected = 0
+    english_texts = 0
+    false_english = []
+    for (language, text) in texts:
+        detected_language = detect_language(text)
+        correct += detected_language == language
+        english_texts += language == "en"
+        english_detected += language == "en" and detected_language == "en"
+        if detected_language == "en" and language != "en":
+            false_english.append(text)
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for (_, text) in texts:
+            detect_language(text)
+    latency = (time.perf_counter() - start) / (REPEATS * len(texts))
+
+    print(f"texts:                      {len(texts)}")
+    print(f"accuracy:                   {correct / len(texts):.1%}")
+    print(f"english texts untranslated: {english_detected} of {english_texts}")
+    print(f"non-english as english:     {len(false_english)}")
+    print(f"latency:                    {latency * 1e6:.1f} us per text")
+    for text in false_english:
+        print(f"  wrongly detected as english: {text}")
+    if false_english:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
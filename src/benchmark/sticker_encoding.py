@@ -0,0 +1,106 @@
+"""
+Benchmark of sticker encoding policies on every type of sticker StickerArtist produces
+
+Description, chat description, username and empty stickers are rendered in place. Stickers from
+profile pictures and from prompts (background removal included) are rendered only if a corpus of
+images is given. Run from the src directory:
+
+    python -m benchmark.sticker_encoding [--corpus <directory with generated images>]
+"""
+import argparse
+import glob
+import os
+import time
+
+from PIL import Image
+
+from benchmark.background_removal import IMAGE_EXTENSIONS
+from sticker.artist import StickerArtist
+from storage.encoder import StickerEncoder
+
+DESCRIPTIONS = (
+    "Best joke of the week",
+    "For finally fixing the coffee machine after three weeks of everybody ignoring it",
+    "Самый пунктуальный участник чата",
+)
+USERNAMES = ("durov", "a_very_long_username_of_somebody", "achiever")
+
+POLICIES = (
+    StickerEncoder("png", 6, 0),
+    StickerEncoder("png", 1, 0),
+    StickerEncoder("png", 9, 0),
+    StickerEncoder("png", 6, 256),
+    StickerEncoder("png", 9, 64),
+    StickerEncoder("webp", webp_quality=90, palette_colors=0),
+    StickerEncoder("webp", webp_quality=75, palette_colors=0),
+    StickerEncoder("webp", webp_quality=100, palette_colors=0),
+)
+
+
+def render_stickers(
+    artist: StickerArtist, image_paths: list[str]
+) -> dict[str, tuple[bool, list[Image.Image]]]:
+    """Renders stickers of every type, returns whether they are flat and the stickers by type"""
+    stickers = {
+        "description": (False, [artist.render_description_sticker(text) for text in DESCRIPTIONS]),
+        "chat description": (False, [
+            artist.render_chat_description_sticker(text, number)
+            for (number, text) in enumerate(DESCRIPTIONS, start=1)
+        ]),
+        "username": (True, [
+            artist.render_sticker_from_username(username) for username in USERNAMES
+        ]),
+        "empty": (True, [artist.render_empty_sticker()]),
+    }
+    if image_paths:
+        pictures = []
+        for image_path in image_paths:
+            with open(image_path, "rb") as image_file:
+                pictures.append(image_file.read())
+        stickers["profile picture"] = (False, [
+            artist.render_sticker_from_profile_picture(picture) for picture in pictures
+        ])
+        stickers["prompt"] = (False, [
+            artist.render_sticker_without_background(Image.open(image_path).convert("RGB"))
+            for image_path in image_paths
+        ])
+    return stickers
+
+
+def main() -> None:
+    """Encodes every type of sticker with every policy and prints the results as a table"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--corpus", help="directory with generated images")
+    parser.add_argument("--repeat", type=int, default=5, help="times every sticker is encoded")
+    args = parser.parse_args()
+
+    image_paths = []
+    if args.corpus:
+        image_paths = sorted(
+            path for extension in IMAGE_EXTENSIONS
+            for path in glob.glob(os.path.join(args.corpus, f"*.{extension}"))
+        )
+        if not image_paths:
+            parser.error(f"No images were found in '{args.corpus}'")
+
+    artist = StickerArtist(None, None)
+    stickers = render_stickers(artist, image_paths)
+
+    print(f"{'sticker':<18}{'policy':<28}{'encode ms':>11}{'size KB':>10}")
+    for (sticker_type, (flat, images)) in stickers.items():
+        for policy in POLICIES:
+            sizes = []
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                sizes = [len(policy.encode(image, flat)) for image in images]
+            encode_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(images))
+            print(
+                f"{sticker_type:<18}{policy.describe():<28}{encode_ms:>11.1f}"
+                f"{sum(sizes) / len(sizes) / 1024:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 """
 This module handles Telegram bot commands implementation
 """
+import asyncio
+from collections import defaultdict
 import json
 import html
 import os
@@ -12,12 +14,15 @@ from telegram.ext import Application, CommandHandler, MessageHandler, CallbackCo
 from telegram.constants import ParseMode
 from telegram.ext import filters
 
+from api.http_client import HttpClient
 from api.telegram import TelegramAPI
+from api.translate import GoogleTranslateAPI
 
 from bot.access import LIST_OF_ADMINS, WarningsProcessor, restricted_to_admins, restricted_to_not_banned, restricted_to_stickerset_owners, restricted_to_supergroups, restricted_to_undefined_stickerset_chats, restricted_to_defined_stickerset_chats
 from bot.stickers import StickerManager
 
 from common.common import BaseClass
+from common.single_flight import SingleFlight
 from common.utils import masked_print
 
 from message.filter import LanguageFilter
@@ -31,7 +36,7 @@ class Bot(BaseClass):
     DOCUMENTATION = [
         ("What is it?", "This is the Achievements Bot\.\nEver wanted to show appreciation for someone's _achievements_ in a chat? With this bot, you can create unique stickers representing their achievements and assign them directly\. Each chat will also have a sticker set to keep track of all the achievements awarded\."),
         ("Where are the stickers stored?", "Stickers are stored in specific Telegram sticker sets\. There's one sticker set for each person to track individual achievements, and another for the entire chat to monitor collective achievements\.\n\nTo manage these sets, one chat member must become the sticker set owner by sending /own\_stickers in the chat\.\n\nRemember, if you're the owner, DO NOT modify these stickers as it could disrupt the bot's functionality\."),
-        ("How to give a new achievement?", "To award a new achievement, reply to a message in the chat, using a specific keyword to activate the bot\. The bot will recognize the keyword, process the achievement, and post stickers representing it—one from the individual's set and another from the chat's collective set\.\nThe stickers are AI\-generated based on the achievement's description\.\n\nCurrently, you can use phrases like `выдаю ачивку за \(текст достижения\)` or `drop an achievement for \(achievement message\)` to trigger the bot\.  \([Full list of key phrases](https://github.com/progaem/a4iFfki/blob/master/resources/key.txt)\)"),
+        ("How to give a new achievement?", "To award a new achievement, reply to a message in the chat, using a specific keyword to activate the bot\. The bot will recognize the keyword, process the achievement, and post stickers representing it—one from the individual's set and another from the chat's collective set\.\nThe stickers are AI\-generated based on the achievement's description\.\n\nCurrently, you can use phrases like `выдаю ачивку за \(текст достижения\)` or `drop an achievement for \(achievement message\)` to trigger the bot\.  \([Full list of key phrases](https://github.com/progaem/a4iFfki/blob/master/resources/key.txt)\)\n\nIf the picture didn't turn out well, the sticker set owner can reply to the achievement sticker with /reroll to swap it for another one generated for it, while there are any left\."),
         ("How to give an existing achievement?", "Simply reply to a message with an achievement sticker from the chat's collective sticker set\. Every time you award the same achievement to a new person, the count under each description sticker increases\."),
         ("FAQ", """>Why did I receive a warning for excessive bot usage?
     To operate within a limited budget, there are usage caps: you can only grant two achievements per person per day\. Exceeding this limit can lead to an automatic ban\.
@@ -42,6 +47,9 @@ class Bot(BaseClass):
 >I see that order of stickers is messed up in the stickerset, what else could I do to fix it?
     Sorry to hear that, we are working on making the bot more resilient to errors in the updates\.\n\nFor now the only solution is to run /reset command \(_it's only available to stickerset owners_\) that would reset all the information about your stickers of your chat and start over :\(
 
+>Can we keep pictures of our achievements to ourselves?
+    Pictures of new achievements are reused by other chats that get the same achievements, and this chat reuses theirs\. The sticker set owner can send /image\_cache off to stop sharing pictures with other chats, and /image\_cache on to share them again\.
+
 >Is there a way I can support this project? ;\)
     Absolutely, and thanks for asking\! We recently set up a  [Buy Me a Coffee account](https://buymeacoffee.com/progaem), where you can support our project if you choose to\. Any support is entirely optional but greatly appreciated\! <3""")
     ]
@@ -58,7 +66,9 @@ class Bot(BaseClass):
         language_filter: LanguageFilter,
         warnings_processor: WarningsProcessor,
         sticker_artist: StickerArtist,
-        sticker_manager: StickerManager
+        sticker_manager: StickerManager,
+        http_client: HttpClient = None,
+        google_translate_api: GoogleTranslateAPI = None
     ):
         super().__init__()
         self.telgram_bot_name = os.environ['TELEGRAM_BOT_NAME']
@@ -74,13 +84,40 @@ class Bot(BaseClass):
 
         self.sticker_artist = sticker_artist
         self.sticker_manager = sticker_manager
+        # connections are owned by the application, so they are closed when it stops
+        self.http_client = http_client
+        # translation hits counted in memory are saved before the bot stops
+        self.google_translate_api = google_translate_api
+        # new achievements being generated by (chat ID, prompt)
+        self.achievement_generations = SingleFlight()
+        # updates are handled concurrently, while sticker sets of a chat are changed by one award at
+        # a time, so indices of their stickers don't collide
+        self.__sticker_set_locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
 
         telegram_token = os.environ['TELEGRAM_BOT_TOKEN']
-        self.application = Application.builder().token(telegram_token).build()
+        self.application = (
+            Application.builder()
+                .token(telegram_token)
+                # commands and reactions don't wait for achievements being generated
+                .concurrent_updates(True)
+                .post_init(self.__on_startup)
+                .post_shutdown(self.__on_shutdown)
+                .build()
+        )
         self.logger.info("Telegram application was started with %s", masked_print(telegram_token))
 
     ### COMMANDS AVAILABLE ONLY TO ADMINS ###
 
+    @restricted_to_admins
+    async def stats(self, update: Update, context: CallbackContext) -> None:
+        """Shows hits and misses of the caches since the bot was started"""
+        self.logger.info("[BOT] stats command was invoked")
+        context = await self.telegram.reply_text(
+            json.dumps(self.__collect_stats(), indent=2),
+            update,
+            context
+        )
+
     @restricted_to_supergroups
     @restricted_to_admins
     async def ban(self, update: Update, context: CallbackContext) -> None:
@@ -140,7 +177,10 @@ class Bot(BaseClass):
 
         files_to_remove = self.database.all_sticker_file_paths(chat_id)
         (_, _, _) = self.database.remove_all(chat_id)
-        self.sticker_file_manager.remove_all(files_to_remove)
+        # identical stickers (e.g. the empty one) are stored once and may still be used by other
+        # chats
+        files_to_remove = self.database.unreferenced_file_paths(files_to_remove)
+        await self.sticker_file_manager.remove(files_to_remove)
         
         context = await self.telegram.reply_text(
             f"@{user_name}, as per your request, all stickers for this chat were reset and sticker sets deleted. "
@@ -150,6 +190,107 @@ class Bot(BaseClass):
             context
         )
 
+    @restricted_to_supergroups
+    @restricted_to_stickerset_owners
+    async def image_cache(self, update: Update, context: CallbackContext) -> None:
+        """Opts the chat out of (or back in to) sharing generated images with other chats"""
+        (chat_id, _, _, context) = self.telegram.get_chat_info(update, context)
+        (message_text, context) = self.telegram.get_message(update, context)
+        self.logger.info(
+            f"[BOT] image_cache command was invoked in the {chat_id} chat: {message_text}"
+        )
+
+        arguments = message_text.split()[1:]
+        if arguments not in (["on"], ["off"]):
+            context = await self.telegram.reply_text(
+                "Images of new achievements are reused across chats with the same achievements. "
+                "In order to stop sharing images of this chat with other chats, invoke "
+                "/image_cache off (or /image_cache on to share them again)",
+                update,
+                context
+            )
+            return
+
+        disabled = arguments == ["off"]
+        self.database.set_image_cache_disabled(chat_id, disabled)
+        context = await self.telegram.reply_text(
+            "Images of new achievements in this chat won't be shared with other chats anymore"
+            if disabled
+            else "Images of new achievements in this chat are shared with other chats again",
+            update,
+            context
+        )
+
+    @restricted_to_supergroups
+    @restricted_to_stickerset_owners
+    async def reroll(self, update: Update, context: CallbackContext) -> None:
+        """
+        Replaces the picture of the achievement sticker in reply message with another candidate
+        generated for it
+        """
+        (chat_id, _, _, context) = self.telegram.get_chat_info(update, context)
+        (_, user_name, context) = self.telegram.get_from_user_info(update, context)
+
+        self.logger.info(
+            f"[BOT] reroll command was invoked in the {chat_id} chat by user {user_name}"
+        )
+
+        reply_to_message = update.message.reply_to_message
+        if not reply_to_message or not reply_to_message.sticker:
+            context = await self.telegram.reply_text(
+                "Reply with /reroll to the achievement sticker from the chat sticker set to get "
+                "another picture for it",
+                update,
+                context
+            )
+            return
+
+        (chat_sticker_set_info, session) = self.database.get_chat_sticker_set(chat_id)
+        stickers_by_file_id = {s.file_unique_id: s for s in chat_sticker_set_info}
+        achievement_sticker_info = stickers_by_file_id.get(reply_to_message.sticker.file_unique_id)
+        if not achievement_sticker_info or achievement_sticker_info.type != 'achievement':
+            context = await self.telegram.reply_text(
+                "Only achievement stickers from the chat sticker set can get another picture",
+                update,
+                context
+            )
+            session.close()
+            return
+
+        # the prompt is engraved on the description sticker below the achievement one
+        index_based_lookup = {s.index_in_sticker_set: s for s in chat_sticker_set_info}
+        description_index = (
+            achievement_sticker_info.index_in_sticker_set
+            + StickerManager.TELEGRAM_STICKERS_LINE_COUNT
+        )
+        prompt = index_based_lookup[description_index].engraving_text
+
+        async with self.__sticker_set_locks[chat_id]:
+            achievement_sticker = await self.sticker_artist.draw_rerolled_sticker_from_prompt(
+                prompt, chat_id
+            )
+            if achievement_sticker is None:
+                context = await self.telegram.reply_text(
+                    f"There are no other pictures generated for '{prompt}' left",
+                    update,
+                    context
+                )
+            else:
+                achievement_sticker_file_id = (
+                    await self.sticker_manager.replace_chat_achievement_sticker(
+                        achievement_sticker_info, achievement_sticker, update, context
+                    )
+                )
+                context = await self.telegram.send_sticker(
+                    chat_id,
+                    achievement_sticker_file_id,
+                    update,
+                    context
+                )
+
+        session.commit()
+        session.close()
+
     @restricted_to_supergroups
     @restricted_to_stickerset_owners
     async def transfer(self, update: Update, context: CallbackContext) -> None:
@@ -381,58 +522,75 @@ class Bot(BaseClass):
 
         self.database.save_prompt_message(chat_id, from_user_id, to_user_id, message_text, prompt)
 
-        # if sticker already exists we want to use it (not create another one)
-        achievement_sticker_info, description_sticker_info, session = await self.sticker_manager.find_existing_sticker(chat_id, prompt)
-        if achievement_sticker_info: # would be null if there is no such sticker
-            await self.__give_user_existing_achievement(
-                to_user_id, to_user_name, chat_id, from_user_name, chat_name, 
-                achievement_sticker_info, description_sticker_info, update, context
-            )
+        # the same new achievement awarded concurrently is generated once: the other awards wait for
+        # it and then take the existing achievement path
+        async with self.achievement_generations.flight((chat_id, prompt)) as waited:
+            if waited:
+                self.logger.info(
+                    f"[BOT] waited for achievement '{prompt}' being generated in {chat_id}"
+                )
+
+            # if sticker already exists we want to use it (not create another one)
+            (
+                achievement_sticker_info,
+                description_sticker_info,
+                session
+            ) = await self.sticker_manager.find_existing_sticker(chat_id, prompt)
+            if achievement_sticker_info: # would be null if there is no such sticker
+                await self.__give_user_existing_achievement(
+                    to_user_id, to_user_name, chat_id, from_user_name, chat_name, 
+                    achievement_sticker_info, description_sticker_info, update, context
+                )
+                session.commit()
+                session.close()
+                return
             session.commit()
             session.close()
-            return
-        session.commit()
-        session.close()
 
-        # fetch the sticker owner for this chat
-        stickers_owner_id = self.database.get_stickerset_owner(chat_id)
-
-        # generate all needed stickers
-        achievement_sticker = await self.sticker_artist.draw_sticker_from_prompt(prompt)
-        chat_description_sticker = self.sticker_artist.draw_chat_description_sticker(prompt, 1)
-        user_description_sticker = self.sticker_artist.draw_description_sticker(prompt)
-
-        # update sticker sets
-        achievement_description_chat_sticker_file_id = await self.sticker_manager.add_chat_stickers(
-            stickers_owner_id,
-            chat_id, chat_name,
-            achievement_sticker,
-            chat_description_sticker,
-            prompt,
-            update,
-            context)
-        achievement_user_sticker_file_id = await self.sticker_manager.add_user_stickers(
-            stickers_owner_id,
-            to_user_id,
-            to_user_name,
-            chat_id,
-            chat_name,
-            achievement_sticker,
-            user_description_sticker,
-            prompt,
-            update,
-            context)
+            # fetch the sticker owner for this chat
+            stickers_owner_id = self.database.get_stickerset_owner(chat_id)
 
-        await self.__respond_with_achievement_stickers(
-            update,
-            context,
-            from_user_name,
-            to_user_name,
-            chat_name,
-            chat_id,
-            prompt,
-            achievement_user_sticker_file_id,
-            achievement_description_chat_sticker_file_id)
+            # generate all needed stickers
+            (
+                achievement_sticker,
+                chat_description_sticker,
+                user_description_sticker
+            ) = await self.sticker_artist.draw_achievement_stickers(prompt, chat_id)
+
+            # update sticker sets
+            async with self.__sticker_set_locks[chat_id]:
+                achievement_description_chat_sticker_file_id = (
+                    await self.sticker_manager.add_chat_stickers(
+                        stickers_owner_id,
+                        chat_id, chat_name,
+                        achievement_sticker,
+                        chat_description_sticker,
+                        prompt,
+                        update,
+                        context)
+                )
+                achievement_user_sticker_file_id = await self.sticker_manager.add_user_stickers(
+                    stickers_owner_id,
+                    to_user_id,
+                    to_user_name,
+                    chat_id,
+                    chat_name,
+                    achievement_sticker,
+                    user_description_sticker,
+                    prompt,
+                    update,
+                    context)
+
+            await self.__respond_with_achievement_stickers(
+                update,
+                context,
+                from_user_name,
+                to_user_name,
+                chat_name,
+                chat_id,
+                prompt,
+                achievement_user_sticker_file_id,
+                achievement_description_chat_sticker_file_id)
 
     @restricted_to_supergroups
     @restricted_to_defined_stickerset_chats
@@ -495,32 +653,39 @@ class Bot(BaseClass):
             - (1) in on_give method if there is existing sticker with the same prompt
             - (2) in on_sticker_reply method if a user replies with an existing achievement sticker
         """
-        achievement_sticker = self.sticker_file_manager.get_bytes_from_path(achievement_sticker_info.file_path)
-        user_description_sticker = self.sticker_artist.draw_description_sticker(description_sticker_info.engraving_text)
-        # add and update stickers
-        achievement_user_sticker_file_id = await self.sticker_manager.add_user_stickers(
-            description_sticker_info.sticker_set_owner_id,
-            to_user_id,
-            to_user_name,
-            chat_id,
-            chat_name,
-            (achievement_sticker_info.file_path, achievement_sticker),
-            user_description_sticker,
-            description_sticker_info.engraving_text,
-            update,
-            context
+        achievement_sticker = await self.sticker_file_manager.get(
+            achievement_sticker_info.file_path
         )
-        achievement_description_chat_sticker_file_id = await self.sticker_manager.increase_counter_on_chat_description_sticker(
-            description_sticker_info.sticker_set_owner_id,
-            chat_id,
-            description_sticker_info.file_id,
-            description_sticker_info.sticker_set_name,
-            description_sticker_info.index_in_sticker_set,
-            description_sticker_info.engraving_text,
-            description_sticker_info.times_achieved,
-            update,
-            context
+        user_description_sticker = await self.sticker_artist.draw_description_sticker(
+            description_sticker_info.engraving_text
         )
+        # add and update stickers
+        async with self.__sticker_set_locks[chat_id]:
+            achievement_user_sticker_file_id = await self.sticker_manager.add_user_stickers(
+                description_sticker_info.sticker_set_owner_id,
+                to_user_id,
+                to_user_name,
+                chat_id,
+                chat_name,
+                (achievement_sticker_info.file_path, achievement_sticker),
+                user_description_sticker,
+                description_sticker_info.engraving_text,
+                update,
+                context
+            )
+            achievement_description_chat_sticker_file_id = (
+                await self.sticker_manager.increase_counter_on_chat_description_sticker(
+                    description_sticker_info.sticker_set_owner_id,
+                    chat_id,
+                    description_sticker_info.file_id,
+                    description_sticker_info.sticker_set_name,
+                    description_sticker_info.index_in_sticker_set,
+                    description_sticker_info.engraving_text,
+                    description_sticker_info.times_achieved,
+                    update,
+                    context
+                )
+            )
         await self.__respond_with_achievement_stickers(update, context, from_user_name, to_user_name, chat_name, chat_id, description_sticker_info.engraving_text, achievement_user_sticker_file_id, achievement_description_chat_sticker_file_id)
     
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -599,14 +764,55 @@ class Bot(BaseClass):
             context
         )
 
+    async def __on_startup(self, _: Application) -> None:
+        # background uploads of sticker files need the running loop of the application
+        self.sticker_file_manager.start()
+
+    def __collect_stats(self) -> dict[str, dict]:
+        """Returns counters of the components since the bot was started, by component"""
+        stats = {
+            "sticker files": self.sticker_file_manager.cache_stats(),
+            "background removal": self.sticker_artist.background_removal_stats(),
+            "translations": {
+                # achievement texts detected as english weren't sent to Google Translate
+                "skipped": self.sticker_artist.sticker_generator.translations_skipped,
+            },
+            "achievement generations": {
+                # awards that waited for the same achievement being generated in the chat
+                "coalesced": self.achievement_generations.coalesced,
+            },
+            "deep ai": self.sticker_artist.sticker_generator.deep_api.stats(),
+        }
+        upload_queue = self.sticker_file_manager.upload_queue
+        if upload_queue is not None:
+            stats["uploads"] = upload_queue.stats()
+        return stats
+
+    async def __on_shutdown(self, _: Application) -> None:
+        self.logger.info("Stats of the run: %s", json.dumps(self.__collect_stats()))
+        # the upload in progress is cancelled, it's replayed from the spool on the next start
+        await self.sticker_file_manager.stop()
+        if self.google_translate_api:
+            await self.google_translate_api.flush_hits()
+        if self.http_client:
+            await self.http_client.close()
+
     def run(self):
         """Handles bot initialization, binding all commands to their implementations and starting the Telegram bot"""
+        self.add_handlers()
+        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+    def add_handlers(self):
+        """Binds all commands to their implementations"""
         # admin-only commands
         self.application.add_handler(CommandHandler("ban", self.ban))
         self.application.add_handler(CommandHandler("unban", self.unban))
+        self.application.add_handler(CommandHandler("stats", self.stats))
 
         # sticker set owners-only commands
         self.application.add_handler(CommandHandler("reset", self.reset))
+        self.application.add_handler(CommandHandler("image_cache", self.image_cache))
+        self.application.add_handler(CommandHandler("reroll", self.reroll))
         
         # default commands
         self.application.add_handler(CommandHandler("start", self.start))
@@ -623,5 +829,3 @@ class Bot(BaseClass):
 
         # error handling
         self.application.add_error_handler(self.error_handler)
-
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -102,7 +102,9 @@ class StickerManager(BaseClass):
         context: CallbackContext
     ) -> str:
         """Increases counter on the achivement's description sticker by 1 and returns updated sticker's file_id"""
-        description_sticker = self.sticker_artist.draw_chat_description_sticker(description_sticker_engraving, times_achieved + 1)
+        description_sticker = await self.sticker_artist.draw_chat_description_sticker(
+            description_sticker_engraving, times_achieved + 1
+        )
 
         # replace old sticker with new one
         (sticker, context) = await self.telegram.replace_sticker_in_set(
@@ -133,6 +135,45 @@ class StickerManager(BaseClass):
 
         return sticker.file_id
 
+    async def replace_chat_achievement_sticker(
+        self,
+        achievement_sticker_info: ChatSticker,
+        achievement_sticker: tuple[str, bytes],
+        update: Update,
+        context: CallbackContext
+    ) -> str:
+        """
+        Replaces the achievement sticker in the chat's sticker set with another image and returns
+        file_id of the new sticker
+        """
+        (sticker, context) = await self.telegram.replace_sticker_in_set(
+            achievement_sticker_info.sticker_set_owner_id,
+            achievement_sticker_info.sticker_set_name,
+            achievement_sticker_info.file_id,
+            achievement_sticker_info.index_in_sticker_set,
+            achievement_sticker[1],
+            self.ACHIEVEMENT_EMOJI,
+            update,
+            context
+        )
+
+        # update sticker in the database, so the next awards use the new image
+        chat_sticker_to_update = ChatSticker(
+            file_id=sticker.file_id,
+            file_unique_id=sticker.file_unique_id,
+            type="achievement",
+            engraving_text=achievement_sticker_info.engraving_text,
+            times_achieved=achievement_sticker_info.times_achieved,
+            index_in_sticker_set=achievement_sticker_info.index_in_sticker_set,
+            chat_id=achievement_sticker_info.chat_id,
+            sticker_set_name=achievement_sticker_info.sticker_set_name,
+            sticker_set_owner_id=achievement_sticker_info.sticker_set_owner_id,
+            file_path=achievement_sticker[0]
+        )
+        self.database.create_chat_stickers_or_update_if_exist([chat_sticker_to_update])
+
+        return sticker.file_id
+
     async def add_user_stickers(
         self,
         stickers_owner: int,
@@ -150,7 +191,11 @@ class StickerManager(BaseClass):
         (user_stickers, session) = self.database.get_user_sticker_set_for_chat(user_id, chat_id)
 
         user_profile_sticker = await self.__create_profile_sticker(user_id, user_name, update, context)
-        user_profile_description_sticker  = self.sticker_artist.draw_persons_stickerset_description_sticker(user_name, chat_name)
+        user_profile_description_sticker = (
+            await self.sticker_artist.draw_persons_stickerset_description_sticker(
+                user_name, chat_name
+            )
+        )
         (user_sticker_set_name, stickers_to_add, last_achievement_index, context) = await self.__upload_stickers_to_stickerset(
             stickers_owner,
             user_stickers,
@@ -333,6 +378,6 @@ class StickerManager(BaseClass):
 
         # In case profile doesn't have any photos or the user doesn't allow ALL other users to see their profile photos - generate description instead
         if not profile_photo:
-            return self.sticker_artist.draw_sticker_from_username(f"@{user_username}")
+            return await self.sticker_artist.draw_sticker_from_username(f"@{user_username}")
 
-        return self.sticker_artist.draw_sticker_from_profile_picture(profile_photo)
\ No newline at end of file
+        return await self.sticker_artist.draw_sticker_from_profile_picture(profile_photo)
\ No newline at end of file
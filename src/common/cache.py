@@ -0,0 +1,180 @@
+"""
+This module defines in-memory and on-disk caches shared by other classes in the project
+"""
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry once it's full"""
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns cached value for the key (or default if there is none), marks it as used"""
+        if key not in self.__entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return self.__entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Caches the value for the key, evicting the least recently used entry if needed"""
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+
+    def remove(self, key: Hashable) -> None:
+        """Removes the entry of the key from the cache if it's cached"""
+        self.__entries.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+class BytesLRUCache:
+    """
+    In-memory cache of bytes that evicts the least recently used entries once the byte budget is
+    exceeded
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns cached bytes for the key (or None if there are none), marks them as used"""
+        value = self.__entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """Caches the bytes for the key, evicting the least recently used entries if needed"""
+        self.remove(key)
+        if len(value) > self.max_bytes:
+            return
+        self.__entries[key] = value
+        self.size_bytes += len(value)
+        while self.size_bytes > self.max_bytes:
+            (_, evicted) = self.__entries.popitem(last=False)
+            self.size_bytes -= len(evicted)
+
+    def remove(self, key: str) -> None:
+        """Removes the bytes of the key from the cache if they are cached"""
+        value = self.__entries.pop(key, None)
+        if value is not None:
+            self.size_bytes -= len(value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+class DiskCache:
+    """
+    On-disk cache of bytes with the total size limit, the least recently used files are evicted
+    first.
+
+    Files are named after the hash of the key and read through mmap. Entries left by the previous
+    runs are picked up on start, ordered by their modification time
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # file names to their sizes, in order of use
+        self.__entries: OrderedDict[str, int] = OrderedDict()
+
+        os.makedirs(self.directory, exist_ok=True)
+        existing_files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                existing_files.append((stat.st_mtime, entry.name, stat.st_size))
+        for (_, file_name, size) in sorted(existing_files):
+            self.__entries[file_name] = size
+            self.size_bytes += size
+        self.__evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns cached bytes for the key (or None if there are none), marks them as used"""
+        file_name = self.__file_name(key)
+        if file_name not in self.__entries:
+            self.misses += 1
+            return None
+        try:
+            with open(os.path.join(self.directory, file_name), "rb") as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                value = mapped_file[:]
+        except (OSError, ValueError):
+            # the file was removed externally (or is empty and can't be mapped)
+            self.size_bytes -= self.__entries.pop(file_name)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(file_name)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """Caches the bytes for the key, evicting the least recently used files if needed"""
+        if not value or len(value) > self.max_bytes:
+            return
+        self.remove(key)
+        file_name = self.__file_name(key)
+        file_path = os.path.join(self.directory, file_name)
+        # written to a temporary file first, so a half-written entry is never read
+        with open(f"{file_path}.tmp", "wb") as file:
+            file.write(value)
+        os.replace(f"{file_path}.tmp", file_path)
+        self.__entries[file_name] = len(value)
+        self.size_bytes += len(value)
+        self.__evict()
+
+    def remove(self, key: str) -> None:
+        """Removes the bytes of the key from the cache if they are cached"""
+        file_name = self.__file_name(key)
+        if file_name in self.__entries:
+            self.size_bytes -= self.__entries.pop(file_name)
+            self.__remove_file(file_name)
+
+    def __contains__(self, key: str) -> bool:
+        return self.__file_name(key) in self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __evict(self) -> None:
+        while self.size_bytes > self.max_bytes:
+            (file_name, size) = self.__entries.popitem(last=False)
+            self.size_bytes -= size
+            self.__remove_file(file_name)
+
+    def __remove_file(self, file_name: str) -> None:
+        try:
+            os.remove(os.path.join(self.directory, file_name))
+        except FileNotFoundError:
+            pass
+
+    def __file_name(self, key: str) -> str:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
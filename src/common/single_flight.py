@@ -0,0 +1,43 @@
+"""
+This module handles coalescing of concurrent work on the same key
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Hashable
+
+
+class SingleFlight:
+    """
+    Keeps at most one flight (block of work) per key in progress.
+
+    Callers entering a flight with a key that is already in progress wait for it to land
+    (successfully or not) and only then run their own block, which is expected to find and reuse
+    what the first flight produced
+    """
+
+    def __init__(self):
+        # futures resolved once the flight with the key lands
+        self.__flights: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0  # Number of callers that waited for a flight with the same key
+
+    @asynccontextmanager
+    async def flight(self, key: Hashable) -> AsyncIterator[bool]:
+        """
+        Waits for the flight with the key in progress if any, then runs the block. Yields whether it
+        waited
+        """
+        waited = False
+        while (in_flight := self.__flights.get(key)) is not None:
+            if not waited:
+                self.coalesced += 1
+                waited = True
+            # waiting doesn't cancel the flight if the caller is cancelled, nor raises its exception
+            await asyncio.wait([in_flight])
+
+        landed = asyncio.get_running_loop().create_future()
+        self.__flights[key] = landed
+        try:
+            yield waited
+        finally:
+            del self.__flights[key]
+            landed.set_result(None)
@@ -2,7 +2,10 @@
 This module serves as the entry point for the sticker bot application.
 The application initializes and binds together components for bot orchestration
 """
+import os
+
 from api.deepai import DeepAIAPI
+from api.http_client import HttpClient
 from api.translate import GoogleTranslateAPI
 
 from api.telegram import TelegramAPI
@@ -16,19 +19,32 @@ from message.filter import LanguageFilter
 from storage.postgres import PostgresDatabase
 from storage.s3 import ImageS3Storage
 
-from sticker.artist import StickerArtist
+from sticker.artist import StickerArtist, initialize_render_worker
 from sticker.generator import StickerGenerator
+from sticker.image_cache import GeneratedImageCache
+from sticker.render import RenderService
 
 
 if __name__ == "__main__":
     database = PostgresDatabase()
     sticker_file_manager = ImageS3Storage()
 
-    google_api = GoogleTranslateAPI()
-    deepai_api = DeepAIAPI()
+    http_client = HttpClient()
+    google_api = GoogleTranslateAPI(http_client, database)
+    deepai_api = DeepAIAPI(http_client)
     telegram_api = TelegramAPI()
     sticker_generator = StickerGenerator(google_api, deepai_api)
-    sticker_artist = StickerArtist(sticker_file_manager, sticker_generator)
+    # chat description layers are stored next to the stickers if enabled, so they survive restarts
+    persist_layers = os.environ.get('PERSIST_STICKER_LAYERS', 'false').lower() == 'true'
+    render_service = RenderService(initialize_render_worker, (persist_layers,))
+    image_cache = GeneratedImageCache(database, sticker_file_manager)
+    sticker_artist = StickerArtist(
+        sticker_file_manager,
+        sticker_generator,
+        render_service,
+        layer_storage=sticker_file_manager.backend if persist_layers else None,
+        image_cache=image_cache
+    )
 
     language_filter = LanguageFilter()
 
@@ -41,6 +57,11 @@ if __name__ == "__main__":
         language_filter,
         warning_processor,
         sticker_artist,
-        sticker_manager
+        sticker_manager,
+        http_client,
+        google_api
     )
+    sticker_artist.warm_up()
     bot.run()
+    render_service.shutdown()
+    sticker_file_manager.shutdown()
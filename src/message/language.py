@@ -0,0 +1,81 @@
+"""
+This module handles local detection of the language of achievement texts, so English texts are not
+translated
+"""
+import re
+from typing import Optional
+
+# Most frequent English words (mostly function words, which are present in almost any phrase)
+ENGLISH_WORDS = frozenset("""
+    a about above after again against all also always am an and any are as at be because been before
+    being best better between both but by can could day did do does doing done down during each ever
+    every few first for from further get getting got great had has have having he her here his how i
+    if in into is it its just last least made make making many me more most much my never new next
+    no nor not now of off often on once one only or other our out over own really same she should
+    since so some still such than that the their them then there these they this those through to
+    today too under until up us very was way we week were what when where which while who whole why
+    will with without would year you your
+""".split())
+# Most frequent Spanish words, which would otherwise pass as English since they're written in latin
+# script
+SPANISH_WORDS = frozenset("""
+    al algo como con cuando de del el ella en entre era es esta este esto fue hay la las le lo los
+    mas me mejor mi muy nada ni no nos para pero por porque que se ser si sin sobre su sus tambien
+    te todo todos tu un una uno unos y ya yo
+""".split())
+# English word endings, which let phrases without function words ("fixing coffee machine") be
+# recognized
+ENGLISH_SUFFIXES = ("ing", "tion", "ness", "ship", "ful", "ment")
+SPANISH_CHARACTERS = frozenset("ñáéíóúü¿¡")
+
+# Words that don't change what a prompt is about, so prompts differing only in them share the
+# generated image
+PROMPT_STOPWORDS = frozenset(
+    "a an and at by for in its my of on our the their this that to with your".split()
+)
+
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+
+def detect_language(text: str) -> Optional[str]:
+    """
+    Returns 'en', 'ru' or 'es' if the language of the text is clear, None otherwise.
+
+    Script is checked first: any cyrillic letter means Russian and any letter outside of ASCII means
+    the text is not English. Texts in latin script are told apart by frequent English and Spanish
+    words
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return None
+
+    letters = ''.join(words)
+    if any('а' <= letter <= 'я' or letter == 'ё' for letter in letters):
+        return "ru"
+    if any(letter in SPANISH_CHARACTERS for letter in letters):
+        return "es"
+    if not letters.isascii():
+        return None
+
+    english_score = sum(
+        1 for word in words
+        if word in ENGLISH_WORDS or (len(word) > 5 and word.endswith(ENGLISH_SUFFIXES))
+    )
+    spanish_score = sum(1 for word in words if word in SPANISH_WORDS)
+    if english_score > spanish_score:
+        return "en"
+    if spanish_score > english_score:
+        return "es"
+    return None
+
+
+def is_english(text: str) -> bool:
+    """Returns True if the text is clearly written in English"""
+    return detect_language(text) == "en"
+
+
+def normalize_prompt(text: str) -> str:
+    """Returns english prompt lowercased, without punctuation and stopwords, whitespace collapsed"""
+    return ' '.join(
+        word for word in re.findall(r"\w+", text.lower()) if word not in PROMPT_STOPWORDS
+    )
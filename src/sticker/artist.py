@@ -1,18 +1,34 @@
+import asyncio
+from collections import Counter, deque
 from enum import Enum
+import hashlib
 import io
+import itertools
 import math
+import os
 import random
+import time
+from typing import Optional
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+from common.cache import LRUCache
 from common.common import BaseClass
+from common.exceptions import ImageS3StorageError
 
 from rembg import remove
+from rembg.sessions.base import BaseSession
 
 from sticker.generator import StickerGenerator
+from sticker.image_cache import GeneratedImageCache
+from sticker.render import ImageBuffer, RenderService
+from storage.backend import StorageBackend
 from storage.s3 import ImageS3Storage
 
-from sticker.util import is_image_suitable_for_achievement
+from sticker.util import (
+    achievement_score, new_background_removal_session, remove_white_background
+)
 
 class StickerType(Enum):
     EMPTY = 1
@@ -37,77 +53,188 @@ class StickerArtist(BaseClass):
     FONT_PATH = "../resources/GothamProBlack.ttf"
     # With {FONT_SIZE}, the maximum characters that would fit into line without new spaces
     MAX_SYMBOLS_IN_LINE = 25
-    EMPTY_STICKER_PATH = "sticker_files/empty.png"
-
-    def __init__(self, sticker_file_manager: ImageS3Storage, sticker_generator: StickerGenerator):
+    # Extension of the empty sticker follows the format of the sticker encoder
+    EMPTY_STICKER_PATH_WITHOUT_EXTENSION = "sticker_files/empty"
+    # Levels of the description sticker palette (quantized, so their backgrounds could be cached)
+    DESCRIPTION_COLOR_LEVELS = (60, 115, 170)
+    BACKGROUND_CACHE_SIZE = 32  # Maximum number of gradient backgrounds kept in memory
+    LAYER_CACHE_SIZE = 64  # Maximum number of chat description layers kept in memory
+    LAYOUT_CACHE_SIZE = 1024  # Maximum number of text layouts kept in memory
+    LAYERS_PREFIX = "sticker_layers"
+    DEFAULT_REMBG_MODEL = "u2net"  # Model used to remove background from generated images
+    DEFAULT_REMBG_INTRA_OP_THREADS = 2  # Threads used to parallelize a single inference
+    DEFAULT_REMBG_INTER_OP_THREADS = 1  # Threads used to run independent parts of the model
+    TIMINGS_HISTORY_SIZE = 1000  # Number of latest background removal timings kept
+    # Number of prompts whose not chosen candidate images are kept for re-roll
+    RUNNERS_UP_CACHE_SIZE = 16
+
+    def __init__(
+        self,
+        sticker_file_manager: ImageS3Storage,
+        sticker_generator: StickerGenerator,
+        render_service: RenderService = None,
+        layer_storage: StorageBackend = None,
+        image_cache: GeneratedImageCache = None
+    ):
         super().__init__()
         self.sticker_file_manager = sticker_file_manager
         self.sticker_generator = sticker_generator
+        # if not set or disabled, stickers are rendered in this process
+        self.render_service = render_service
+        self.rembg_session: BaseSession = None
+        # one of REMBG_MODELS (for 'u2net_custom', e.g. int8-quantized export, path to ONNX file
+        # is required)
+        self.rembg_model = os.environ.get('REMBG_MODEL', self.DEFAULT_REMBG_MODEL)
+        self.rembg_model_path = os.environ.get('REMBG_MODEL_PATH')
+        self.rembg_intra_op_threads = int(
+            os.environ.get('REMBG_INTRA_OP_THREADS', self.DEFAULT_REMBG_INTRA_OP_THREADS)
+        )
+        self.rembg_inter_op_threads = int(
+            os.environ.get('REMBG_INTER_OP_THREADS', self.DEFAULT_REMBG_INTER_OP_THREADS)
+        )
+        # durations of the latest background removals in milliseconds
+        self.background_removal_timings = deque(maxlen=self.TIMINGS_HISTORY_SIZE)
+        # how many times each way of background removal was taken ('white-background', 'model',
+        # 'none')
+        self.background_removal_paths = Counter()
+        # if set, chat description layers are also stored there to survive restarts
+        self.layer_storage = layer_storage
+        # if set, images generated for achievements are reused across chats
+        self.image_cache = image_cache
+        # suitable candidate images that were not chosen, best first, by (chat ID, prompt)
+        self.__runners_up = LRUCache(self.RUNNERS_UP_CACHE_SIZE)
+        # gradient stickers only differ in colors, so the geometry is computed once
+        (self.__circle_pixels, self.__distance_to_center) = self.__generate_radial_distance_field()
+        # pre-rendered gradient backgrounds by (inner color, outer color)
+        self.__backgrounds = LRUCache(self.BACKGROUND_CACHE_SIZE)
+        # "background + arc + engraving" layers of chat description stickers by engraving
+        self.__chat_description_layers = LRUCache(self.LAYER_CACHE_SIZE)
+        # fonts by (font path, font size), parsed once instead of on every draw
+        self.__fonts = {
+            (self.FONT_PATH, font_size): ImageFont.truetype(self.FONT_PATH, font_size)
+            for font_size in (self.FONT_SIZE, self.NUMBER_FONT_SIZE)
+        }
+        # wrapped lines and bounding boxes by (text, margin, font size)
+        self.__text_layouts = LRUCache(self.LAYOUT_CACHE_SIZE)
+        self.__warm_up_backgrounds()
+        self.empty_sticker_path = None
+        if self.sticker_file_manager:
+            self.empty_sticker_path = (
+                f"{self.EMPTY_STICKER_PATH_WITHOUT_EXTENSION}."
+                f"{self.sticker_file_manager.encoder.extension}"
+            )
+            # empty sticker never changes and is used for 8 to 9 slots of every new row of
+            # a stickerset
+            self.sticker_file_manager.pin(self.empty_sticker_path)
+
+    def warm_up(self) -> None:
+        """
+        Prepares rendering before the bot starts: starts render workers or loads the model, loads
+        pinned assets
+        """
+        if self.render_service and self.render_service.enabled:
+            self.render_service.warm_up()
+        else:
+            self.load_background_removal_model()
+        if self.sticker_file_manager:
+            self.sticker_file_manager.warm_up()
+            # generates and uploads the empty sticker if it doesn't exist yet
+            self.get_empty_sticker()
+
+    def background_removal_stats(self) -> dict[str, float]:
+        """Returns statistics of the latest background removal timings in milliseconds"""
+        timings = sorted(self.background_removal_timings)
+        if not timings:
+            return {"count": 0, "paths": dict(self.background_removal_paths)}
+        return {
+            "paths": dict(self.background_removal_paths),
+            "count": len(timings),
+            "mean": sum(timings) / len(timings),
+            "p50": timings[len(timings) // 2],
+            "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            "max": timings[-1],
+        }
 
     def get_empty_sticker(self) -> tuple[str, bytes]:
         """Gets an empty achievement sticker"""
         try:
-            file_bytes = self.sticker_file_manager.get_bytes_from_path(self.EMPTY_STICKER_PATH)
-            return self.EMPTY_STICKER_PATH, file_bytes
+            file_bytes = self.sticker_file_manager.get_bytes_from_path(self.empty_sticker_path)
+            return self.empty_sticker_path, file_bytes
         except FileNotFoundError:
             return self.__generate_empty_sticker()
 
-    def draw_description_sticker(self, description: str) -> tuple[str, bytes]:
+    async def draw_description_sticker(self, description: str) -> tuple[str, bytes]:
         """Draws a description sticker for achievement"""
-        # Choosing pleasant color palette
-        red_color = random.randint(60, 170)
-        green_color = random.randint(60, 170)
-        blue_color = random.randint(60, 170)
+        image = await self.__render("render_description_sticker", description)
+        return await self.sticker_file_manager.save(image)
 
-        image = self.__generate_sticker_of_gradient(
-            (red_color, green_color, blue_color),
-            self.OUTER_GROUP_STICKER_COLOR
-        )
-        image = self.__add_text_on_sticker(image, description, 0)
-        return self.sticker_file_manager.save_and_convert_to_bytes(image)
-
-    def draw_chat_description_sticker(
+    async def draw_chat_description_sticker(
         self,
         description: str,
         number_of_people_achieved: int
     ) -> tuple[str, bytes]:
         """Draws a description sticker for achievement with number of people achieved it"""
-        image = self.__generate_sticker_of_gradient(
-            self.INNER_GROUP_STICKER_COLOR,
-            self.OUTER_GROUP_STICKER_COLOR
+        image = await self.__render(
+            "render_chat_description_sticker", description, number_of_people_achieved
         )
-        image = self.__add_number_with_arc_on_sticker(image, number_of_people_achieved)
-        image = self.__add_text_on_sticker(image, description, 2 * (1 - self.STICKER_ARC_MARGIN))
-        return self.sticker_file_manager.save_and_convert_to_bytes(image)
+        return await self.sticker_file_manager.save(image)
 
     async def draw_sticker_from_prompt(self, prompt: str) -> tuple[str, bytes]:
         """Draws a achievement sticker from prompt"""
-        # Note: during local development you can change it to
-        # image = self.__generate_sticker_of_random_color()
-        # image = self.__add_text_on_sticker(image, f"picture about {prompt}", 0)
-        image = await self.sticker_generator.generate_image(prompt)
-        image_without_bg = remove(image)
-        if is_image_suitable_for_achievement(image_without_bg):
-            image = image_without_bg
-        return self.sticker_file_manager.save_and_convert_to_bytes(image)
+        image = await self.__render_sticker_from_prompt(prompt)
+        return await self.sticker_file_manager.save(image)
+
+    async def draw_rerolled_sticker_from_prompt(
+        self,
+        prompt: str,
+        chat_id: int = None
+    ) -> Optional[tuple[str, bytes]]:
+        """
+        Draws achievement sticker from the next best candidate generated for prompt in the chat,
+        None if there are no more
+        """
+        key = (chat_id, prompt)
+        runners_up = self.__runners_up.get(key)
+        if not runners_up:
+            return None
+        (image, runners_up) = (runners_up[0], runners_up[1:])
+        if runners_up:
+            self.__runners_up.put(key, runners_up)
+        else:
+            self.__runners_up.remove(key)
+        return await self.sticker_file_manager.save(image)
+
+    async def draw_achievement_stickers(
+        self,
+        prompt: str,
+        chat_id: int = None
+    ) -> tuple[tuple[str, bytes], tuple[str, bytes], tuple[str, bytes]]:
+        """
+        Draws achievement sticker from prompt with its chat description and user description
+        stickers. Stickers are rendered and uploaded concurrently, image generated for the same
+        prompt in another chat is reused unless the chat opted out
+        """
+        images = await asyncio.gather(
+            self.__render_sticker_from_prompt(prompt, chat_id),
+            self.__render("render_chat_description_sticker", prompt, 1),
+            self.__render("render_description_sticker", prompt)
+        )
+        (achievement_sticker, chat_description_sticker, user_description_sticker) = (
+            await self.sticker_file_manager.save_many([(image, False) for image in images])
+        )
+        return achievement_sticker, chat_description_sticker, user_description_sticker
 
-    def draw_sticker_from_profile_picture(self, image: bytes) -> tuple[str, bytes]:
+    async def draw_sticker_from_profile_picture(self, image: bytes) -> tuple[str, bytes]:
         """Draws a sticker from profile picture"""
-        image = Image.open(io.BytesIO(image))
-        image = self.__expand2square(
-            image,
-            self.CIRCLE_COLOR
-        ).resize((self.WIDTH, self.HEIGHT), Image.LANCZOS)
-        image = self.__mask_circle_transparent(image)
-        return self.sticker_file_manager.save_and_convert_to_bytes(image)
+        image = await self.__render("render_sticker_from_profile_picture", image)
+        return await self.sticker_file_manager.save(image)
 
-    def draw_sticker_from_username(self, username: str) -> tuple[str, bytes]:
+    async def draw_sticker_from_username(self, username: str) -> tuple[str, bytes]:
         """Draws a sticker from username"""
-        image = self.__generate_sticker_of_random_color()
-        image = self.__add_text_on_sticker(image, username, 0)
-        return self.sticker_file_manager.save_and_convert_to_bytes(image)
+        image = await self.__render("render_sticker_from_username", username)
+        return await self.sticker_file_manager.save(image, flat=True)
 
-    def draw_persons_stickerset_description_sticker(
+    async def draw_persons_stickerset_description_sticker(
         self,
         username: str,
         chat_name: str
@@ -115,11 +242,180 @@ class StickerArtist(BaseClass):
         """Draws description sticker for persons stickerset"""
         description = f"Stickerset of @{username}'s achievements for chat \'{chat_name}\'"
         # TODO: make number the place in total amount of achievements in group
-        return self.draw_chat_description_sticker(description, 1)
+        return await self.draw_chat_description_sticker(description, 1)
+
+    def render_description_sticker(self, description: str) -> Image:
+        """Renders a description sticker for achievement"""
+        # Choosing pleasant color palette
+        red_color = random.choice(self.DESCRIPTION_COLOR_LEVELS)
+        green_color = random.choice(self.DESCRIPTION_COLOR_LEVELS)
+        blue_color = random.choice(self.DESCRIPTION_COLOR_LEVELS)
+
+        image = self.__get_background_of_gradient(
+            (red_color, green_color, blue_color),
+            self.OUTER_GROUP_STICKER_COLOR
+        )
+        return self.__add_text_on_sticker(image, description, 0)
+
+    def render_chat_description_sticker(
+        self,
+        description: str,
+        number_of_people_achieved: int
+    ) -> Image:
+        """Renders a description sticker for achievement with number of people achieved it"""
+        # only the counter changes between re-awards, so everything else is drawn once per engraving
+        image = self.__get_chat_description_layer(description)
+        return self.__add_number_on_sticker(image, number_of_people_achieved)
+
+    def render_sticker_without_background(self, image: Image) -> Image:
+        """Removes the background of generated image if the result is suitable for achievement"""
+        return self.render_candidate_without_background(image)[0]
+
+    def render_candidate_without_background(self, image: Image) -> tuple[Image, float]:
+        """
+        Removes the background of generated image if the result is suitable for achievement,
+        returns the image and its achievement score (0 if the background was kept)
+        """
+        # images are generated on white background, so usually flood fill from the edges is enough
+        image_without_bg = remove_white_background(image)
+        if image_without_bg is not None:
+            score = achievement_score(image_without_bg)
+            if score > 0:
+                self.background_removal_paths["white-background"] += 1
+                return image_without_bg, score
+
+        session = self.load_background_removal_model()
+        start = time.perf_counter()
+        image_without_bg = remove(image, session=session)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.background_removal_timings.append(elapsed_ms)
+        self.logger.info("[ARTIST] background removal took %.0f ms", elapsed_ms)
+        score = achievement_score(image_without_bg)
+        if score > 0:
+            self.background_removal_paths["model"] += 1
+            return image_without_bg, score
+        self.background_removal_paths["none"] += 1
+        return image, 0.0
+
+    def render_sticker_from_profile_picture(self, image: bytes) -> Image:
+        """Renders a sticker from profile picture"""
+        image = Image.open(io.BytesIO(image))
+        image = self.__expand2square(
+            image,
+            self.CIRCLE_COLOR
+        ).resize((self.WIDTH, self.HEIGHT), Image.LANCZOS)
+        return self.__mask_circle_transparent(image)
+
+    def render_sticker_from_username(self, username: str) -> Image:
+        """Renders a sticker from username"""
+        image = self.__generate_sticker_of_random_color()
+        return self.__add_text_on_sticker(image, username, 0)
+
+    def render_empty_sticker(self) -> Image:
+        """Renders an empty achievement sticker"""
+        return self.__generate_sticker_of_color(self.DEFAULT_CIRCLE_COLOR)
+
+    def load_background_removal_model(self) -> BaseSession:
+        """Returns rembg session, loading and warming up its model on the first call"""
+        if self.rembg_session is None:
+            start = time.perf_counter()
+            self.rembg_session = new_background_removal_session(
+                self.rembg_model,
+                self.rembg_intra_op_threads,
+                self.rembg_inter_op_threads,
+                self.rembg_model_path
+            )
+            # the first inference is much slower than the rest, so it's done on a dummy image
+            remove(
+                Image.new("RGB", (self.WIDTH, self.HEIGHT), self.CIRCLE_COLOR[:3]),
+                session=self.rembg_session
+            )
+            self.logger.info(
+                "Background removal model %s was loaded in %.0f ms "
+                "(intra-op threads: %d, inter-op threads: %d)",
+                self.rembg_model,
+                (time.perf_counter() - start) * 1000,
+                self.rembg_intra_op_threads,
+                self.rembg_inter_op_threads
+            )
+        return self.rembg_session
+
+    async def __render(self, method_name: str, *args):
+        """
+        Invokes one of render_* methods in a render worker (or in this process without them),
+        returns its result
+        """
+        if not self.render_service or not self.render_service.enabled:
+            return getattr(self, method_name)(*args)
+
+        args = tuple(
+            ImageBuffer.from_image(arg) if isinstance(arg, Image.Image) else arg for arg in args
+        )
+        (
+            result,
+            background_removal_timings,
+            background_removal_paths
+        ) = await self.render_service.run(render_in_worker, method_name, *args)
+        self.background_removal_timings.extend(background_removal_timings)
+        self.background_removal_paths.update(background_removal_paths)
+        if isinstance(result, tuple):
+            return tuple(
+                value.to_image() if isinstance(value, ImageBuffer) else value for value in result
+            )
+        return result.to_image()
+
+    async def __render_sticker_from_prompt(self, prompt: str, chat_id: int = None) -> Image:
+        # Note: during local development you can change it to
+        # image = self.__generate_sticker_of_random_color()
+        # image = self.__add_text_on_sticker(image, f"picture about {prompt}", 0)
+        use_image_cache = (
+            self.image_cache is not None
+            and chat_id is not None
+            and await self.image_cache.is_enabled_for(chat_id)
+        )
+        prompt_in_en = await self.sticker_generator.translate(prompt)
+        if use_image_cache:
+            image = await self.image_cache.get(prompt_in_en)
+            if image is not None:
+                return image
+
+        images = await self.sticker_generator.generate_image_candidates_from_translation(
+            prompt_in_en
+        )
+        (image, suitable) = await self.__render_best_candidate(images, (chat_id, prompt))
+        # image that kept its background is only a fallback, other chats get a new try
+        if use_image_cache and suitable:
+            await self.image_cache.put(prompt_in_en, image)
+        return image
+
+    async def __render_best_candidate(
+        self,
+        images: list[Image.Image],
+        runners_up_key: tuple
+    ) -> tuple[Image, bool]:
+        """
+        Removes background of all candidates at once (in parallel with render workers), returns
+        the one with the highest score and whether its background was removed. Other suitable
+        candidates are kept for re-roll
+        """
+        candidates = await asyncio.gather(
+            *(self.__render("render_candidate_without_background", image) for image in images)
+        )
+        # candidates that kept their background keep their order in the grid
+        candidates = sorted(candidates, key=lambda candidate: candidate[1], reverse=True)
+        runners_up = [image for (image, score) in candidates[1:] if score > 0]
+        if runners_up:
+            self.__runners_up.put(runners_up_key, runners_up)
+        else:
+            self.__runners_up.remove(runners_up_key)
+        (image, score) = candidates[0]
+        return image, score > 0
 
     def __generate_empty_sticker(self) -> tuple[str, bytes]:
-        image = self.__generate_sticker_of_color(self.DEFAULT_CIRCLE_COLOR)
-        return self.sticker_file_manager.save_and_convert_to_bytes(image, self.EMPTY_STICKER_PATH)
+        image = self.render_empty_sticker()
+        return self.sticker_file_manager.save_and_convert_to_bytes(
+            image, self.empty_sticker_path, flat=True
+        )
 
     def __expand2square(self, image: Image, background_color) -> Image:
         width, height = image.size
@@ -165,49 +461,126 @@ class StickerArtist(BaseClass):
         )
         return image
 
-    def __generate_sticker_of_gradient(self, inner_color, outer_color) -> Image:
-        image = Image.new("RGBA", (self.WIDTH, self.HEIGHT), self.BACKGROUND_COLOR)
+    def __generate_radial_distance_field(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns flat indices of the pixels inside of the circle and their distances to center"""
+        y, x = np.mgrid[0:self.HEIGHT, 0:self.WIDTH].astype(np.float64)
+        x_to_center = (x - self.WIDTH / 2).ravel()
+        y_to_center = (y - self.HEIGHT / 2).ravel()
 
-        for y in range(self.HEIGHT):
-            for x in range(self.WIDTH):
-                # Find the distance to the center
-                distance_to_center = math.sqrt(
-                    (x - self.WIDTH / 2) ** 2 + (y - self.HEIGHT / 2) ** 2)
+        # Find the distance to the center
+        distance_to_center = np.sqrt(x_to_center ** 2 + y_to_center ** 2)
 
-                # Make it on a scale from 0 to 1
-                distance_to_center = float(distance_to_center) / (math.sqrt(2) * self.WIDTH / 2)
+        # Make it on a scale from 0 to 1
+        distance_to_center = distance_to_center / (math.sqrt(2) * self.WIDTH / 2)
 
-                # Calculate r, g, and b values
-                r = outer_color[0] * distance_to_center + inner_color[0] * (1 - distance_to_center)
-                g = outer_color[1] * distance_to_center + inner_color[1] * (1 - distance_to_center)
-                b = outer_color[2] * distance_to_center + inner_color[2] * (1 - distance_to_center)
+        # Only the pixels inside of the circle are placed
+        squares_sum = x_to_center * x_to_center + y_to_center * y_to_center
+        circle_pixels = np.flatnonzero(squares_sum <= self.WIDTH * self.WIDTH / 4)
 
-                # Place the pixel
-                x_to_center = x - self.WIDTH / 2
-                y_to_center = y - self.HEIGHT / 2
-                squares_sum = x_to_center * x_to_center + y_to_center * y_to_center
-                if squares_sum <= self.WIDTH * self.WIDTH / 4:
-                    image.putpixel((x, y), (int(r), int(g), int(b)))
+        return circle_pixels, distance_to_center[circle_pixels]
 
-        return image
+    def __warm_up_backgrounds(self) -> None:
+        """Pre-renders backgrounds of chat description sticker and of all description palettes"""
+        self.__get_background_of_gradient(
+            self.INNER_GROUP_STICKER_COLOR,
+            self.OUTER_GROUP_STICKER_COLOR
+        )
+        for inner_color in itertools.product(self.DESCRIPTION_COLOR_LEVELS, repeat=3):
+            self.__get_background_of_gradient(inner_color, self.OUTER_GROUP_STICKER_COLOR)
+        self.logger.info("%d gradient backgrounds were pre-rendered", len(self.__backgrounds))
+
+    def __get_background_of_gradient(self, inner_color, outer_color) -> Image:
+        """Returns a copy of the gradient background, rendering it only if it's not cached"""
+        key = (tuple(inner_color), tuple(outer_color))
+        background = self.__backgrounds.get(key)
+        if background is None:
+            background = self.__generate_sticker_of_gradient(inner_color, outer_color)
+            self.__backgrounds.put(key, background)
+        return background.copy()
+
+    def __get_chat_description_layer(self, description: str) -> Image:
+        """Returns a copy of the chat description sticker without the counter"""
+        layer = self.__chat_description_layers.get(description)
+        if layer is None:
+            layer = self.__load_chat_description_layer(description)
+            self.__chat_description_layers.put(description, layer)
+        return layer.copy()
+
+    def __load_chat_description_layer(self, description: str) -> Image:
+        layer_path = self.__chat_description_layer_path(description)
+        if self.layer_storage:
+            try:
+                layer_bytes = self.layer_storage.get(layer_path)
+                layer = Image.open(io.BytesIO(layer_bytes))
+                layer.load()
+                return layer
+            except FileNotFoundError:
+                pass
+            except ImageS3StorageError as e:
+                # the layer is only an optimization, the sticker is drawn without it
+                self.logger.error("Failed to load layer '%s', drawing it again: %s", layer_path, e)
+
+        layer = self.__get_background_of_gradient(
+            self.INNER_GROUP_STICKER_COLOR,
+            self.OUTER_GROUP_STICKER_COLOR
+        )
+        layer = self.__add_arc_on_sticker(layer)
+        layer = self.__add_text_on_sticker(layer, description, 2 * (1 - self.STICKER_ARC_MARGIN))
+
+        if self.layer_storage:
+            # layers are drawn on later, so they are always stored losslessly regardless of
+            # the sticker encoder
+            buf = io.BytesIO()
+            layer.save(buf, format='PNG')
+            try:
+                self.layer_storage.put(layer_path, buf.getvalue())
+            except ImageS3StorageError as e:
+                self.logger.error("Failed to persist layer '%s': %s", layer_path, e)
+        return layer
+
+    def __chat_description_layer_path(self, description: str) -> str:
+        description_hash = hashlib.sha256(description.encode('utf-8')).hexdigest()
+        return f"{self.LAYERS_PREFIX}/{description_hash}.png"
 
-    def __add_text_on_sticker(self, image: Image, text: str, margin_to_leave: float) -> Image:
-        description = self.__adapt_text_to_fit_circle(text, margin_to_leave)
-        font = ImageFont.truetype(self.FONT_PATH, self.FONT_SIZE)
+    def __generate_sticker_of_gradient(self, inner_color, outer_color) -> Image:
+        distance_to_center = self.__distance_to_center
+
+        # Calculate r, g, and b values for all pixels of the circle at once
+        circle = np.empty((len(self.__circle_pixels), 4), dtype=np.uint8)
+        for channel in range(3):
+            circle[:, channel] = (
+                outer_color[channel] * distance_to_center
+                + inner_color[channel] * (1 - distance_to_center)
+            )
+        circle[:, 3] = 255
 
+        # Place the pixels
+        pixels = np.empty((self.WIDTH * self.HEIGHT, 4), dtype=np.uint8)
+        pixels[:] = self.BACKGROUND_COLOR
+        pixels[self.__circle_pixels] = circle
+
+        # RGBA is inferred from the four uint8 channels
+        return Image.fromarray(pixels.reshape((self.HEIGHT, self.WIDTH, 4)))
+
+    def __add_text_on_sticker(self, image: Image, text: str, margin_to_leave: float) -> Image:
         draw = ImageDraw.Draw(image)
-        textbbox_val = draw.textbbox((0, 0), description, font=font)
+        (description, textbbox_val) = self.__layout_text(
+            draw, text, margin_to_leave, self.FONT_SIZE
+        )
         text_width = textbbox_val[2] - textbbox_val[0]
         text_height = textbbox_val[3] - textbbox_val[1]
         text_position = ((self.WIDTH - text_width) // 2, (self.HEIGHT - text_height) // 2)
 
-        draw.text(text_position, description, fill=self.TEXT_COLOR, font=font)
+        draw.text(
+            text_position,
+            description,
+            fill=self.TEXT_COLOR,
+            font=self.__get_font(self.FONT_SIZE)
+        )
         return image
 
-    def __add_number_with_arc_on_sticker(self, image: Image, number: int) -> Image:
+    def __add_arc_on_sticker(self, image: Image) -> Image:
         draw = ImageDraw.Draw(image)
-
-        # drawing arc part
         draw.arc(
             [
                 self.HEIGHT * (1 - self.STICKER_ARC_MARGIN),
@@ -219,11 +592,13 @@ class StickerArtist(BaseClass):
             end=70,
             fill=self.TEXT_COLOR,
             width=self.STICKER_ARC_WIDTH)
+        return image
 
-        # drawing number_part
-        font = ImageFont.truetype(self.FONT_PATH, self.NUMBER_FONT_SIZE)
-
-        textbbox_val = draw.textbbox((0, 0), str(number), font=font)
+    def __add_number_on_sticker(self, image: Image, number: int) -> Image:
+        draw = ImageDraw.Draw(image)
+        (number_text, textbbox_val) = self.__layout_text(
+            draw, str(number), 0, self.NUMBER_FONT_SIZE
+        )
         text_width = textbbox_val[2] - textbbox_val[0]
         text_height = textbbox_val[3] - textbbox_val[1]
         text_position = (
@@ -231,9 +606,38 @@ class StickerArtist(BaseClass):
             self.HEIGHT * self.STICKER_ARC_MARGIN - text_height
         )
 
-        draw.text(text_position, str(number), fill=self.TEXT_COLOR, font=font)
+        draw.text(
+            text_position,
+            number_text,
+            fill=self.TEXT_COLOR,
+            font=self.__get_font(self.NUMBER_FONT_SIZE)
+        )
         return image
 
+    def __get_font(self, font_size: int) -> ImageFont.FreeTypeFont:
+        font = self.__fonts.get((self.FONT_PATH, font_size))
+        if font is None:
+            font = ImageFont.truetype(self.FONT_PATH, font_size)
+            self.__fonts[(self.FONT_PATH, font_size)] = font
+        return font
+
+    def __layout_text(
+        self,
+        draw: ImageDraw.ImageDraw,
+        text: str,
+        margin_to_leave: float,
+        font_size: int
+    ) -> tuple[str, tuple[int, int, int, int]]:
+        """Returns text wrapped to fit in the circle and its bounding box, reusing the layouts"""
+        key = (text, margin_to_leave, font_size)
+        layout = self.__text_layouts.get(key)
+        if layout is None:
+            wrapped_text = self.__adapt_text_to_fit_circle(text, margin_to_leave)
+            textbbox_val = draw.textbbox((0, 0), wrapped_text, font=self.__get_font(font_size))
+            layout = (wrapped_text, textbbox_val)
+            self.__text_layouts.put(key, layout)
+        return layout
+
     def __adapt_text_to_fit_circle(self, description: str, margin_to_leave: float) -> str:
         """adapt text to fit in the circle"""
         max_symbols = self.MAX_SYMBOLS_IN_LINE * (1 - margin_to_leave)
@@ -252,3 +656,44 @@ class StickerArtist(BaseClass):
                 else:
                     description += word + " "
         return description
+
+
+# StickerArtist of the render worker process (look at RenderService for more details)
+_worker_sticker_artist: StickerArtist = None
+
+def initialize_render_worker(persist_layers: bool = False) -> None:
+    """Prepares render worker process: loads fonts, backgrounds and background removal model"""
+    global _worker_sticker_artist # pylint: disable=global-statement
+    # workers only need to read and write layers, so they don't get caches and uploads queue of
+    # the bot
+    layer_storage = ImageS3Storage.new_backend() if persist_layers else None
+    _worker_sticker_artist = StickerArtist(None, None, layer_storage=layer_storage)
+    try:
+        _worker_sticker_artist.load_background_removal_model()
+    except Exception as e: # pylint: disable=broad-exception-caught
+        # failing initializer breaks the whole pool, so the model would be loaded on first use
+        # instead
+        _worker_sticker_artist.logger.error("Failed to load background removal model: %s", str(e))
+
+def render_in_worker(method_name: str, *args) -> tuple[object, list[float], Counter]:
+    """
+    Invokes one of StickerArtist's render_* methods in the render worker process.
+
+    Returns rendered image (or tuple of the image and other values of the method) with background
+    removal timings and paths collected since the previous call
+    """
+    args = tuple(arg.to_image() if isinstance(arg, ImageBuffer) else arg for arg in args)
+    result = getattr(_worker_sticker_artist, method_name)(*args)
+
+    background_removal_timings = list(_worker_sticker_artist.background_removal_timings)
+    _worker_sticker_artist.background_removal_timings.clear()
+    background_removal_paths = _worker_sticker_artist.background_removal_paths.copy()
+    _worker_sticker_artist.background_removal_paths.clear()
+    if isinstance(result, tuple):
+        result = tuple(
+            ImageBuffer.from_image(value) if isinstance(value, Image.Image) else value
+            for value in result
+        )
+    else:
+        result = ImageBuffer.from_image(result)
+    return result, background_removal_timings, background_removal_paths
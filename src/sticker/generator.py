@@ -1,6 +1,8 @@
 """
 This module handles all AI sticker generation process
 """
+import re
+
 from PIL import Image
 
 from api.deepai import DeepAIAPI
@@ -8,6 +10,7 @@ from api.translate import GoogleTranslateAPI
 
 from common.common import BaseClass
 from common.exceptions import StickerGeneratorError
+from message.language import is_english
 
 class StickerGenerator(BaseClass):
     """
@@ -19,6 +22,8 @@ class StickerGenerator(BaseClass):
         super().__init__()
         self.google_translate_api = google_translate_api
         self.deep_api = deep_api
+        # number of achievement texts that were detected as english and not sent to Google Translate
+        self.translations_skipped = 0
 
     async def generate_image(self, achievement_text: str) -> Image:
         """Generates image from text using Google Translate API and Deep AI API
@@ -26,15 +31,44 @@ class StickerGenerator(BaseClass):
         Throws StickerGeneratorError if there were problems during invocation
             of either of these APIs
         """
-        # Translate achievement text to english
-        try:
-            achievement_text_in_en = await self.google_translate_api.translate(achievement_text)
-        except Exception as e:
-            self.logger.error(str(e))
-            raise StickerGeneratorError(
-                "Problem appeared during Google Translate API invocation", "google-api", str(e)
-            ) from e
+        achievement_text_in_en = await self.translate(achievement_text)
+        return await self.generate_image_from_translation(achievement_text_in_en)
+
+    async def translate(self, achievement_text: str) -> str:
+        """Translates achievement text to english using Google Translate API
 
+        Throws StickerGeneratorError if there were problems during invocation of the API
+        """
+        # Translate achievement text to english, unless it's clearly english already
+        if is_english(achievement_text):
+            self.translations_skipped += 1
+            achievement_text_in_en = re.sub(r'[^\w\s]', '', achievement_text)
+        else:
+            try:
+                achievement_text_in_en = await self.google_translate_api.translate(achievement_text)
+            except Exception as e:
+                self.logger.error(str(e))
+                raise StickerGeneratorError(
+                    "Problem appeared during Google Translate API invocation", "google-api", str(e)
+                ) from e
+        return achievement_text_in_en
+
+    async def generate_image_from_translation(self, achievement_text_in_en: str) -> Image:
+        """Generates image from achievement text translated to english using Deep AI API
+
+        Throws StickerGeneratorError if there were problems during invocation of the API
+        """
+        return (await self.generate_image_candidates_from_translation(achievement_text_in_en, 1))[0]
+
+    async def generate_image_candidates_from_translation(
+        self,
+        achievement_text_in_en: str,
+        grid_size: int = None
+    ) -> list[Image]:
+        """Generates candidate images (as many as configured in Deep AI API) in one Deep AI API call
+
+        Throws StickerGeneratorError if there were problems during invocation of the API
+        """
         # Manipulate a prompt for better user experience
         prompt = (
             f'Create a humorous sticker representing the achievement of {achievement_text_in_en}. '
@@ -42,13 +76,13 @@ class StickerGenerator(BaseClass):
             f'color palette. The background should be white to emphasize the sticker format.'
             f'Make sticker circular and framed.')
 
-        # Generate image from prompt
+        # Generate images from prompt
         try:
-            image = await self.deep_api.generate_image(prompt)
+            images = await self.deep_api.generate_images(prompt, grid_size)
         except Exception as e:
             self.logger.error(str(e))
             raise StickerGeneratorError(
                 "Problem appeared during Deep AI API invocation", "deepai-api", str(e)
             ) from e
 
-        return image
+        return images
@@ -0,0 +1,93 @@
+"""
+This module handles reuse of generated images across chats
+"""
+import asyncio
+import hashlib
+import io
+import os
+from typing import Optional
+
+from PIL import Image
+
+from common.common import BaseClass
+from message.language import normalize_prompt
+from storage.postgres import PostgresDatabase
+from storage.s3 import ImageS3Storage
+
+
+class GeneratedImageCache(BaseClass):
+    """
+    Class that keeps images generated for achievements (with background already removed) by
+    normalized english prompt, so the same achievement awarded in another chat skips generation and
+    background removal. Images that kept their background are not shared.
+
+    Images are stored in the storage under GENERATED_IMAGES_PREFIX (never collected as orphans) and
+    the mapping is stored in Postgres. Chats may opt out of the cache, then they neither reuse nor
+    share images.
+    The cache is disabled altogether by GENERATED_IMAGE_CACHE=false environment variable
+    """
+    GENERATED_IMAGES_PREFIX = "generated_images"
+
+    def __init__(self, database: PostgresDatabase, sticker_file_manager: ImageS3Storage):
+        super().__init__()
+        self.database = database
+        self.sticker_file_manager = sticker_file_manager
+        self.enabled = os.environ.get('GENERATED_IMAGE_CACHE', 'true').lower() == 'true'
+        self.hits = 0
+        self.misses = 0
+
+    async def is_enabled_for(self, chat_id: int) -> bool:
+        """Returns True if the chat reuses and shares generated images"""
+        return self.enabled and not await asyncio.to_thread(
+            self.database.is_image_cache_disabled, chat_id
+        )
+
+    async def get(self, prompt: str) -> Optional[Image.Image]:
+        """Returns image generated for the english prompt before, None if there is no such image"""
+        normalized_prompt = normalize_prompt(prompt)
+        if not normalized_prompt:
+            return None
+        file_path = await asyncio.to_thread(
+            self.database.get_generated_image_path, normalized_prompt
+        )
+        if file_path is None:
+            self.misses += 1
+            return None
+        try:
+            byte_image = await self.sticker_file_manager.get(file_path)
+        except FileNotFoundError:
+            self.logger.warning(
+                "Generated image '%s' for '%s' doesn't exist", file_path, normalized_prompt
+            )
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.logger.info(
+            "Reusing generated image for '%s' (%d hits, %d misses)",
+            normalized_prompt, self.hits, self.misses
+        )
+        image = Image.open(io.BytesIO(byte_image))
+        image.load()
+        return image
+
+    async def put(self, prompt: str, image: Image.Image) -> None:
+        """Saves image generated for the english prompt, failures are only logged"""
+        normalized_prompt = normalize_prompt(prompt)
+        if not normalized_prompt:
+            return
+        prompt_hash = hashlib.sha256(normalized_prompt.encode('utf-8')).hexdigest()
+        file_path = f"{self.GENERATED_IMAGES_PREFIX}/{prompt_hash}.png"
+        try:
+            # images are encoded once again as stickers, so they are stored losslessly
+            byte_image = await asyncio.to_thread(self.__encode, image)
+            await self.sticker_file_manager.save_bytes_async(byte_image, file_path)
+            await asyncio.to_thread(
+                self.database.save_generated_image, normalized_prompt, file_path
+            )
+        except Exception as e:
+            self.logger.error("Failed to save generated image for '%s': %s", normalized_prompt, e)
+
+    def __encode(self, image: Image.Image) -> bytes:
+        buf = io.BytesIO()
+        image.save(buf, format='PNG')
+        return buf.getvalue()
@@ -0,0 +1,124 @@
+"""
+This module handles offloading of sticker rendering to a pool of worker processes
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, wait
+import multiprocessing
+import os
+import time
+from typing import Any, Callable, NamedTuple
+
+from PIL import Image
+
+from common.common import BaseClass
+
+
+class ImageBuffer(NamedTuple):
+    """Raw pixels of an image, used to pass images across the process boundary"""
+    mode: str
+    size: tuple[int, int]
+    data: bytes
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> 'ImageBuffer':
+        """Captures raw pixels of the image (palette based images are converted to RGBA)"""
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA")
+        return cls(image.mode, image.size, image.tobytes())
+
+    def to_image(self) -> Image.Image:
+        """Restores the image from raw pixels"""
+        return Image.frombytes(self.mode, self.size, self.data)
+
+
+def ping(hold_seconds: float = 0) -> int:
+    """No-op task used to make sure a worker process is started and initialized, returns its PID"""
+    # holding the worker lets the other pings sent at the same time reach the other workers
+    time.sleep(hold_seconds)
+    return os.getpid()
+
+
+class RenderService(BaseClass):
+    """
+    Class that runs CPU heavy rendering in worker processes, so it never blocks the asyncio loop
+
+    Number of workers and maximum number of renders waiting for a worker are configured by
+    RENDER_WORKERS and RENDER_QUEUE_SIZE environment variables. With 0 workers everything is
+    rendered in the calling process (handy for local development).
+    """
+    DEFAULT_WORKERS = 2
+    DEFAULT_QUEUE_SIZE = 16
+    WARM_UP_TIMEOUT_SECONDS = 300  # Maximum time to wait for all workers to be initialized
+    PING_HOLD_SECONDS = 0.05
+
+    def __init__(self, initializer: Callable[..., None] = None, initargs: tuple = ()):
+        super().__init__()
+        self.max_workers = int(os.environ.get('RENDER_WORKERS', self.DEFAULT_WORKERS))
+        self.max_pending = int(os.environ.get('RENDER_QUEUE_SIZE', self.DEFAULT_QUEUE_SIZE))
+        self.pending = 0
+
+        self.executor = None
+        if self.max_workers > 0:
+            # 'spawn' is used since forking a process with running event loop and threads is unsafe
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=initializer,
+                initargs=initargs
+            )
+        # callers have to wait for a free slot once the queue is full (backpressure)
+        self.__slots = asyncio.Semaphore(self.max_pending)
+
+        self.logger.info(
+            "Render service started with %d workers and queue of %d",
+            self.max_workers, self.max_pending
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Returns whether rendering is offloaded to worker processes"""
+        return self.executor is not None
+
+    def warm_up(self) -> None:
+        """Starts all worker processes, so the first renders don't pay for their initialization"""
+        if not self.enabled:
+            return
+        deadline = time.monotonic() + self.WARM_UP_TIMEOUT_SECONDS
+        workers = set()
+        # a worker answers only after its initializer has finished, while an initialized worker may
+        # answer several pings, so pings are sent until every worker has answered
+        while len(workers) < self.max_workers:
+            remaining_seconds = deadline - time.monotonic()
+            if remaining_seconds <= 0:
+                self.logger.warning(
+                    "Only %d of %d render workers were ready in %d s",
+                    len(workers), self.max_workers, self.WARM_UP_TIMEOUT_SECONDS
+                )
+                break
+            (done, _) = wait(
+                [
+                    self.executor.submit(ping, self.PING_HOLD_SECONDS)
+                    for _ in range(self.max_workers)
+                ],
+                timeout=remaining_seconds
+            )
+            workers.update(future.result() for future in done)
+        self.logger.info("Render workers %s are ready", sorted(workers))
+
+    async def run(self, function: Callable[..., Any], *args) -> Any:
+        """Runs module level function with picklable arguments in one of the worker processes"""
+        if self.pending >= self.max_pending:
+            self.logger.warning("Render queue is full (%d), waiting for a free slot", self.pending)
+        self.pending += 1
+        try:
+            async with self.__slots:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.executor, function, *args
+                )
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Stops all worker processes"""
+        if self.enabled:
+            self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,11 +1,59 @@
-from PIL import Image
-import numpy as np
+from typing import Optional
 
 from PIL import Image
 import numpy as np
-from typing import Tuple, List
 
-def is_image_suitable_for_achievement(image: Image.Image) -> bool:
+import onnxruntime as ort
+from rembg.sessions import sessions_class
+from rembg.sessions.base import BaseSession
+
+# background removal models, from the heaviest to the lightest one
+# ('u2net_custom' loads any u2net compatible ONNX file, e.g. its int8-quantized export)
+REMBG_MODELS = ("u2net", "silueta", "u2netp", "u2net_custom")
+
+# clusters smaller than this percent of the largest one are considered noise
+SECOND_CLUSTER_MAXIMUM_PERCENT = 5
+# size of the downsampled mask used to decide on suitability without checking every pixel
+FAST_PATH_MASK_SIZE = 128
+# near-white pixels have every channel within this distance from 255
+WHITE_BACKGROUND_TOLERANCE = 24
+# width of the image border checked to be white before background is flood-filled
+WHITE_BORDER_WIDTH = 2
+# part of the border that has to be near-white for the image to be considered on white background
+WHITE_BORDER_MINIMUM_RATIO = 0.95
+
+def new_background_removal_session(
+    model_name: str,
+    intra_op_threads: int,
+    inter_op_threads: int,
+    model_path: str = None
+) -> BaseSession:
+    """Creates rembg session of the model with the given onnxruntime thread counts"""
+    if model_name not in REMBG_MODELS:
+        raise ValueError(
+            f"Background removal model should be one of {REMBG_MODELS}, got '{model_name}'"
+        )
+    if model_name == "u2net_custom" and not model_path:
+        raise ValueError(
+            "Path to the ONNX file is required for 'u2net_custom' background removal model"
+        )
+
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = intra_op_threads
+    sess_opts.inter_op_num_threads = inter_op_threads
+
+    session_class = next(
+        session_class for session_class in sessions_class if session_class.name() == model_name
+    )
+    return session_class(model_name, sess_opts, model_path=model_path)
+
+def is_image_suitable_for_achievement(image: Image.Image, fast_path: bool = False) -> bool:
+    """
+    Checks that non-transparent part of the image is a single cluster of pixels (clusters
+    smaller than 5% of the largest one are ignored)
+
+    With fast path, the decision is first attempted on a downsampled mask
+    """
     image_array: np.ndarray = np.array(image)
 
     if image_array.shape[2] == 4:
@@ -15,33 +63,168 @@ def is_image_suitable_for_achievement(image: Image.Image) -> bool:
 
     mask: np.ndarray = alpha_channel > 0
 
-    def dfs(x: int, y: int) -> int:
-        stack: List[Tuple[int, int]] = [(x, y)]
-        cluster_size: int = 0
-        while stack:
-            cx, cy = stack.pop()
-            if cx < 0 or cy < 0 or cx >= mask.shape[0] or cy >= mask.shape[1] or not mask[cx, cy]:
-                continue
-            mask[cx, cy] = 0
-            cluster_size += 1
-            stack.extend([(cx + dx, cy + dy) for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]])
-        return cluster_size
-
-    cluster_sizes: List[int] = []
-    for i in range(mask.shape[0]):
-        for j in range(mask.shape[1]):
-            if mask[i, j]:
-                cluster_size = dfs(i, j)
-                cluster_sizes.append(cluster_size)
-
-    if len(cluster_sizes) == 0:
+    if fast_path:
+        decision = decide_on_downsampled_mask(mask)
+        if decision is not None:
+            return decision
+
+    return are_clusters_suitable_for_achievement(cluster_sizes(mask))
+
+def achievement_score(image: Image.Image) -> float:
+    """
+    Scores the image with removed background as an achievement sticker: 0 if it isn't suitable,
+    otherwise the part of the image covered by its largest cluster of pixels, lowered by the
+    relative size of the second largest one
+    """
+    image_array: np.ndarray = np.array(image)
+    if image_array.ndim != 3 or image_array.shape[2] != 4:
+        return 0.0
+
+    mask: np.ndarray = image_array[:, :, 3] > 0
+    sizes = cluster_sizes(mask)
+    if not are_clusters_suitable_for_achievement(sizes):
+        return 0.0
+
+    sizes = np.sort(sizes)[::-1]
+    second_size = sizes[1] if len(sizes) > 1 else 0
+    return float(sizes[0] / mask.size * (1 - second_size / sizes[0]))
+
+def are_clusters_suitable_for_achievement(sizes: np.ndarray) -> bool:
+    """Checks that there is a single cluster or the second largest one is negligible"""
+    if len(sizes) == 0:
         return False
-    if len(cluster_sizes) == 1:
+    if len(sizes) == 1:
         return True
-    
-    cluster_sizes.sort(reverse=True)
 
-    if cluster_sizes[1] * 100 / cluster_sizes[0] > 5:
+    sizes = np.sort(sizes)[::-1]
+
+    if sizes[1] * 100 / sizes[0] > SECOND_CLUSTER_MAXIMUM_PERCENT:
         return False
-    
+
     return True
+
+def decide_on_downsampled_mask(mask: np.ndarray) -> Optional[bool]:
+    """
+    Decides on the mask downsampled to FAST_PATH_MASK_SIZE blocks when it's exact:
+    either the mask is empty or every block is fully opaque or fully transparent.
+    Returns None if the full resolution mask has to be checked
+    """
+    height, width = mask.shape
+    if height % FAST_PATH_MASK_SIZE or width % FAST_PATH_MASK_SIZE:
+        return None
+    block_height, block_width = height // FAST_PATH_MASK_SIZE, width // FAST_PATH_MASK_SIZE
+
+    block_counts: np.ndarray = mask.reshape(
+        FAST_PATH_MASK_SIZE, block_height, FAST_PATH_MASK_SIZE, block_width
+    ).sum(axis=(1, 3))
+
+    if not block_counts.any():
+        return False
+    # with no partially opaque blocks, clusters of blocks are exactly clusters of pixels
+    if np.all((block_counts == 0) | (block_counts == block_height * block_width)):
+        return are_clusters_suitable_for_achievement(cluster_sizes(block_counts > 0, block_counts))
+    return None
+
+def cluster_sizes(mask: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
+    """Returns sizes of 4-connected clusters of the mask (sums of their weights if specified)"""
+    (run_rows, run_starts, run_ends, clusters) = label_runs(mask)
+    if len(run_rows) == 0:
+        return np.zeros(0)
+
+    if weights is None:
+        run_sizes = run_ends - run_starts
+    else:
+        width = mask.shape[1]
+        cumulative_weights = np.concatenate(([0], np.cumsum(weights.ravel())))
+        run_sizes = (
+            cumulative_weights[run_rows * width + run_ends]
+            - cumulative_weights[run_rows * width + run_starts]
+        )
+    return np.bincount(clusters, weights=run_sizes)
+
+def label_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Labels 4-connected clusters of the mask over its run-length encoded rows: overlapping runs
+    of neighbouring rows are merged with array based union-find.
+
+    Returns rows, starts and (exclusive) ends of the runs and a cluster label of each run
+    """
+    height, width = mask.shape
+
+    # runs of each row are [start, end) intervals between rising and falling edges
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)
+
+    # runs in row-major order (rows are one column wider, so runs of different rows never touch)
+    start_keys = run_rows * (width + 1) + run_starts
+    end_keys = run_rows * (width + 1) + run_ends
+
+    # runs of the previous row overlapping each run form [first_overlap, last_overlap) range
+    previous_row_keys = (run_rows - 1) * (width + 1)
+    first_overlap = np.searchsorted(end_keys, previous_row_keys + run_starts, side='right')
+    last_overlap = np.searchsorted(start_keys, previous_row_keys + run_ends, side='left')
+    overlaps = np.maximum(last_overlap - first_overlap, 0)
+
+    run_links = np.repeat(np.arange(len(run_rows)), overlaps)
+    previous_run_links = (
+        np.repeat(first_overlap, overlaps)
+        + np.arange(overlaps.sum())
+        - np.repeat(np.cumsum(overlaps) - overlaps, overlaps)
+    )
+
+    # union-find: every run points to the smallest run known to be in its cluster
+    parents = np.arange(len(run_rows))
+    while True:
+        linked_parents = np.minimum(parents[run_links], parents[previous_run_links])
+        new_parents = parents.copy()
+        linked_runs = (
+            run_links, previous_run_links, parents[run_links], parents[previous_run_links]
+        )
+        for links in linked_runs:
+            np.minimum.at(new_parents, links, linked_parents)
+        # path compression
+        new_parents = new_parents[new_parents]
+        if np.array_equal(new_parents, parents):
+            break
+        parents = new_parents
+
+    _, clusters = np.unique(parents, return_inverse=True)
+    return run_rows, run_starts, run_ends, clusters
+
+def remove_white_background(image: Image.Image) -> Optional[Image.Image]:
+    """
+    Cheap alternative to the neural background removal for images on white background.
+
+    If the border of the image is nearly uniformly white, makes transparent all near-white
+    pixels connected to the border (flood fill from the edges). Returns None otherwise
+    """
+    rgb: np.ndarray = np.array(image.convert("RGB"))
+    height, width, _ = rgb.shape
+    near_white: np.ndarray = np.all(rgb >= 255 - WHITE_BACKGROUND_TOLERANCE, axis=2)
+
+    border = np.ones((height, width), dtype=bool)
+    border[WHITE_BORDER_WIDTH:-WHITE_BORDER_WIDTH, WHITE_BORDER_WIDTH:-WHITE_BORDER_WIDTH] = False
+    if near_white[border].mean() < WHITE_BORDER_MINIMUM_RATIO:
+        return None
+
+    (run_rows, run_starts, run_ends, clusters) = label_runs(near_white)
+    touches_border = (
+        (run_rows == 0) | (run_rows == height - 1) | (run_starts == 0) | (run_ends == width)
+    )
+    is_background = np.isin(clusters, clusters[touches_border])
+
+    # paint background runs back into the pixel grid
+    run_lengths = (run_ends - run_starts)[is_background]
+    run_offsets = (run_rows * width + run_starts)[is_background]
+    background_pixels = (
+        np.repeat(run_offsets, run_lengths)
+        + np.arange(run_lengths.sum())
+        - np.repeat(np.cumsum(run_lengths) - run_lengths, run_lengths)
+    )
+    alpha = np.full(height * width, 255, dtype=np.uint8)
+    alpha[background_pixels] = 0
+
+    return Image.fromarray(np.dstack((rgb, alpha.reshape(height, width))), "RGBA")
@@ -0,0 +1,37 @@
+"""
+This module declares the interface of storages that sticker files are kept in
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Iterator, Optional
+
+
+class StorageBackend(ABC):
+    """
+    Interface of a key-value storage of files, implementations have to be safe to use from any
+    thread
+    """
+
+    @abstractmethod
+    def put(self, file_path: str, byte_file: bytes) -> None:
+        """Writes the file, replacing the existing one"""
+
+    @abstractmethod
+    def get(self, file_path: str) -> bytes:
+        """Returns bytes of the file, if file doesn't exist throws FileNotFoundError"""
+
+    @abstractmethod
+    def delete(self, file_paths: list[str]) -> None:
+        """Removes the files, files that don't exist are ignored"""
+
+    @abstractmethod
+    def modified_at(self, file_path: str) -> Optional[datetime]:
+        """Returns time when the file was last modified (timezone aware), None if there is none"""
+
+    @abstractmethod
+    def touch(self, file_path: str) -> None:
+        """Updates modification time of the file to the current time"""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[tuple[str, datetime]]:
+        """Yields paths and modification times of the files with the prefix, ordered by path"""
@@ -0,0 +1,148 @@
+"""
+This module handles removal of sticker files that are not used by any sticker anymore
+
+Every replacement of a sticker in a set (counter increments, filling empty slots) leaves the
+previous file in the bucket, so the collector is supposed to be run periodically (see
+cron.Dockerfile).
+To see what would be removed without removing anything, run from the src directory
+(e.g. inside of the app container against the local MinIO):
+
+    python -m storage.collector --dry-run
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+import os
+import time
+
+from common.common import BaseClass
+from storage.encoder import StickerEncoder
+from storage.postgres import PostgresDatabase
+from storage.s3 import ImageS3Storage
+
+
+class OrphanedFilesCollector(BaseClass):
+    """
+    Class that removes sticker files which are not referenced by chat and user stickers
+
+    Files modified less than grace period ago are kept, since a new sticker is written to the bucket
+    before it's saved to the database. Grace period and maximum number of removals per second are
+    configured by GC_GRACE_PERIOD_HOURS and GC_REMOVALS_PER_SECOND environment variables
+    """
+    DEFAULT_GRACE_PERIOD_HOURS = 24
+    DEFAULT_REMOVALS_PER_SECOND = 200
+    BATCH_SIZE = 1000  # Maximum number of keys removed by one request
+    # files under sticker_layers/ are never referenced by stickers, so only sticker files are
+    # collected
+    COLLECTED_PREFIX = "sticker_files/"
+    # empty sticker (one per sticker format) is re-used by every new row of every stickerset
+    # (see StickerArtist.EMPTY_STICKER_PATH_WITHOUT_EXTENSION)
+    PROTECTED_FILES = tuple(
+        f"sticker_files/empty.{extension}" for extension in StickerEncoder.FORMATS
+    )
+
+    def __init__(
+        self,
+        database: PostgresDatabase,
+        sticker_file_manager: ImageS3Storage,
+        grace_period: timedelta = None,
+        removals_per_second: float = None
+    ):
+        super().__init__()
+        self.database = database
+        self.sticker_file_manager = sticker_file_manager
+        self.grace_period = grace_period or timedelta(
+            hours=float(os.environ.get('GC_GRACE_PERIOD_HOURS', self.DEFAULT_GRACE_PERIOD_HOURS))
+        )
+        self.removals_per_second = removals_per_second or float(
+            os.environ.get('GC_REMOVALS_PER_SECOND', self.DEFAULT_REMOVALS_PER_SECOND)
+        )
+        # content-addressed files reused within this window are touched, so they must never be
+        # collected
+        minimum_grace_period = timedelta(seconds=2 * ImageS3Storage.KNOWN_KEY_TTL_SECONDS)
+        if self.grace_period < minimum_grace_period:
+            raise ValueError(f"Grace period must be at least {minimum_grace_period}")
+
+    def collect(self, dry_run: bool = False) -> tuple[int, int]:
+        """
+        Removes orphaned files (or only logs them in dry run).
+        Returns number of scanned files and number of orphaned files
+        """
+        modified_before = datetime.now(timezone.utc) - self.grace_period
+        # both listings are ordered by path, so they are anti-joined by merging without loading
+        # either in memory
+        referenced_file_paths = self.database.iterate_all_sticker_file_paths()
+        referenced_file_path = next(referenced_file_paths, None)
+
+        scanned_files = 0
+        orphaned_files = 0
+        batch = []
+        for (file_path, modified_at) in self.sticker_file_manager.list_files(self.COLLECTED_PREFIX):
+            scanned_files += 1
+            while referenced_file_path is not None and referenced_file_path < file_path:
+                referenced_file_path = next(referenced_file_paths, None)
+            if (file_path == referenced_file_path
+                    or file_path in self.PROTECTED_FILES
+                    or modified_at >= modified_before):
+                continue
+            batch.append(file_path)
+            if len(batch) == self.BATCH_SIZE:
+                orphaned_files += self.__remove(batch, dry_run)
+                batch = []
+        if batch:
+            orphaned_files += self.__remove(batch, dry_run)
+
+        self.logger.info(
+            "[GC] %s %d orphaned files of %d scanned",
+            "found" if dry_run else "removed",
+            orphaned_files,
+            scanned_files
+        )
+        return scanned_files, orphaned_files
+
+    def __remove(self, file_paths: list[str], dry_run: bool) -> int:
+        # the listing could be stale by now, so files are checked once again right before removal
+        file_paths = self.database.unreferenced_file_paths(file_paths)
+        if dry_run:
+            for file_path in file_paths:
+                self.logger.info("[GC] would remove %s", file_path)
+            return len(file_paths)
+
+        start = time.monotonic()
+        self.sticker_file_manager.remove_all(file_paths)
+        # rate limit, so the collector doesn't compete with the bot for the storage
+        elapsed = time.monotonic() - start
+        time.sleep(max(0.0, len(file_paths) / self.removals_per_second - elapsed))
+        return len(file_paths)
+
+
+def main() -> None:
+    """Removes orphaned sticker files once"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only log files that would be removed"
+    )
+    parser.add_argument(
+        "--grace-period-hours", type=float, help="keep files modified less than this ago"
+    )
+    parser.add_argument(
+        "--removals-per-second", type=float, help="maximum number of files removed per second"
+    )
+    args = parser.parse_args()
+
+    collector = OrphanedFilesCollector(
+        PostgresDatabase(),
+        ImageS3Storage(),
+        timedelta(hours=args.grace_period_hours) if args.grace_period_hours else None,
+        args.removals_per_second
+    )
+    (scanned_files, orphaned_files) = collector.collect(args.dry_run)
+    print(
+        f"{'Found' if args.dry_run else 'Removed'} {orphaned_files} orphaned files "
+        f"of {scanned_files} scanned"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+This module handles encoding of rendered stickers to bytes that are uploaded to S3 and Telegram
+"""
+import io
+import os
+
+from PIL import Image
+
+from common.common import BaseClass
+
+
+class StickerEncoder(BaseClass):
+    """
+    Class that encodes stickers according to the configured policy
+
+    Policy is configured by the environment variables:
+    - STICKER_FORMAT: 'png' or 'webp' (both are accepted by Telegram for static stickers)
+    - STICKER_PNG_COMPRESS_LEVEL: zlib compression level of PNG from 0 to 9
+    - STICKER_PALETTE_COLORS: number of colors flat stickers (usernames, empty sticker) are
+      quantized to before encoding, 0 (default) disables quantization. Gradients of description
+      stickers would band, so they are never quantized
+    - STICKER_WEBP_QUALITY: quality of lossy WebP from 0 to 99, 100 means lossless WebP
+    """
+    FORMATS = ("png", "webp")
+    DEFAULT_FORMAT = "png"
+    DEFAULT_PNG_COMPRESS_LEVEL = 6
+    DEFAULT_PALETTE_COLORS = 0
+    DEFAULT_WEBP_QUALITY = 90
+
+    def __init__(
+        self,
+        image_format: str = None,
+        png_compress_level: int = None,
+        palette_colors: int = None,
+        webp_quality: int = None
+    ):
+        super().__init__()
+        self.image_format = image_format or os.environ.get('STICKER_FORMAT', self.DEFAULT_FORMAT)
+        if self.image_format not in self.FORMATS:
+            raise ValueError(
+                f"Unknown sticker format '{self.image_format}', expected one of {self.FORMATS}"
+            )
+        self.png_compress_level = png_compress_level if png_compress_level is not None else int(
+            os.environ.get('STICKER_PNG_COMPRESS_LEVEL', self.DEFAULT_PNG_COMPRESS_LEVEL)
+        )
+        self.palette_colors = palette_colors if palette_colors is not None else int(
+            os.environ.get('STICKER_PALETTE_COLORS', self.DEFAULT_PALETTE_COLORS)
+        )
+        self.webp_quality = webp_quality if webp_quality is not None else int(
+            os.environ.get('STICKER_WEBP_QUALITY', self.DEFAULT_WEBP_QUALITY)
+        )
+
+    @property
+    def extension(self) -> str:
+        """Returns file extension of the encoded stickers"""
+        return self.image_format
+
+    def describe(self) -> str:
+        """Returns short human readable description of the policy"""
+        if self.image_format == "webp":
+            if self.webp_quality >= 100:
+                description = "webp lossless"
+            else:
+                description = f"webp q{self.webp_quality}"
+        else:
+            description = f"png level {self.png_compress_level}"
+        if self.palette_colors:
+            description += f", flat {self.palette_colors} colors"
+        return description
+
+    def encode(self, image: Image.Image, flat: bool = False) -> bytes:
+        """
+        Encodes the image, flat images (solid colors and text, no photos or gradients) may be
+        quantized to a palette.
+
+        Encoding is the most expensive part of saving a sticker, so it's supposed to be done once
+        per sticker and the resulting bytes reused for both S3 and Telegram
+        """
+        if flat and self.palette_colors:
+            image = self.__quantize(image)
+
+        buf = io.BytesIO()
+        if self.image_format == "webp":
+            if self.webp_quality >= 100:
+                image.save(buf, format='WEBP', lossless=True)
+            else:
+                image.save(buf, format='WEBP', quality=self.webp_quality)
+        else:
+            image.save(buf, format='PNG', compress_level=self.png_compress_level)
+        return buf.getvalue()
+
+    def __quantize(self, image: Image.Image) -> Image.Image:
+        if image.mode == "RGBA":
+            # median cut doesn't support transparency
+            return image.quantize(self.palette_colors, method=Image.Quantize.FASTOCTREE)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return image.quantize(self.palette_colors)
@@ -0,0 +1,111 @@
+"""
+This module handles storage of files on the local file system, for single-node deployments and
+benchmarks
+"""
+from datetime import datetime, timezone
+import hashlib
+import mmap
+import os
+import tempfile
+from typing import Iterator, Optional
+
+from common.common import BaseClass
+from common.exceptions import ImageS3StorageError
+from storage.backend import StorageBackend
+
+
+class LocalFileSystemBackend(BaseClass, StorageBackend):
+    """
+    Storage of files in a local directory.
+
+    File 'a/b/name' is stored as '<root>/a/b/<shard>/name', where shard is derived from the hash of
+    the name, so no directory grows too large. Files are written to a temporary file and atomically
+    renamed, so readers never see partially written files, and read through mmap
+    """
+    SHARD_LENGTH = 2  # Number of hex digits of the name hash used as shard directory (256 shards)
+
+    def __init__(self, root_directory: str):
+        super().__init__()
+        self.root_directory = root_directory
+        os.makedirs(self.root_directory, exist_ok=True)
+        self.logger.info("Storing files in '%s'", self.root_directory)
+
+    def put(self, file_path: str, byte_file: bytes) -> None:
+        local_path = self.__local_path(file_path)
+        directory = os.path.dirname(local_path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            (descriptor, temporary_path) = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "wb") as file:
+                    file.write(byte_file)
+                os.replace(temporary_path, local_path)
+            except BaseException:
+                os.remove(temporary_path)
+                raise
+        except OSError as e:
+            raise ImageS3StorageError(
+                f"Failed to write file '{file_path}'", "put-file", str(e)
+            ) from e
+
+    def get(self, file_path: str) -> bytes:
+        try:
+            with open(self.__local_path(file_path), "rb") as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return b""
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    return mapped_file[:]
+        except FileNotFoundError as e:
+            raise FileNotFoundError(
+                f"File '{file_path}' does not exist in '{self.root_directory}'."
+            ) from e
+        except OSError as e:
+            raise ImageS3StorageError(
+                f"Failed to read file '{file_path}'", "get-file", str(e)
+            ) from e
+
+    def delete(self, file_paths: list[str]) -> None:
+        for file_path in file_paths:
+            try:
+                os.remove(self.__local_path(file_path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                raise ImageS3StorageError(
+                    f"Failed to delete file '{file_path}'", "delete-file", str(e)
+                ) from e
+
+    def modified_at(self, file_path: str) -> Optional[datetime]:
+        try:
+            modified_at = os.stat(self.__local_path(file_path)).st_mtime
+            return datetime.fromtimestamp(modified_at, timezone.utc)
+        except FileNotFoundError:
+            return None
+
+    def touch(self, file_path: str) -> None:
+        os.utime(self.__local_path(file_path))
+
+    def list(self, prefix: str) -> Iterator[tuple[str, datetime]]:
+        # files of a directory are spread across shards, so they are collected before sorting
+        (prefix_directory, _) = os.path.split(prefix)
+        files = []
+        listed_directory = os.path.join(self.root_directory, prefix_directory)
+        for (directory, _, file_names) in os.walk(listed_directory):
+            relative_directory = os.path.relpath(os.path.dirname(directory), self.root_directory)
+            for file_name in file_names:
+                if file_name.endswith(".tmp"):
+                    continue
+                if relative_directory == ".":
+                    file_path = file_name
+                else:
+                    file_path = f"{relative_directory}/{file_name}"
+                if not file_path.startswith(prefix):
+                    continue
+                modified_at = os.stat(os.path.join(directory, file_name)).st_mtime
+                files.append((file_path, datetime.fromtimestamp(modified_at, timezone.utc)))
+        yield from sorted(files)
+
+    def __local_path(self, file_path: str) -> str:
+        (directory, file_name) = os.path.split(file_path)
+        shard = hashlib.sha256(file_name.encode('utf-8')).hexdigest()[:self.SHARD_LENGTH]
+        return os.path.join(self.root_directory, directory, shard, file_name)
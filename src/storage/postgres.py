@@ -2,11 +2,15 @@
 This module handles all interractions with PostgreSQL database
 """
 import os
-from typing import Optional, Union
+from typing import Iterator, Optional, Union
 from datetime import datetime, timedelta
 
 from sqlalchemy.orm import Session, declarative_base, aliased
-from sqlalchemy import create_engine, Column, Integer, String, BigInteger, Text, DateTime, func, desc
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import (
+    create_engine, Column, Integer, String, BigInteger, Text, DateTime, func, desc, select, union,
+    update
+)
 
 from common.common import BaseClass
 
@@ -166,6 +170,66 @@ class StickersetOwner(Base):
     def __repr__(self):
         return f"StickersetOwner(\n\tuser_id={self.user_id},\n\tchat_id={self.chat_id})"
 
+class Translation(Base):
+    __tablename__ = 'translations'
+
+    text = Column(Text, nullable=False, primary_key=True, comment="Normalized original text")
+    translation = Column(Text, nullable=False, comment="Translation of the text to english")
+    detected_language = Column(
+        Text,
+        nullable=True,
+        comment="Language of the original text detected by Google")
+    hits = Column(
+        BigInteger,
+        nullable=False,
+        server_default="0",
+        comment="Number of times translation was reused")
+    timestamp = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        comment="The timestamp of the translation")
+
+    def __repr__(self):
+        return (
+            f"Translation(\n\ttext={self.text},\n\ttranslation={self.translation},\n"
+            f"\tdetected_language={self.detected_language},\n\thits={self.hits},\n"
+            f"\ttimestamp={self.timestamp})")
+
+class GeneratedImage(Base):
+    __tablename__ = 'generated_images'
+
+    prompt = Column(Text, nullable=False, primary_key=True, comment="Normalized english prompt")
+    file_path = Column(Text, nullable=False, comment="Path to the image with removed background")
+    hits = Column(
+        BigInteger,
+        nullable=False,
+        server_default="0",
+        comment="Number of times image was reused")
+    timestamp = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        comment="The timestamp of the generation")
+
+    def __repr__(self):
+        return (
+            f"GeneratedImage(\n\tprompt={self.prompt},\n\tfile_path={self.file_path},\n"
+            f"\thits={self.hits},\n\ttimestamp={self.timestamp})")
+
+class ImageCacheOptOut(Base):
+    __tablename__ = 'image_cache_opt_outs'
+
+    chat_id = Column(BigInteger, nullable=False, primary_key=True, comment="The chat ID")
+    timestamp = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        comment="The timestamp of the opt out")
+
+    def __repr__(self):
+        return f"ImageCacheOptOut(\n\tchat_id={self.chat_id},\n\ttimestamp={self.timestamp})"
+
 class PostgresDatabase(BaseClass):
     def __init__(self):
         super().__init__()
@@ -473,6 +537,47 @@ class PostgresDatabase(BaseClass):
 
         return chat_stickerset_files + user_stickerset_files
 
+    def iterate_all_sticker_file_paths(self, batch_size: int = 1000) -> Iterator[str]:
+        """
+        Yields distinct paths of the files used by any sticker in byte order (the order S3 lists
+        files in).
+        Rows are streamed with server-side cursor, so the whole table is never loaded in memory
+        """
+        file_paths = union(
+            select(ChatSticker.file_path.collate("C").label("file_path")),
+            select(UserSticker.file_path.collate("C").label("file_path"))
+        ).order_by("file_path")
+        with Session(self.engine) as session:
+            result = session.execute(file_paths, execution_options={"yield_per": batch_size})
+            for (file_path,) in result:
+                yield file_path
+
+    def unreferenced_file_paths(self, file_paths: list[str]) -> list[str]:
+        """Returns the file paths that are not used by any sticker (files may be shared by chats)"""
+        if not file_paths:
+            return []
+        session = Session(self.engine)
+
+        referenced_files = {
+            result[0] for result in (
+                session.query(ChatSticker.file_path)
+                    .filter(ChatSticker.file_path.in_(file_paths))
+                    .union(
+                        session.query(UserSticker.file_path)
+                            .filter(UserSticker.file_path.in_(file_paths))
+                    )
+                    .all()
+            )
+        }
+
+        session.commit()
+        session.close()
+
+        return [
+            file_path for file_path in dict.fromkeys(file_paths)
+            if file_path not in referenced_files
+        ]
+
     def remove_all(self, chat_id: int) -> tuple[str, str, str]:
         """Removes all data related to the chat"""
         session = Session(self.engine)
@@ -550,6 +655,108 @@ class PostgresDatabase(BaseClass):
 
         return count_entries
 
+    def get_translation(self, text: str) -> Optional[tuple[str, Optional[str]]]:
+        """
+        Returns saved translation of the normalized text and its detected language, counting the hit
+        """
+        session = Session(self.engine)
+        # the hit is counted in the same statement, so concurrent lookups don't lose hits
+        translation = session.execute(
+            update(Translation)
+                .where(Translation.text == text)
+                .values(hits=Translation.hits + 1)
+                .returning(Translation.translation, Translation.detected_language)
+        ).first()
+        session.commit()
+        session.close()
+        return tuple(translation) if translation else None
+
+    def save_translations(self, translations: list[tuple[str, str, Optional[str]]]) -> None:
+        """
+        Saves translations given as (normalized text, translation, detected language)
+        (keeps the existing ones if they were saved concurrently)
+        """
+        session = Session(self.engine)
+        session.execute(
+            insert(Translation)
+                .values([
+                    {
+                        "text": text,
+                        "translation": translation,
+                        "detected_language": detected_language,
+                    }
+                    for (text, translation, detected_language) in translations
+                ])
+                .on_conflict_do_nothing(index_elements=[Translation.text])
+        )
+        session.commit()
+        session.close()
+
+    def add_translation_hits(self, hits: dict[str, int]) -> None:
+        """Adds hits of translations reused without the database, given by normalized text"""
+        session = Session(self.engine)
+        for (text, text_hits) in hits.items():
+            (
+                session.query(Translation)
+                    .filter(Translation.text == text)
+                    .update({Translation.hits: Translation.hits + text_hits})
+            )
+        session.commit()
+        session.close()
+
+    def get_generated_image_path(self, prompt: str) -> Optional[str]:
+        """Returns path to the image generated for the normalized prompt, counting the hit"""
+        session = Session(self.engine)
+        generated_image = (
+            session.query(GeneratedImage)
+                .filter(GeneratedImage.prompt == prompt)
+                .first()
+        )
+        file_path = None
+        if generated_image:
+            generated_image.hits += 1
+            file_path = generated_image.file_path
+        session.commit()
+        session.close()
+        return file_path
+
+    def save_generated_image(self, prompt: str, file_path: str) -> None:
+        """Saves path to the image generated for the normalized prompt (keeps the existing one)"""
+        session = Session(self.engine)
+        session.execute(
+            insert(GeneratedImage)
+                .values(prompt=prompt, file_path=file_path)
+                .on_conflict_do_nothing(index_elements=[GeneratedImage.prompt])
+        )
+        session.commit()
+        session.close()
+
+    def is_image_cache_disabled(self, chat_id: int) -> bool:
+        """Returns True if the chat opted out of sharing generated images with other chats"""
+        session = Session(self.engine)
+        opt_out = (
+            session.query(ImageCacheOptOut)
+                .filter(ImageCacheOptOut.chat_id == chat_id)
+                .first()
+        )
+        session.commit()
+        session.close()
+        return opt_out is not None
+
+    def set_image_cache_disabled(self, chat_id: int, disabled: bool) -> None:
+        """Opts the chat out of (or back in to) sharing generated images with other chats"""
+        session = Session(self.engine)
+        if disabled:
+            session.execute(
+                insert(ImageCacheOptOut)
+                    .values(chat_id=chat_id)
+                    .on_conflict_do_nothing(index_elements=[ImageCacheOptOut.chat_id])
+            )
+        else:
+            session.query(ImageCacheOptOut).filter(ImageCacheOptOut.chat_id == chat_id).delete()
+        session.commit()
+        session.close()
+
     def ban(self, username: str) -> None:
         """Adds user to the list of banned users"""
         session = Session(self.engine)
@@ -1,10 +1,17 @@
 """
-This module handles all interractions with S3(Minio) database
+This module handles all interractions with S3(Minio) database and storage of sticker files in
+general
 """
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import io
 import os
 import string
 import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
 
 from PIL.Image import Image
 
@@ -12,14 +19,20 @@ import boto3
 from botocore.exceptions import ClientError
 from botocore.client import Config
 
+from common.cache import BytesLRUCache, DiskCache, LRUCache
 from common.common import BaseClass
 from common.exceptions import ImageS3StorageError
 from common.utils import by_chunk
+from storage.backend import StorageBackend
+from storage.encoder import StickerEncoder
+from storage.local import LocalFileSystemBackend
+from storage.upload_queue import UploadQueue
 
 
-class ImageS3Storage(BaseClass):
+class S3Backend(BaseClass, StorageBackend):
+    """Storage of files in S3(Minio) bucket"""
 
-    def __init__(self):
+    def __init__(self, max_pool_connections: int):
         super().__init__()
         self.minio_access_key = os.environ['MINIO_ROOT_USER']
         self.minio_secret_key = os.environ['MINIO_ROOT_PASSWORD']
@@ -28,29 +41,24 @@ class ImageS3Storage(BaseClass):
             endpoint_url='http://s3:9000',
             aws_access_key_id=self.minio_access_key,
             aws_secret_access_key=self.minio_secret_key,
-            config=Config(signature_version='s3v4'))
+            config=Config(signature_version='s3v4', max_pool_connections=max_pool_connections))
 
         self.logger.info("Connected to Minio")
 
         self.bucket_name = "stickers"
-        self.stickers_prefix = "sticker_files"
-
         self.__create_bucket(self.bucket_name)
 
-    def save_and_convert_to_bytes(self, image: Image, file_path: str = "") -> tuple[str, bytes]:
-        """Saves file to file_path (or randomly generated path if not specified). Returns file path and bytes"""
-        buf = io.BytesIO()
-        image.save(buf, format='PNG')
-        byte_image = buf.getvalue()
-
-        if not file_path:
-            file_path = f"{self.stickers_prefix}/{self.__generate_file_name()}.png"
-
-        self.s3.put_object(Bucket=self.bucket_name, Key=file_path, Body=byte_image)
-        return file_path, byte_image
+    def put(self, file_path: str, byte_file: bytes) -> None:
+        try:
+            self.s3.put_object(Bucket=self.bucket_name, Key=file_path, Body=byte_file)
+        except ClientError as e:
+            raise ImageS3StorageError(
+                f"Failed to upload file '{file_path}' to the bucket '{self.bucket_name}",
+                "put-object",
+                str(e)
+            ) from e
 
-    def get_bytes_from_path(self, file_path: str) -> bytes:
-        """Returns bytes from file path, if file doesn't exist throws an Exception"""
+    def get(self, file_path: str) -> bytes:
         try:
             with io.BytesIO() as buffer:
                 self.s3.download_fileobj(self.bucket_name, file_path, buffer)
@@ -68,10 +76,9 @@ class ImageS3Storage(BaseClass):
                 "download-file",
                 str(e)
             ) from e
-    
-    def remove_all(self, file_paths_to_remove: list[str]) -> None:
-        """Removes all files located at the file paths"""
-        for chunk_to_remove in by_chunk(file_paths_to_remove, 1000):
+
+    def delete(self, file_paths: list[str]) -> None:
+        for chunk_to_remove in by_chunk(file_paths, 1000):
             try:
                 self.s3.delete_objects(
                     Bucket=self.bucket_name,
@@ -82,25 +89,409 @@ class ImageS3Storage(BaseClass):
                     },
                 )
             except Exception as e:
-                self.logger(str(e))
+                self.logger.error(str(e))
                 raise ImageS3StorageError(
                     f"Failed to delete files",
                     "delete-objects",
                     str(e)
                 ) from e
 
+    def modified_at(self, file_path: str) -> Optional[datetime]:
+        try:
+            return self.s3.head_object(Bucket=self.bucket_name, Key=file_path)['LastModified']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise ImageS3StorageError(
+                f"Failed to check file '{file_path}' in the bucket '{self.bucket_name}",
+                "head-object",
+                str(e)
+            ) from e
+
+    def touch(self, file_path: str) -> None:
+        self.s3.copy_object(
+            Bucket=self.bucket_name,
+            Key=file_path,
+            CopySource={'Bucket': self.bucket_name, 'Key': file_path},
+            MetadataDirective='REPLACE'
+        )
+
+    def list(self, prefix: str) -> Iterator[tuple[str, datetime]]:
+        try:
+            pages = self.s3.get_paginator('list_objects_v2').paginate(
+                Bucket=self.bucket_name, Prefix=prefix
+            )
+            for page in pages:
+                for file in page.get('Contents', []):
+                    yield file['Key'], file['LastModified']
+        except ClientError as e:
+            raise ImageS3StorageError(
+                f"Failed to list files with prefix '{prefix}' in the bucket '{self.bucket_name}",
+                "list-objects",
+                str(e)
+            ) from e
+
     def __create_bucket(self, bucket_name: str) -> None:
         try:
             self.s3.create_bucket(Bucket=bucket_name)
         except ClientError as e:
             error_code = e.response['Error']['Code']
             if error_code != 'BucketAlreadyOwnedByYou':
-                self.logger(str(e))
+                self.logger.error(str(e))
                 raise ImageS3StorageError(
                     f"Failed to create bucket:",
                     "create-bucket",
                     str(e)
                 ) from e
 
+
+class ImageS3Storage(BaseClass):
+    """
+    Class that stores sticker files in S3 bucket (or local file system)
+
+    Storage backend is configured by STORAGE_BACKEND environment variable: 's3' (default) or 'local'
+    for single-node deployments, which keeps files in LOCAL_STORAGE_DIR directory (and doesn't use
+    disk cache and write-behind uploads unless they are configured explicitly).
+
+    Besides blocking methods, every operation has async variant (save, get, remove, save_many) that
+    runs requests to S3 in a dedicated pool of S3_IO_THREADS threads, so they never block the
+    asyncio loop. Caches are only touched from the calling thread, so they don't need to be
+    thread-safe.
+
+    With S3_UPLOADS=write-behind (default) async saves return as soon as the file is durably queued
+    in S3_SPOOL_DIR and upload it in the background, with S3_UPLOADS=sync they wait for S3.
+
+    With S3_KEYS=content (default) keys of new stickers are derived from the hash of their bytes, so
+    identical stickers are stored once, with S3_KEYS=random every sticker gets a new random key.
+    Downloaded and saved files are cached in memory and on local disk, with byte budgets configured
+    by S3_MEMORY_CACHE_BYTES and S3_DISK_CACHE_BYTES environment variables (0 disables a tier) and
+    the directory of the disk cache configured by S3_DISK_CACHE_DIR
+    """
+    BACKENDS = ("s3", "local")
+    DEFAULT_BACKEND = "s3"
+    DEFAULT_LOCAL_STORAGE_DIR = "/app/data/stickers"
+    DEFAULT_IO_THREADS = 8
+    DEFAULT_MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+    DEFAULT_DISK_CACHE_BYTES = 1024 * 1024 * 1024
+    DEFAULT_DISK_CACHE_DIR = "/app/cache/stickers"
+    UPLOAD_MODES = ("write-behind", "sync")
+    DEFAULT_UPLOAD_MODE = "write-behind"
+    DEFAULT_SPOOL_DIR = "/app/spool/uploads"
+    KEY_MODES = ("content", "random")
+    DEFAULT_KEY_MODE = "content"
+    KNOWN_KEYS_CACHE_SIZE = 100_000  # Number of keys remembered to exist in the bucket
+    # how long a key is trusted to exist without checking the bucket
+    KNOWN_KEY_TTL_SECONDS = 60 * 60
+
+    def __init__(self, encoder: StickerEncoder = None, backend: StorageBackend = None):
+        super().__init__()
+        self.encoder = encoder or StickerEncoder()
+        self.io_threads = int(os.environ.get('S3_IO_THREADS', self.DEFAULT_IO_THREADS))
+        self.backend = backend or self.new_backend(self.io_threads)
+        self.__executor = ThreadPoolExecutor(
+            max_workers=self.io_threads, thread_name_prefix="s3-io"
+        )
+
+        self.logger.info(
+            "Storing files in %s, stickers are encoded as %s",
+            type(self.backend).__name__,
+            self.encoder.describe()
+        )
+
+        self.stickers_prefix = "sticker_files"
+        self.key_mode = os.environ.get('S3_KEYS', self.DEFAULT_KEY_MODE)
+        if self.key_mode not in self.KEY_MODES:
+            raise ValueError(
+                f"Unknown S3 key mode '{self.key_mode}', expected one of {self.KEY_MODES}"
+            )
+        # keys known to exist in the bucket to the time they were checked, so identical stickers
+        # are not checked with HEAD requests again
+        self.__known_keys = LRUCache(self.KNOWN_KEYS_CACHE_SIZE)
+        self.deduplicated_uploads = 0
+        # bytes of immutable well-known files (e.g. empty sticker), kept in memory forever once
+        # loaded
+        self.__pinned_files: dict[str, bytes] = {}
+        self.pinned_hits = 0
+        memory_cache_bytes = int(
+            os.environ.get('S3_MEMORY_CACHE_BYTES', self.DEFAULT_MEMORY_CACHE_BYTES)
+        )
+        self.memory_cache = BytesLRUCache(memory_cache_bytes) if memory_cache_bytes > 0 else None
+        # local files are already on disk, so by default neither disk cache nor write-behind is used
+        # for them
+        is_local = isinstance(self.backend, LocalFileSystemBackend)
+        disk_cache_bytes = int(os.environ.get(
+            'S3_DISK_CACHE_BYTES', 0 if is_local else self.DEFAULT_DISK_CACHE_BYTES
+        ))
+        self.disk_cache = DiskCache(
+            os.environ.get('S3_DISK_CACHE_DIR', self.DEFAULT_DISK_CACHE_DIR),
+            disk_cache_bytes
+        ) if disk_cache_bytes > 0 else None
+
+        upload_mode = os.environ.get('S3_UPLOADS', "sync" if is_local else self.DEFAULT_UPLOAD_MODE)
+        if upload_mode not in self.UPLOAD_MODES:
+            raise ValueError(
+                f"Unknown S3 upload mode '{upload_mode}', expected one of {self.UPLOAD_MODES}"
+            )
+        self.upload_queue = UploadQueue(
+            os.environ.get('S3_SPOOL_DIR', self.DEFAULT_SPOOL_DIR),
+            self.__upload_async,
+            self.__run
+        ) if upload_mode == "write-behind" else None
+
+    def save_and_convert_to_bytes(
+        self, image: Image, file_path: str = "", flat: bool = False
+    ) -> tuple[str, bytes]:
+        """
+        Encodes image once and saves it to file_path (or generated path if not specified).
+        Returns file path and bytes, which should be reused instead of encoding the image again
+        """
+        return self.save_bytes(self.encoder.encode(image, flat), file_path)
+
+    def save_bytes(self, byte_image: bytes, file_path: str = "") -> tuple[str, bytes]:
+        """
+        Saves already encoded file to file_path (or the path generated according to key mode if not
+        specified)
+        """
+        (file_path, check_existing) = self.__prepare_save(byte_image, file_path)
+        deduplicated = (
+            check_existing is None or self.__upload(byte_image, file_path, check_existing)
+        )
+        self.__complete_save(byte_image, file_path, deduplicated)
+        return file_path, byte_image
+
+    async def save(
+        self, image: Image, file_path: str = "", flat: bool = False
+    ) -> tuple[str, bytes]:
+        """Async variant of save_and_convert_to_bytes, encoding is done in the I/O thread as well"""
+        byte_image = await self.__run(self.encoder.encode, image, flat)
+        return await self.save_bytes_async(byte_image, file_path)
+
+    async def save_bytes_async(self, byte_image: bytes, file_path: str = "") -> tuple[str, bytes]:
+        """Async variant of save_bytes"""
+        (file_path, check_existing) = self.__prepare_save(byte_image, file_path)
+        if check_existing is None:
+            deduplicated = True
+        elif self.upload_queue is not None:
+            # Telegram only needs the bytes, so S3 is taken off the critical path
+            await self.upload_queue.put(byte_image, file_path, check_existing)
+            deduplicated = False
+        else:
+            deduplicated = await self.__upload_async(byte_image, file_path, check_existing)
+        self.__complete_save(byte_image, file_path, deduplicated)
+        return file_path, byte_image
+
+    async def save_many(self, images: list[tuple[Image, bool]]) -> list[tuple[str, bytes]]:
+        """
+        Concurrently saves (image, flat) pairs to generated paths, returns file paths and bytes in
+        the same order
+        """
+        return list(await asyncio.gather(
+            *(self.save(image, flat=flat) for (image, flat) in images)
+        ))
+
+    def pin(self, file_path: str) -> None:
+        """Marks file as immutable, so its bytes are served from memory after the first load"""
+        self.__pinned_files.setdefault(file_path, None)
+
+    def warm_up(self) -> None:
+        """Loads all pinned files, so they never make a network round trip later"""
+        for file_path in self.__pinned_files:
+            try:
+                self.get_bytes_from_path(file_path)
+            except FileNotFoundError:
+                self.logger.info("Pinned file '%s' doesn't exist yet", file_path)
+
+    def start(self) -> None:
+        """Starts background uploads in the running loop, replaying ones left by the previous run"""
+        if self.upload_queue is not None:
+            self.upload_queue.start()
+
+    async def stop(self) -> None:
+        """Stops background uploads, files still waiting stay in the spool for the next run"""
+        if self.upload_queue is not None:
+            await self.upload_queue.stop()
+
+    def get_bytes_from_path(self, file_path: str) -> bytes:
+        """Returns bytes from file path, if file doesn't exist throws an Exception"""
+        byte_image = self.__pinned_files.get(file_path)
+        if byte_image is not None:
+            self.pinned_hits += 1
+            return byte_image
+
+        byte_image = self.__get_from_cache(file_path)
+        if byte_image is None and self.upload_queue is not None:
+            byte_image = self.upload_queue.get(file_path)
+        if byte_image is None:
+            byte_image = self.backend.get(file_path)
+            self.__complete_download(file_path, byte_image)
+        return byte_image
+
+    async def get(self, file_path: str) -> bytes:
+        """Async variant of get_bytes_from_path"""
+        byte_image = self.__pinned_files.get(file_path)
+        if byte_image is not None:
+            self.pinned_hits += 1
+            return byte_image
+
+        byte_image = self.__get_from_cache(file_path)
+        if byte_image is None and self.upload_queue is not None:
+            byte_image = self.upload_queue.get(file_path)
+        if byte_image is None:
+            byte_image = await self.__run(self.backend.get, file_path)
+            self.__complete_download(file_path, byte_image)
+        return byte_image
+
+    def list_files(self, prefix: str) -> Iterator[tuple[str, datetime]]:
+        """Yields paths and modification times of the files with the prefix, ordered by path"""
+        return self.backend.list(prefix)
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        """Returns hits, misses and sizes of the file caches"""
+        stats = {
+            "pinned": {"hits": self.pinned_hits, "entries": len(self.__pinned_files)},
+            "known keys": {
+                "hits": self.__known_keys.hits,
+                "deduplicated uploads": self.deduplicated_uploads,
+            },
+        }
+        for (tier, cache) in (("memory", self.memory_cache), ("disk", self.disk_cache)):
+            if cache is not None:
+                stats[tier] = {
+                    "hits": cache.hits,
+                    "misses": cache.misses,
+                    "entries": len(cache),
+                    "bytes": cache.size_bytes,
+                }
+        return stats
+
+    def shutdown(self) -> None:
+        """Waits for running requests to S3 and stops I/O threads"""
+        self.__executor.shutdown(wait=True)
+
+    @classmethod
+    def new_backend(cls, max_pool_connections: int = 1) -> StorageBackend:
+        """
+        Creates bare storage backend configured by STORAGE_BACKEND, without caches, I/O threads and
+        uploads queue (e.g. for render worker processes, which must not replay the spool directory
+        of the bot)
+        """
+        backend = os.environ.get('STORAGE_BACKEND', cls.DEFAULT_BACKEND)
+        if backend == "s3":
+            # every I/O thread keeps its own connection alive
+            return S3Backend(max_pool_connections=max_pool_connections)
+        if backend == "local":
+            return LocalFileSystemBackend(
+                os.environ.get('LOCAL_STORAGE_DIR', cls.DEFAULT_LOCAL_STORAGE_DIR)
+            )
+        raise ValueError(f"Unknown storage backend '{backend}', expected one of {cls.BACKENDS}")
+
+    async def __run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+
+    async def __upload_async(self, byte_image: bytes, file_path: str, check_existing: bool) -> bool:
+        return await self.__run(self.__upload, byte_image, file_path, check_existing)
+
+    def __prepare_save(self, byte_image: bytes, file_path: str) -> tuple[str, Optional[bool]]:
+        """
+        Returns path to save the file to and whether it has to be looked up first (None if it's
+        known to exist)
+        """
+        if file_path:
+            return file_path, False
+        if self.key_mode == "random":
+            file_name = self.__generate_file_name()
+            return f"{self.stickers_prefix}/{file_name}.{self.encoder.extension}", False
+
+        file_name = hashlib.sha256(byte_image).hexdigest()
+        file_path = f"{self.stickers_prefix}/{file_name}.{self.encoder.extension}"
+        checked_at = self.__known_keys.get(file_path)
+        if checked_at is not None and time.monotonic() - checked_at < self.KNOWN_KEY_TTL_SECONDS:
+            return file_path, None
+        return file_path, True
+
+    def __upload(self, byte_image: bytes, file_path: str, check_existing: bool) -> bool:
+        """
+        Uploads the file unless it's already in the bucket, returns whether it was. Safe to run in
+        any thread
+        """
+        if check_existing and self.__exists(file_path):
+            return True
+        self.backend.put(file_path, byte_image)
+        return False
+
+    def __complete_save(self, byte_image: bytes, file_path: str, deduplicated: bool) -> None:
+        if deduplicated:
+            self.deduplicated_uploads += 1
+        self.__known_keys.put(file_path, time.monotonic())
+        if file_path in self.__pinned_files:
+            self.__pinned_files[file_path] = byte_image
+        # newly drawn stickers are likely to be requested again soon
+        self.__put_to_cache(file_path, byte_image)
+
+    def __complete_download(self, file_path: str, byte_image: bytes) -> None:
+        self.__put_to_cache(file_path, byte_image)
+        if file_path in self.__pinned_files:
+            self.__pinned_files[file_path] = byte_image
+
+    def __exists(self, file_path: str) -> bool:
+        modified_at = self.backend.modified_at(file_path)
+        if modified_at is None:
+            return False
+        if datetime.now(timezone.utc) - modified_at > timedelta(seconds=self.KNOWN_KEY_TTL_SECONDS):
+            # reused file may be an orphan by now, so it's touched to not be removed by the
+            # collector
+            self.backend.touch(file_path)
+        return True
+
+    def __get_from_cache(self, file_path: str) -> Optional[bytes]:
+        if self.memory_cache is not None:
+            byte_image = self.memory_cache.get(file_path)
+            if byte_image is not None:
+                return byte_image
+        if self.disk_cache is not None:
+            byte_image = self.disk_cache.get(file_path)
+            if byte_image is not None:
+                if self.memory_cache is not None:
+                    self.memory_cache.put(file_path, byte_image)
+                return byte_image
+        return None
+
+    def __put_to_cache(self, file_path: str, byte_image: bytes) -> None:
+        if self.memory_cache is not None:
+            self.memory_cache.put(file_path, byte_image)
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.put(file_path, byte_image)
+            except OSError as e:
+                # the cache is only an optimization, so running out of disk must not fail the award
+                self.logger.warning("Failed to cache '%s' on disk: %s", file_path, e)
+
+    def __remove_from_cache(self, file_path: str) -> None:
+        self.__known_keys.remove(file_path)
+        if self.upload_queue is not None:
+            # if the upload is already in progress, the file is left orphaned and removed by the
+            # collector later
+            self.upload_queue.discard(file_path)
+        if file_path in self.__pinned_files:
+            # file stays pinned, so it's loaded again (or re-created by its owner) on the next
+            # request
+            self.__pinned_files[file_path] = None
+        if self.memory_cache is not None:
+            self.memory_cache.remove(file_path)
+        if self.disk_cache is not None:
+            self.disk_cache.remove(file_path)
+
+    def remove_all(self, file_paths_to_remove: list[str]) -> None:
+        """Removes all files located at the file paths"""
+        for file_path in file_paths_to_remove:
+            self.__remove_from_cache(file_path)
+        self.backend.delete(file_paths_to_remove)
+
+    async def remove(self, file_paths_to_remove: list[str]) -> None:
+        """Async variant of remove_all"""
+        for file_path in file_paths_to_remove:
+            self.__remove_from_cache(file_path)
+        await self.__run(self.backend.delete, file_paths_to_remove)
+
     def __generate_file_name(self) -> str:
         return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
@@ -0,0 +1,245 @@
+"""
+This module handles durable write-behind uploads of sticker files
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+import uuid
+
+from common.common import BaseClass
+
+
+class PendingUpload(NamedTuple):
+    """File waiting for upload, its spool file and when it may be retried after failures"""
+    file_path: str
+    spool_file_path: str
+    failures: int = 0
+    # monotonic time before which the upload isn't retried
+    not_before: float = 0.0
+
+
+class UploadQueue(BaseClass):
+    """
+    Class that uploads files in the background, so the award path doesn't wait for the storage.
+
+    Every queued file is written to the spool directory (and fsynced) before it's acknowledged, so
+    uploads that didn't happen before a crash or restart are replayed on start. Failed uploads are
+    moved to the back of the queue and retried with their own exponential backoff, meanwhile the
+    other files are uploaded. The same file may be queued again while it's uploaded, every queueing
+    has its own spool file
+    """
+    INITIAL_BACKOFF_SECONDS = 1
+    MAXIMUM_BACKOFF_SECONDS = 300
+    SPOOL_FILE_EXTENSION = ".upload"
+
+    def __init__(
+        self,
+        spool_directory: str,
+        upload: Callable[[bytes, str, bool], Awaitable[Any]],
+        run: Callable[..., Awaitable[Any]]
+    ):
+        """
+        upload uploads (bytes, file path, whether to check existing file first), run runs blocking
+        function
+        """
+        super().__init__()
+        self.spool_directory = spool_directory
+        self.__upload = upload
+        self.__run = run
+        self.uploaded = 0
+        self.retries = 0
+        # files waiting for upload by the ID of their queueing (name of the spool file), in order
+        self.__pending: dict[str, PendingUpload] = {}
+        # ID of the latest queueing of every file path waiting for upload
+        self.__latest: dict[str, str] = {}
+        self.__has_pending = asyncio.Event()
+        self.__worker: Optional[asyncio.Task] = None
+
+        os.makedirs(self.spool_directory, exist_ok=True)
+        spool_files = []
+        for entry in os.scandir(self.spool_directory):
+            if entry.is_file() and entry.name.endswith(self.SPOOL_FILE_EXTENSION):
+                spool_files.append((entry.stat().st_mtime_ns, entry.path))
+        for (_, spool_file_path) in sorted(spool_files):
+            try:
+                (file_path, _, _) = self.__read_spool_file(spool_file_path)
+            except (OSError, ValueError) as e:
+                self.logger.error("Skipping broken spool file '%s': %s", spool_file_path, e)
+                continue
+            upload_id = os.path.basename(spool_file_path)[:-len(self.SPOOL_FILE_EXTENSION)]
+            self.__add(upload_id, PendingUpload(file_path, spool_file_path))
+        if self.__pending:
+            self.logger.info(
+                "%d uploads are going to be replayed from '%s'",
+                len(self.__pending), spool_directory
+            )
+
+    @property
+    def depth(self) -> int:
+        """Returns number of queued uploads waiting"""
+        return len(self.__pending)
+
+    def stats(self) -> dict[str, int]:
+        """Returns queue depth and numbers of uploads and retries"""
+        return {"depth": self.depth, "uploaded": self.uploaded, "retries": self.retries}
+
+    def start(self) -> None:
+        """
+        Starts uploading queued files (including the ones left from the previous run) in the running
+        loop
+        """
+        if self.__worker is None:
+            self.__worker = asyncio.get_running_loop().create_task(self.__drain())
+            if self.__pending:
+                self.__has_pending.set()
+
+    async def stop(self) -> None:
+        """Stops uploading, files which were not uploaded yet stay in the spool directory"""
+        if self.__worker is not None:
+            self.__worker.cancel()
+            try:
+                await self.__worker
+            except asyncio.CancelledError:
+                pass
+            self.__worker = None
+            self.logger.info("Upload queue stopped: %s", self.stats())
+
+    async def put(self, byte_image: bytes, file_path: str, check_existing: bool) -> None:
+        """Durably queues file for upload, returns once it's safely written to spool directory"""
+        upload_id = uuid.uuid4().hex
+        spool_file_path = os.path.join(
+            self.spool_directory, upload_id + self.SPOOL_FILE_EXTENSION
+        )
+        await self.__run(
+            self.__write_spool_file, spool_file_path, file_path, byte_image, check_existing
+        )
+        self.__add(upload_id, PendingUpload(file_path, spool_file_path))
+        self.__has_pending.set()
+
+    def get(self, file_path: str) -> Optional[bytes]:
+        """Returns bytes of the latest queued version of the file if it's still waiting"""
+        upload_id = self.__latest.get(file_path)
+        if upload_id is None:
+            return None
+        try:
+            return self.__read_spool_file(self.__pending[upload_id].spool_file_path)[1]
+        except OSError:
+            # was uploaded and removed in the meantime
+            return None
+
+    def discard(self, file_path: str) -> None:
+        """Cancels all uploads of the file that are still waiting"""
+        if self.__latest.pop(file_path, None) is None:
+            return
+        for (upload_id, pending_upload) in list(self.__pending.items()):
+            if pending_upload.file_path == file_path:
+                del self.__pending[upload_id]
+                self.__remove_spool_file(pending_upload.spool_file_path)
+
+    async def __drain(self) -> None:
+        while True:
+            await self.__has_pending.wait()
+            if not self.__pending:
+                self.__has_pending.clear()
+                continue
+
+            now = time.monotonic()
+            ready = next(
+                (item for item in self.__pending.items() if item[1].not_before <= now), None
+            )
+            if ready is None:
+                # every file waits for its retry, a newly queued one is uploaded right away
+                self.__has_pending.clear()
+                delay = min(upload.not_before for upload in self.__pending.values()) - now
+                try:
+                    await asyncio.wait_for(self.__has_pending.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.__has_pending.set()
+                continue
+
+            (upload_id, pending_upload) = ready
+            try:
+                (_, byte_image, check_existing) = await self.__run(
+                    self.__read_spool_file, pending_upload.spool_file_path
+                )
+                await self.__upload(byte_image, pending_upload.file_path, check_existing)
+            except Exception as e:
+                self.retries += 1
+                self.__retry_later(upload_id, e)
+                continue
+
+            self.uploaded += 1
+            # the file could be discarded while it was uploaded, a newer queueing of it stays
+            self.__remove(upload_id)
+
+    def __add(self, upload_id: str, pending_upload: PendingUpload) -> None:
+        """Appends the upload to the queue, superseding earlier ones of the same file"""
+        self.__pending[upload_id] = pending_upload
+        self.__latest[pending_upload.file_path] = upload_id
+
+    def __retry_later(self, upload_id: str, error: Exception) -> None:
+        """
+        Moves failed upload to the back of the queue with its next retry time, drops it if the file
+        was queued again
+        """
+        pending_upload = self.__pending.pop(upload_id, None)
+        if pending_upload is None:
+            return
+        if self.__latest.get(pending_upload.file_path) != upload_id:
+            self.__remove_spool_file(pending_upload.spool_file_path)
+            return
+        backoff = min(
+            self.INITIAL_BACKOFF_SECONDS * 2 ** pending_upload.failures,
+            self.MAXIMUM_BACKOFF_SECONDS
+        ) * random.uniform(0.5, 1.5)
+        self.logger.warning(
+            "Failed to upload '%s' (%d files are waiting), retrying in %.0f s: %s",
+            pending_upload.file_path, self.depth + 1, backoff, error
+        )
+        self.__pending[upload_id] = pending_upload._replace(
+            failures=pending_upload.failures + 1, not_before=time.monotonic() + backoff
+        )
+
+    def __remove(self, upload_id: str) -> None:
+        """Removes finished upload from the queue together with its spool file"""
+        pending_upload = self.__pending.pop(upload_id, None)
+        if pending_upload is None:
+            return
+        if self.__latest.get(pending_upload.file_path) == upload_id:
+            del self.__latest[pending_upload.file_path]
+        self.__remove_spool_file(pending_upload.spool_file_path)
+
+    def __write_spool_file(
+        self, spool_file_path: str, file_path: str, byte_image: bytes, check_existing: bool
+    ) -> None:
+        header = json.dumps(
+            {"file_path": file_path, "check_existing": check_existing}
+        ).encode('utf-8')
+        with open(f"{spool_file_path}.tmp", "wb") as spool_file:
+            spool_file.write(header + b"\n" + byte_image)
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+        os.replace(f"{spool_file_path}.tmp", spool_file_path)
+        # the rename itself is durable only once the directory is synced
+        directory = os.open(self.spool_directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def __read_spool_file(self, spool_file_path: str) -> tuple[str, bytes, bool]:
+        with open(spool_file_path, "rb") as spool_file:
+            content = spool_file.read()
+        (header, byte_image) = content.split(b"\n", 1)
+        header = json.loads(header)
+        return header["file_path"], byte_image, header["check_existing"]
+
+    def __remove_spool_file(self, spool_file_path: str) -> None:
+        try:
+            os.remove(spool_file_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,17 @@
+"""
+Tests are run from the repository root (python -m pytest), while modules of the bot import each
+other relative to the src directory and load resources relative to it, as the bot is run from there
+"""
+import os
+import sys
+
+import pytest
+
+SRC_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIRECTORY)
+
+
+@pytest.fixture(autouse=True)
+def run_from_src_directory(monkeypatch):
+    """Runs every test from the src directory"""
+    monkeypatch.chdir(SRC_DIRECTORY)
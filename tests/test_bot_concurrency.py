@@ -0,0 +1,134 @@
+"""
+/help stays responsive while a new achievement is being generated in the same chat
+"""
+import asyncio
+import os
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+from telegram import Update, User
+from telegram.ext import ExtBot, filters
+
+from api.telegram import TelegramAPI
+from bot.bot import Bot
+
+CHAT = {"id": -100, "type": "supergroup", "title": "chat"}
+GIVER = {"id": 1, "is_bot": False, "first_name": "giver", "username": "giver"}
+RECEIVER = {"id": 2, "is_bot": False, "first_name": "receiver", "username": "receiver"}
+GENERATION_SECONDS = 2.0
+# /help handled right away, far below the generation in flight
+MAXIMUM_HELP_SECONDS = 0.5
+
+
+async def get_me(bot: ExtBot, *_, **__) -> User:
+    """Replaces the request made by the bot on initialization"""
+    # pylint: disable=protected-access
+    bot._bot_user = User(0, "bot", True, username="achievements_bot")
+    return bot._bot_user
+
+
+def new_update(update_id: int, text: str, bot: ExtBot, reply: bool = False) -> Update:
+    """Returns update with the message of the giver in the chat"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": CHAT,
+        "from": GIVER,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        ]
+    if reply:
+        message["reply_to_message"] = {
+            "message_id": update_id - 1,
+            "date": int(time.time()),
+            "chat": CHAT,
+            "from": RECEIVER,
+            "text": "done",
+        }
+    return Update.de_json({"update_id": update_id, "message": message}, bot)
+
+
+def new_bot(generation_started: asyncio.Event, generation_done: asyncio.Event) -> Bot:
+    """Returns bot whose achievement generation lasts until generation_done is set"""
+    database = MagicMock()
+    database.is_banned.return_value = False
+    database.is_stickerset_owner_defined_for_chat.return_value = True
+
+    telegram = TelegramAPI()
+    telegram.reply_text = AsyncMock()
+    telegram.send_sticker = AsyncMock()
+
+    language_filter = MagicMock()
+    language_filter.construct_message_filter.return_value = filters.Regex("achievement")
+    language_filter.detect_prompt.return_value = "prompt"
+    language_filter.check_for_inappropriate_language.return_value = False
+    language_filter.check_for_message_format.return_value = False
+
+    warnings_processor = MagicMock()
+    warnings_processor.add_give_achievement_warning = AsyncMock(return_value=False)
+
+    async def draw_achievement_stickers(*_):
+        generation_started.set()
+        await generation_done.wait()
+        return (("a", b""), ("b", b""), ("c", b""))
+
+    sticker_artist = MagicMock()
+    sticker_artist.draw_achievement_stickers = draw_achievement_stickers
+
+    sticker_manager = MagicMock()
+    sticker_manager.find_existing_sticker = AsyncMock(return_value=(None, None, MagicMock()))
+    sticker_manager.add_chat_stickers = AsyncMock(return_value="chat sticker")
+    sticker_manager.add_user_stickers = AsyncMock(return_value="user sticker")
+
+    bot = Bot(
+        database,
+        MagicMock(),
+        telegram,
+        language_filter,
+        warnings_processor,
+        sticker_artist,
+        sticker_manager
+    )
+    bot.add_handlers()
+    return bot
+
+
+def test_help_is_answered_while_achievement_is_generated(monkeypatch):
+    """/help sent during a generation is answered without waiting for it"""
+    monkeypatch.setitem(os.environ, "TELEGRAM_BOT_TOKEN", "1:token")
+    monkeypatch.setitem(os.environ, "TELEGRAM_BOT_NAME", "achievements_bot")
+    monkeypatch.setattr(ExtBot, "get_me", get_me)
+
+    async def run() -> tuple[float, bool]:
+        generation_started = asyncio.Event()
+        generation_done = asyncio.Event()
+        bot = new_bot(generation_started, generation_done)
+        application = bot.application
+        async with application:
+            await application.start()
+            await application.update_queue.put(
+                new_update(2, "drop an achievement for tests", application.bot, reply=True)
+            )
+            await asyncio.wait_for(generation_started.wait(), GENERATION_SECONDS)
+
+            start = time.perf_counter()
+            await application.update_queue.put(new_update(3, "/help", application.bot))
+            while not bot.telegram.reply_text.await_count:
+                if time.perf_counter() - start > GENERATION_SECONDS:
+                    break
+                await asyncio.sleep(0.01)
+            help_seconds = time.perf_counter() - start
+
+            generation_done.set()
+            await asyncio.sleep(0.1)
+            achievement_given = bot.sticker_manager.add_user_stickers.await_count == 1
+            await application.stop()
+        return help_seconds, achievement_given
+
+    (help_seconds, achievement_given) = asyncio.run(run())
+    assert help_seconds < MAXIMUM_HELP_SECONDS
+    assert achievement_given
+
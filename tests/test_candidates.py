@@ -0,0 +1,100 @@
+"""
+Choice of the best candidate image for a new achievement and re-roll of the other ones
+"""
+import asyncio
+import io
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+from PIL import Image, ImageDraw
+
+from api.deepai import DeepAIAPI
+from sticker.artist import StickerArtist
+from sticker.util import achievement_score
+
+
+def image_on_white(*radii: int, size: int = 512) -> Image.Image:
+    """Returns RGB image of red disks with the radii in a row on white background"""
+    image = Image.new("RGB", (size, size), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    x = 0
+    for radius in radii:
+        draw.ellipse((x + 8, 8, x + 8 + 2 * radius, 8 + 2 * radius), fill=(200, 30, 30))
+        x += 2 * radius + 16
+    return image
+
+
+def transparent(image: Image.Image) -> Image.Image:
+    """Returns RGBA image where white pixels are transparent"""
+    image = image.convert("RGBA")
+    pixels = [
+        (0, 0, 0, 0) if pixel[:3] == (255, 255, 255) else pixel for pixel in image.getdata()
+    ]
+    image.putdata(pixels)
+    return image
+
+
+def test_score_prefers_larger_and_cleaner_subject():
+    """Larger subject scores higher, negligible noise lowers the score, unsuitable scores 0"""
+    large = achievement_score(transparent(image_on_white(200)))
+    small = achievement_score(transparent(image_on_white(100)))
+    with_noise = achievement_score(transparent(image_on_white(200, 10)))
+    assert large > with_noise > small > 0
+    assert achievement_score(transparent(image_on_white(100, 100))) == 0
+    assert achievement_score(image_on_white(200)) == 0
+
+
+def test_best_candidate_is_chosen_and_others_are_rerolled(monkeypatch):
+    """Candidates are ranked by score, the suitable runners-up are served by re-roll best first"""
+    # the model removes the same background as the flood fill
+    monkeypatch.setattr("sticker.artist.remove", lambda image, session: transparent(image))
+    candidates = [
+        image_on_white(60), image_on_white(200), image_on_white(100, 100), image_on_white(120)
+    ]
+    sticker_generator = MagicMock()
+    sticker_generator.translate = AsyncMock(return_value="prompt")
+    sticker_generator.generate_image_candidates_from_translation = AsyncMock(
+        return_value=candidates
+    )
+    sticker_file_manager = MagicMock()
+    sticker_file_manager.save = AsyncMock(side_effect=lambda image: image)
+    artist = StickerArtist(sticker_file_manager, sticker_generator)
+    artist.rembg_session = MagicMock()
+
+    async def run() -> list[Image.Image]:
+        images = [await artist.draw_sticker_from_prompt("prompt")]
+        while (image := await artist.draw_rerolled_sticker_from_prompt("prompt")) is not None:
+            images.append(image)
+        return images
+
+    images = asyncio.run(run())
+
+    opaque_areas = [
+        sum(1 for alpha in image.getchannel("A").getdata() if alpha) for image in images
+    ]
+    # the unsuitable candidate with two equal disks is never served
+    assert len(images) == 3
+    assert opaque_areas == sorted(opaque_areas, reverse=True)
+
+
+def test_grid_candidates_are_scaled_to_sticker_size(monkeypatch):
+    """Every candidate cropped from the grid has the size of a sticker"""
+    monkeypatch.setitem(os.environ, "DEEPAI_API_TOKEN", "token")
+    grid = Image.new("RGB", (512, 512), (255, 255, 255))
+    buffer = io.BytesIO()
+    grid.save(buffer, format="PNG")
+
+    http_client = MagicMock()
+    http_client.post = AsyncMock(return_value=httpx.Response(
+        200,
+        json={"output_url": "https://images/grid.png"},
+        request=httpx.Request("POST", DeepAIAPI.DEEP_AI_URL)
+    ))
+    http_client.get = AsyncMock(return_value=httpx.Response(
+        200, content=buffer.getvalue(), request=httpx.Request("GET", "https://images/grid.png")
+    ))
+
+    images = asyncio.run(DeepAIAPI(http_client).generate_images("prompt", 2))
+    assert len(images) == 4
+    assert all(image.size == (StickerArtist.WIDTH, StickerArtist.HEIGHT) for image in images)
@@ -0,0 +1,35 @@
+"""
+Alpha-mask cluster labeling against the original depth-first search, whose reference implementation
+is kept with the benchmark
+"""
+import pytest
+
+from benchmark.cluster_labeling import compare, golden_masks, random_masks
+from sticker.util import decide_on_downsampled_mask
+
+GOLDEN_MASKS = golden_masks()
+RANDOM_MASKS = random_masks(40, seed=0)
+
+
+@pytest.mark.parametrize("name", list(GOLDEN_MASKS))
+def test_golden_mask_matches_reference(name: str):
+    """Cluster sizes and decisions (with and without the fast path) match the reference"""
+    (mismatches, _, _, _) = compare(name, GOLDEN_MASKS[name])
+    assert not mismatches, mismatches
+
+
+@pytest.mark.parametrize("name", list(RANDOM_MASKS))
+def test_random_mask_matches_reference(name: str):
+    """Cluster sizes and decisions on seeded random masks match the reference"""
+    (mismatches, _, _, _) = compare(name, RANDOM_MASKS[name])
+    assert not mismatches, mismatches
+
+
+def test_fast_path_decides_block_aligned_masks():
+    """Masks upscaled from the fast path grid are decided on the downsampled mask"""
+    decided = [
+        name for (name, mask) in RANDOM_MASKS.items()
+        if decide_on_downsampled_mask(mask) is not None
+    ]
+    assert decided
+    assert decide_on_downsampled_mask(GOLDEN_MASKS["block aligned blocks"]) is not None
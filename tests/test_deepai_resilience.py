@@ -0,0 +1,168 @@
+"""
+Resilience of DeepAIAPI against a local fake Deep AI server simulating slow and failing responses
+"""
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import os
+import threading
+import time
+from typing import Iterator
+
+from PIL import Image
+import pytest
+
+from api.deepai import DeepAIAPI
+from api.http_client import HttpClient
+from common.exceptions import DeepAIAPIError
+
+
+class FakeDeepAIServer(ThreadingHTTPServer):
+    """
+    Server that answers requests according to the queued behaviors ('ok', 'error', 'slow',
+    'slow-download')
+    """
+    SLOW_SECONDS = 1.0
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeDeepAIHandler)
+        self.behaviors: list[str] = []
+        self.default_behavior = "ok"
+        self.generate_requests = 0
+        buf = io.BytesIO()
+        Image.new("RGB", (512, 512), (255, 255, 255)).save(buf, format='PNG')
+        self.image = buf.getvalue()
+
+    @property
+    def url(self) -> str:
+        """Returns base url of the server"""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_behavior(self) -> str:
+        """Returns behavior for the next generate request"""
+        return self.behaviors.pop(0) if self.behaviors else self.default_behavior
+
+
+class FakeDeepAIHandler(BaseHTTPRequestHandler):
+    """Handles generate (POST) and download (GET) requests of the fake server"""
+    server: FakeDeepAIServer
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """Answers generate request"""
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.generate_requests += 1
+        behavior = self.server.next_behavior()
+        if behavior == "error":
+            self.__respond(503, b"unavailable")
+            return
+        if behavior == "slow":
+            time.sleep(self.server.SLOW_SECONDS)
+        image_path = "/slow-image.png" if behavior == "slow-download" else "/image.png"
+        body = json.dumps({"output_url": self.server.url + image_path}).encode('utf-8')
+        self.__respond(200, body)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Answers download request"""
+        if self.path == "/slow-image.png":
+            time.sleep(self.server.SLOW_SECONDS)
+        self.__respond(200, self.server.image)
+
+    def log_message(self, *_) -> None:
+        pass
+
+    def __respond(self, status: int, body: bytes) -> None:
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client has given up on the slow response (timed out or hedged)
+            pass
+
+
+@pytest.fixture
+def server() -> Iterator[FakeDeepAIServer]:
+    """Runs fake Deep AI server in the background"""
+    fake_server = FakeDeepAIServer()
+    threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+    yield fake_server
+    fake_server.shutdown()
+    fake_server.server_close()
+
+
+def new_api(server: FakeDeepAIServer, http_client: HttpClient) -> DeepAIAPI:
+    """Returns client of the fake server with short delays"""
+    api = DeepAIAPI(http_client)
+    api.DEEP_AI_URL = server.url + "/api/text2img"
+    api.retry_base_delay = 0.01
+    api.download_timeout = FakeDeepAIServer.SLOW_SECONDS / 4
+    return api
+
+
+def run_with_api(monkeypatch, server: FakeDeepAIServer, scenario) -> None:
+    """Runs the scenario with the client of the fake server"""
+    monkeypatch.setitem(os.environ, "DEEPAI_API_TOKEN", "fake")
+
+    async def run() -> None:
+        http_client = HttpClient()
+        try:
+            await scenario(new_api(server, http_client))
+        finally:
+            await http_client.close()
+
+    asyncio.run(run())
+
+
+def test_transient_failures_are_retried(monkeypatch, server):
+    """Generate request answered with 5xx is retried until it succeeds"""
+    async def scenario(api: DeepAIAPI) -> None:
+        server.behaviors = ["error", "error"]
+        await api.generate_image("retries")
+        assert api.retries == 2
+
+    run_with_api(monkeypatch, server, scenario)
+
+
+def test_slow_request_is_hedged(monkeypatch, server):
+    """Generate request slower than usual is hedged once latencies are known"""
+    async def scenario(api: DeepAIAPI) -> None:
+        api.hedging = True
+        for _ in range(api.HEDGING_MINIMUM_SAMPLES):
+            await api.generate_image("warm up")
+        server.behaviors = ["slow"]
+        start = time.perf_counter()
+        await api.generate_image("hedging")
+        assert api.hedged_requests == 1
+        assert time.perf_counter() - start < FakeDeepAIServer.SLOW_SECONDS
+
+    run_with_api(monkeypatch, server, scenario)
+
+
+def test_slow_download_fails_in_download_phase(monkeypatch, server):
+    """Download slower than its timeout fails with download timeout after retries"""
+    async def scenario(api: DeepAIAPI) -> None:
+        server.behaviors = ["slow-download"]
+        with pytest.raises(DeepAIAPIError) as error:
+            await api.generate_image("slow download")
+        assert error.value.component_error_type == "download-timeout"
+
+    run_with_api(monkeypatch, server, scenario)
+
+
+def test_calls_fail_fast_once_circuit_is_open(monkeypatch, server):
+    """Once the server failed enough times, calls fail without sending requests"""
+    async def scenario(api: DeepAIAPI) -> None:
+        server.default_behavior = "error"
+        for _ in range(api.circuit_breaker.failure_threshold):
+            with pytest.raises(DeepAIAPIError):
+                await api.generate_image("server is down")
+        generate_requests = server.generate_requests
+        with pytest.raises(DeepAIAPIError) as error:
+            await api.generate_image("circuit is open")
+        assert error.value.component_error_type == "circuit-open"
+        assert server.generate_requests == generate_requests
+        assert api.circuit_breaker.state == "open"
+
+    run_with_api(monkeypatch, server, scenario)
@@ -0,0 +1,20 @@
+"""
+Layers of chat description stickers persisted in the storage
+"""
+from unittest.mock import MagicMock
+
+from common.exceptions import ImageS3StorageError
+from sticker.artist import StickerArtist
+
+
+def test_sticker_is_drawn_when_layer_storage_fails():
+    """Storage errors on loading or persisting the layer don't fail the sticker"""
+    layer_storage = MagicMock()
+    layer_storage.get.side_effect = ImageS3StorageError("get failed", "other", "unavailable")
+    layer_storage.put.side_effect = ImageS3StorageError("put failed", "other", "unavailable")
+    artist = StickerArtist(MagicMock(), MagicMock(), layer_storage=layer_storage)
+
+    image = artist.render_chat_description_sticker("for tests", 1)
+    assert image.size == (StickerArtist.WIDTH, StickerArtist.HEIGHT)
+    layer_storage.get.assert_called_once()
+    layer_storage.put.assert_called_once()
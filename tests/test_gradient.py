@@ -0,0 +1,18 @@
+"""
+Vectorized gradient stickers against the original per-pixel loop kept with the benchmark
+"""
+from PIL import ImageChops
+import pytest
+
+from benchmark.gradient import COLOR_PAIRS, render_gradient_with_loop
+from sticker.artist import StickerArtist
+
+
+@pytest.mark.parametrize("inner_color, outer_color", COLOR_PAIRS)
+def test_gradient_is_identical_to_loop(inner_color, outer_color):
+    """Vectorized rendering is pixel-identical to the original loop"""
+    artist = StickerArtist(None, None)
+    # pylint: disable=protected-access
+    actual = artist._StickerArtist__generate_sticker_of_gradient(inner_color, outer_color)
+    expected = render_gradient_with_loop(inner_color, outer_color)
+    assert ImageChops.difference(expected, actual).getbbox() is None
@@ -0,0 +1,31 @@
+"""
+Local language detection, which decides whether an achievement text is sent to Google Translate
+"""
+import pytest
+
+from benchmark.language_detection import ACHIEVEMENTS, load_key_phrases
+from message.language import detect_language
+
+
+@pytest.fixture
+def labeled_texts() -> list[tuple[str, str]]:
+    """Returns key phrases and sample achievements labeled by their language"""
+    return load_key_phrases() + list(ACHIEVEMENTS)
+
+
+def test_non_english_texts_are_not_detected_as_english(labeled_texts):
+    """Text wrongly detected as english would go to Deep AI untranslated"""
+    false_english = [
+        text for (language, text) in labeled_texts
+        if language != "en" and detect_language(text) == "en"
+    ]
+    assert not false_english, false_english
+
+
+def test_english_texts_are_detected(labeled_texts):
+    """English texts skip Google Translate"""
+    undetected = [
+        text for (language, text) in labeled_texts
+        if language == "en" and detect_language(text) != "en"
+    ]
+    assert not undetected, undetected
@@ -0,0 +1,108 @@
+"""
+Counters of the components reported to admins
+"""
+import asyncio
+import json
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+from api.deepai import DeepAIAPI
+from bot.access import LIST_OF_ADMINS
+from bot.bot import Bot
+
+
+def reported_stats(monkeypatch, **dependencies) -> dict[str, dict]:
+    """Returns stats replied by the bot with the dependencies to /stats of the admin"""
+    monkeypatch.setitem(os.environ, "TELEGRAM_BOT_TOKEN", "1:token")
+    monkeypatch.setitem(os.environ, "TELEGRAM_BOT_NAME", "achievements_bot")
+    telegram = MagicMock()
+    telegram.get_from_user_info.side_effect = lambda update, context: (
+        LIST_OF_ADMINS[0], "admin", context
+    )
+    telegram.reply_text = AsyncMock()
+    sticker_file_manager = MagicMock()
+    sticker_file_manager.cache_stats.return_value = {}
+    sticker_file_manager.upload_queue = None
+    sticker_artist = MagicMock()
+    sticker_artist.background_removal_stats.return_value = {}
+    sticker_artist.sticker_generator.translations_skipped = 0
+    sticker_artist.sticker_generator.deep_api.stats.return_value = {}
+    arguments = {
+        "database": MagicMock(),
+        "sticker_file_manager": sticker_file_manager,
+        "telegram": telegram,
+        "language_filter": MagicMock(),
+        "warnings_processor": MagicMock(),
+        "sticker_artist": sticker_artist,
+        "sticker_manager": MagicMock(),
+    }
+    arguments.update(dependencies)
+    bot = Bot(**arguments)
+    asyncio.run(bot.stats(MagicMock(), MagicMock()))
+    return json.loads(telegram.reply_text.await_args.args[0])
+
+
+def test_file_cache_stats_are_reported(monkeypatch):
+    """Hits and misses of every file cache tier are reported"""
+    sticker_file_manager = MagicMock()
+    sticker_file_manager.cache_stats.return_value = {
+        "memory": {"hits": 3, "misses": 1, "entries": 1, "bytes": 10}
+    }
+    sticker_file_manager.upload_queue = None
+    stats = reported_stats(monkeypatch, sticker_file_manager=sticker_file_manager)
+    assert stats["sticker files"]["memory"] == {"hits": 3, "misses": 1, "entries": 1, "bytes": 10}
+
+
+def test_background_removal_stats_are_reported(monkeypatch):
+    """Timings of background removal and the paths that removed backgrounds are reported"""
+    sticker_artist = MagicMock()
+    sticker_artist.background_removal_stats.return_value = {
+        "count": 0, "paths": {"white-background": 2}
+    }
+    sticker_artist.sticker_generator.translations_skipped = 0
+    sticker_artist.sticker_generator.deep_api.stats.return_value = {}
+    stats = reported_stats(monkeypatch, sticker_artist=sticker_artist)
+    assert stats["background removal"] == {"count": 0, "paths": {"white-background": 2}}
+
+
+def test_upload_queue_stats_are_reported(monkeypatch):
+    """Depth of the write-behind upload queue and its uploads and retries are reported"""
+    sticker_file_manager = MagicMock()
+    sticker_file_manager.cache_stats.return_value = {}
+    sticker_file_manager.upload_queue.stats.return_value = {
+        "depth": 2, "uploaded": 5, "retries": 1
+    }
+    stats = reported_stats(monkeypatch, sticker_file_manager=sticker_file_manager)
+    assert stats["uploads"] == {"depth": 2, "uploaded": 5, "retries": 1}
+
+
+def test_skipped_translations_are_reported(monkeypatch):
+    """Achievement texts that were not sent to Google Translate are reported"""
+    sticker_artist = MagicMock()
+    sticker_artist.background_removal_stats.return_value = {}
+    sticker_artist.sticker_generator.translations_skipped = 4
+    sticker_artist.sticker_generator.deep_api.stats.return_value = {}
+    stats = reported_stats(monkeypatch, sticker_artist=sticker_artist)
+    assert stats["translations"] == {"skipped": 4}
+
+
+def test_coalesced_generations_are_reported(monkeypatch):
+    """Awards that reused the achievement generated concurrently in the chat are reported"""
+    stats = reported_stats(monkeypatch)
+    assert stats["achievement generations"] == {"coalesced": 0}
+
+
+def test_deep_ai_resilience_stats_are_reported(monkeypatch):
+    """Retried and hedged requests to Deep AI and the state of its circuit breaker are reported"""
+    monkeypatch.setitem(os.environ, "DEEPAI_API_TOKEN", "token")
+    deep_api = DeepAIAPI(MagicMock())
+    deep_api.retries = 2
+    deep_api.hedged_requests = 1
+    sticker_artist = MagicMock()
+    sticker_artist.background_removal_stats.return_value = {}
+    sticker_artist.sticker_generator.translations_skipped = 0
+    sticker_artist.sticker_generator.deep_api = deep_api
+    stats = reported_stats(monkeypatch, sticker_artist=sticker_artist)
+    assert stats["deep ai"] == {
+        "retries": 2, "hedged requests": 1, "circuit breaker": "closed"
+    }
@@ -0,0 +1,26 @@
+"""
+Hits of translations reused from memory are counted in the database
+"""
+import asyncio
+import os
+from unittest.mock import MagicMock
+
+from api.translate import GoogleTranslateAPI
+
+
+def test_hits_are_flushed_on_shutdown(monkeypatch):
+    """Hits below the flush threshold are saved by flush_hits"""
+    monkeypatch.setitem(os.environ, "GOOGLE_TRANSLATE_API", "key")
+    database = MagicMock()
+    database.get_translation.return_value = ("hello", "ru")
+    google_translate_api = GoogleTranslateAPI(MagicMock(), database)
+
+    async def run() -> None:
+        for _ in range(3):
+            assert await google_translate_api.translate("Привет") == "hello"
+        await google_translate_api.flush_hits()
+
+    asyncio.run(run())
+    # the first lookup is counted by the database itself, the reuses from memory are flushed
+    database.get_translation.assert_called_once_with("привет")
+    database.add_translation_hits.assert_called_once_with({"привет": 2})
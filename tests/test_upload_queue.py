@@ -0,0 +1,41 @@
+"""
+Write-behind uploads of sticker files
+"""
+import asyncio
+
+from storage.upload_queue import UploadQueue
+
+
+async def run(function, *args):
+    """Runs blocking function in place"""
+    return function(*args)
+
+
+def test_failing_upload_does_not_stall_others(tmp_path, monkeypatch):
+    """Files queued behind a failing one are uploaded while it waits for its retry"""
+    monkeypatch.setattr(UploadQueue, "INITIAL_BACKOFF_SECONDS", 60)
+    uploaded = []
+
+    async def upload(byte_image: bytes, file_path: str, _: bool) -> None:
+        if file_path == "broken":
+            raise OSError("storage is unavailable")
+        uploaded.append((file_path, byte_image))
+
+    async def main() -> UploadQueue:
+        upload_queue = UploadQueue(str(tmp_path), upload, run)
+        await upload_queue.put(b"0", "broken", False)
+        upload_queue.start()
+        for i in range(1, 4):
+            await upload_queue.put(str(i).encode(), str(i), False)
+        for _ in range(100):
+            if upload_queue.depth == 1:
+                break
+            await asyncio.sleep(0.01)
+        await upload_queue.stop()
+        return upload_queue
+
+    upload_queue = asyncio.run(main())
+    assert uploaded == [("1", b"1"), ("2", b"2"), ("3", b"3")]
+    assert upload_queue.stats() == {"depth": 1, "uploaded": 3, "retries": 1}
+    # the failed upload stays spooled for the next run
+    assert UploadQueue(str(tmp_path), upload, run).get("broken") == b"0"